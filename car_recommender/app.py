@@ -1,36 +1,107 @@
 from flask import Flask, request, render_template, jsonify, session
 import pandas as pd
 import numpy as np
-import faiss, re, os, json
-from sentence_transformers import SentenceTransformer
+import faiss, re, os, json, gc, time
 from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import Counter
+from functools import wraps
 import random
+from utils.explain_cache import ExplanationCache, catalogue_fingerprint, spec_hash
+from utils.embedding_cache import QueryEmbeddingCache
+from utils.encoder_service import BatchingEncoder
+from utils.encoders import MODEL_NAME, load_encoder
+from utils.retrieval import (CatalogueFilters, EmbeddingStore, RowIds, StructuredRetriever,
+                             configure_index, filtered_search)
+from utils.indexer import EMBEDDINGS_FILE, INDEX_FILE
+from utils.startup import Startup
+from utils.catalogue_store import SCHEMA_FILE, has_catalogue, read_catalogue, resolve_catalogue
+from utils.text_match import KeywordMatcher
+from utils.catalogue_vocab import CatalogueVocabulary
+from utils.session_store import Prefs, ServerSessionInterface, make_session_backend
 
 app = Flask(__name__)
 app.secret_key = "change_this_to_a_secure_random_string"
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# คำอธิบายรายคันยิงพร้อมกัน: timeout ต่อ call และเส้นตายรวมของทั้งชุด (วินาที)
+EXPLAIN_MAX_WORKERS = int(os.getenv("EXPLAIN_MAX_WORKERS", "8"))
+EXPLAIN_CALL_TIMEOUT = float(os.getenv("EXPLAIN_CALL_TIMEOUT", "12"))
+EXPLAIN_DEADLINE = float(os.getenv("EXPLAIN_DEADLINE", "15"))
+# "per_row" = หนึ่ง call ต่อคัน, "batch" = call เดียวอธิบายทุกคัน
+RAG_EXPLAIN_MODE = os.getenv("RAG_EXPLAIN_MODE", "per_row").strip().lower()
+EXPLAIN_BATCH_TOKENS_PER_ROW = int(os.getenv("EXPLAIN_BATCH_TOKENS_PER_ROW", "300"))
+# call ของแต่ละ request จบเองภายใน EXPLAIN_DEADLINE (ไม่ retry, timeout = เวลาที่เหลือ) worker จึงไม่ถูก call
+# ที่ถูกทิ้งค้างข้าม request; pool ต้องรับได้อย่างน้อยหนึ่งชุดผลลัพธ์ (5 คัน) พร้อมกัน
+_explain_pool = ThreadPoolExecutor(max_workers=max(EXPLAIN_MAX_WORKERS, 5), thread_name_prefix="explain")
+
+
+
+# store ไบนารีจาก process_data (ดู utils/catalogue_store.py); CSV ใช้เมื่อยังไม่มี store เท่านั้น
+CATALOGUE_STORE = "embeddings/catalogue"
+# resolve เวอร์ชันของ store ครั้งเดียว: catalogue / index / embeddings ที่โหลดขนานกันมาจากชุดเดียวกันเสมอ
+# แม้ process_data จะสลับเวอร์ชันระหว่างบูต
+CATALOGUE_DIR = resolve_catalogue(CATALOGUE_STORE)
+CATALOGUE_PATH = "embeddings/clean_data.csv"
+# index/embeddings ที่ utils/indexer.py เขียนไว้ใน store ใช้ก่อน ไฟล์เดี่ยวด้านล่างเป็นของ build แบบเดิม
+INDEX_PATH = "embeddings/faiss_index.idx"
+EMBEDDINGS_PATH = "embeddings/embeddings.npy"
+# ค่าเวลา search ของ index แบบประมาณ (HNSW32 / IVF-*) จาก process_data; Flat ไม่ใช้
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "64"))
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "16"))
+# torch | onnx | onnx-int8 (ดู utils/encoders.py และ benchmarks/encoder_parity.py)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+# APP_PRELOAD=1: โหลดทุกอย่างแบบ synchronous ตอน import (ใน gunicorn master ก่อน fork)
+# ให้ worker แชร์หน่วยความจำแบบ copy-on-write; ดู gunicorn.conf.py
+APP_PRELOAD = os.getenv("APP_PRELOAD", "").strip().lower() in ("1", "true", "yes")
+
+# ทรัพยากรหนักถูกเติมโดย startup (ดูท้ายไฟล์ส่วน "startup") ก่อนหน้านั้นเป็น None
+df = None
+model = None
+index = None
+filters = None
+embeddings = None
+retriever = None
+row_ids = None
+catalogue_vocab = None
+
+# แคช embedding ของ query ใช้ร่วมทุกจุดที่ encode; ตั้ง QUERY_EMB_CACHE_PATH เพื่อเก็บข้าม restart
+query_cache = QueryEmbeddingCache(
+    maxsize=int(os.getenv("QUERY_EMB_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("QUERY_EMB_CACHE_TTL", str(24 * 3600))),
+    path=os.getenv("QUERY_EMB_CACHE_PATH") or None,
+    model_id=f"{MODEL_NAME}:{ENCODER_BACKEND}",
+)
 
+# รวม query จากทุก request thread เป็น batch เดียวก่อนเข้า encoder
+encoder_service = BatchingEncoder(
+    lambda texts: model.encode(texts, batch_size=len(texts)),
+    max_batch=int(os.getenv("ENCODER_BATCH_MAX", "32")),
+    max_wait_ms=float(os.getenv("ENCODER_BATCH_WAIT_MS", "5")),
+    max_queue=int(os.getenv("ENCODER_QUEUE_MAX", "1024")),
+)
 
-df = pd.read_csv("embeddings/clean_data.csv")
-model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-index = faiss.read_index("embeddings/faiss_index.idx")
-
-
-if "row_id" not in df.columns:
-    df["row_id"] = df.index
-
-DEFAULT_PREFS = {
-    "answers": {},
-    "asked": [],
-    "pending_key": "price",
-    "last_question": None,
-    "_skip": [],
-    "extra_done": False,
-    "stage": None,
-    "last_results": []
-}
+def _encode_normalized(texts):
+    emb = encoder_service.encode(texts).astype("float32")
+    faiss.normalize_L2(emb)
+    return emb
+
+def encode_query(text) -> np.ndarray:
+    """embedding ของ query รูป (1, d) ที่ normalize แล้ว (อ่านอย่างเดียว) ผ่าน query_cache"""
+    return query_cache.get_or_encode(text, _encode_normalized)[None, :]
+
+# แคชคำอธิบาย: ตั้ง EXPLAIN_CACHE_PATH="" เพื่อใช้แค่ชั้นหน่วยความจำ
+explain_cache = ExplanationCache(
+    path=os.getenv("EXPLAIN_CACHE_PATH", "cache/explanations.sqlite") or None,
+    fingerprint=catalogue_fingerprint(
+        os.path.join(CATALOGUE_DIR, SCHEMA_FILE) if has_catalogue(CATALOGUE_DIR) else CATALOGUE_PATH
+    ),
+    ttl=float(os.getenv("EXPLAIN_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("EXPLAIN_CACHE_MAX", "50000")),
+    hot_size=int(os.getenv("EXPLAIN_CACHE_HOT", "2048")),
+    busy_timeout=float(os.getenv("EXPLAIN_CACHE_BUSY_TIMEOUT", "1")),
+)
 
 def reset_state_all():
     """รีเซ็ตสถานะทั้งหมด (prefs + session) ใช้ได้ตอนมี request context"""
@@ -38,18 +109,13 @@ def reset_state_all():
         session.clear()
     except Exception:
         pass
-    save_prefs(DEFAULT_PREFS.copy())
-    return DEFAULT_PREFS.copy()
-
-boot_done = False
-@app.before_request
-def boot_reset_once():
-    global boot_done
-    if not boot_done:
-        reset_state_all()
-        boot_done = True
+    prefs = Prefs(pending_key="price")
+    save_prefs(prefs)
+    return prefs
 
 def json_safe(obj):
+    if obj is pd.NA:
+        return None
     if isinstance(obj, np.generic):
         return obj.item()
     if isinstance(obj, (list, tuple)):
@@ -58,14 +124,36 @@ def json_safe(obj):
         return {k: json_safe(v) for k, v in obj.items()}
     return obj
 
-def get_prefs():
+def json_default(obj):
+    # json.dumps เรียกเฉพาะค่าที่ JSON ไม่รู้จัก (numpy scalar / pd.NA) ไม่ต้องไล่ทั้งก้อนแบบ json_safe
+    value = json_safe(obj)
+    if value is obj:
+        raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+    return value
+
+# session ฝั่งเซิร์ฟเวอร์: cookie มีแค่ session id (SESSION_BACKEND = memory / sqlite / redis)
+app.session_interface = ServerSessionInterface(
+    make_session_backend(
+        os.getenv("SESSION_BACKEND", "sqlite"),
+        path=os.getenv("SESSION_DB_PATH", "cache/sessions.sqlite"),
+        url=os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0"),
+        max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+    ),
+    ttl=float(os.getenv("SESSION_TTL", str(7 * 24 * 3600))),
+    json_default=json_default,
+)
+
+def get_prefs() -> Prefs:
+    # session ใหม่ (หรือ schema ที่แปลงไม่ได้) ได้ Prefs ค่าเริ่มต้นตอนใช้ครั้งแรก ไม่ต้องมี hook รีเซ็ตตอนบูต
     prefs = session.get("prefs")
-    if not isinstance(prefs, dict):
-        prefs = {"answers": {}, "asked": [], "pending_key": None, "last_question": None}
+    if not isinstance(prefs, Prefs):
+        prefs = Prefs()
+        session["prefs"] = prefs
     return prefs
 
-def save_prefs(prefs):
-    session["prefs"] = json_safe(prefs)
+def save_prefs(prefs: Prefs):
+    # แก้ prefs ตัวเดิมแล้ว save ซ้ำได้ไม่เปลือง: backend เขียนจริงเฉพาะเมื่อผลเข้ารหัสต่างจากที่โหลดมา
+    session["prefs"] = prefs
 
 def safe_int(v):
     try:
@@ -129,7 +217,11 @@ def extract_price_range(query: str):
         s,
     )
     if m_between:
-        a = to_number(m_between.group(2))
+        # "7-9แสน": ฝั่งซ้ายไม่มีหน่วย ให้ใช้หน่วยเดียวกับฝั่งขวา
+        left = m_between.group(2)
+        if not m_between.group(4) and m_between.group(8):
+            left += m_between.group(8)
+        a = to_number(left)
         b = to_number(m_between.group(6))
         if a and b:
             return (min(a, b), max(a, b))
@@ -153,35 +245,95 @@ def extract_make_from_query(query):
     if not q:
         return None
 
-    found = {}
+    # ยี่ห้อ / series แรกตามลำดับใน catalogue ที่ปรากฏในข้อความ (รวมชื่อไทย) ดู utils/catalogue_vocab.py
+    return catalogue_vocab.extract(q) or None
 
-    
-    makes = df["make"].dropna().astype(str).str.lower().unique().tolist()
-    for mk in makes:
-        if mk in q:
-            found["make"] = mk
-            break  
-    if "series" in df.columns:
-        all_series = (
-            df["series"].dropna().astype(str).str.lower().unique().tolist()
-        )
-        for sr in all_series:
-            root = sr.split()[0]  
-            if sr in q or root in q:
-                found["series"] = root  
-                break
-    return found or None
-
-df["type"] = df.get("type").fillna("").astype(str)
-df["type_norm"] = df["type"].str.lower().str.strip()
-
-BODY_MAP = {
-    "pickup": "pickup", "truck": "pickup", "กระบะ": "pickup",
-    "sedan": "sedan", "saloon": "sedan", "เก๋ง": "sedan", "รถเก๋ง": "sedan",
-    "suv": "suv",
-    "mpv": "mpv", "van": "mpv",
-    "hatchback": "hatchback"
-}
+def score_rows(query_vec, row_ids):
+    return embeddings.score_rows(query_vec, row_ids)
+
+# ---------- startup ----------
+def _load_catalogue():
+    global df, catalogue_vocab
+    if has_catalogue(CATALOGUE_DIR):
+        d = read_catalogue(CATALOGUE_DIR)
+        source = os.path.join(CATALOGUE_DIR, SCHEMA_FILE)
+    else:
+        print(f"[startup] ไม่พบ {CATALOGUE_STORE} ใช้ {CATALOGUE_PATH} แทน (รัน utils/process_data.py เพื่อสร้าง store)")
+        d = pd.read_csv(CATALOGUE_PATH)
+        source = CATALOGUE_PATH
+    if "row_id" not in d.columns:
+        d["row_id"] = d.index
+    d["type"] = d.get("type").astype(object).fillna("").astype(str)
+    d["type_norm"] = d["type"].str.lower().str.strip()
+    df = d
+    # สร้างพร้อม catalogue ทุกครั้ง (catalogue เปลี่ยน = ดัชนีคำเปลี่ยนตาม)
+    catalogue_vocab = CatalogueVocabulary(d)
+    # คำอธิบายที่แคชไว้ผูกกับ catalogue ที่โหลดจริง (โหลดใหม่โดยไม่รีสตาร์ตก็ไม่ได้คำอธิบายเก่า)
+    explain_cache.set_fingerprint(catalogue_fingerprint(source))
+
+def _load_model():
+    global model
+    model = load_encoder(ENCODER_BACKEND)
+
+def _load_index():
+    global index
+    # memory-map ไฟล์ index: ทุก process ที่เปิดไฟล์เดียวกันใช้ page cache ชุดเดียวกัน
+    path = os.path.join(CATALOGUE_DIR, INDEX_FILE)
+    index = faiss.read_index(path if os.path.exists(path) else INDEX_PATH, faiss.IO_FLAG_MMAP)
+    configure_index(index, ef_search=INDEX_EF_SEARCH, nprobe=INDEX_NPROBE)
+
+def _build_search():
+    global filters, embeddings, retriever, row_ids
+    if index.ntotal != len(df):
+        raise RuntimeError(f"index มี {index.ntotal} เวกเตอร์ แต่ catalogue มี {len(df)} แถว (build ไม่ตรงกัน)")
+    # catalogue จาก utils/indexer.py มี faiss_id ต่อแถว; แบบเดิม id ใน index == ตำแหน่งแถว
+    row_ids = RowIds(df["faiss_id"].to_numpy()) if "faiss_id" in df.columns else None
+    filters = CatalogueFilters(df)
+    emb_path = os.path.join(CATALOGUE_DIR, EMBEDDINGS_FILE)
+    embeddings = EmbeddingStore.load(emb_path if os.path.exists(emb_path) else EMBEDDINGS_PATH,
+                                     index, row_ids)
+    retriever = StructuredRetriever(filters, embeddings)
+
+def _warm_encoder():
+    # เรียก encoder จริงหนึ่งครั้ง (ไม่ผ่าน query_cache) ให้ lazy init ของโมเดลเกิดก่อนรับ request แรก
+    _encode_normalized(["รถเก๋งประหยัดน้ำมัน ขับในเมือง"])
+
+# catalogue / model / index อ่านขนานกัน จากนั้นค่อยสร้างโครงค้นหาและอุ่น encoder
+startup = (
+    Startup()
+    .add("catalogue", _load_catalogue)
+    .add("model", _load_model)
+    .add("index", _load_index)
+    .then("search", _build_search)
+)
+if APP_PRELOAD:
+    # thread ไม่ข้าม fork จึงต้องโหลดให้เสร็จก่อน และไม่เรียก encoder ใน master
+    # (thread pool ของ torch/OpenMP ที่สร้างก่อน fork ทำให้ worker ค้างได้) worker อุ่นเองใน post_fork
+    if not startup.run():
+        raise RuntimeError(f"startup failed: {startup.error}")
+    # ย้ายอ็อบเจกต์ที่โหลดแล้วออกจากการไล่ของ GC เพื่อไม่ให้ GC ใน worker ไปแตะหน้าที่แชร์อยู่
+    gc.freeze()
+else:
+    startup.then("warmup", _warm_encoder)
+    startup.start()
+
+def post_fork_worker():
+    """เรียกจาก gunicorn post_fork: อุ่น encoder ใน worker (thread batcher เริ่มใหม่ใน process นี้เอง)"""
+    t0 = time.perf_counter()
+    _warm_encoder()
+    print(f"[startup] worker {os.getpid()} warmup เสร็จใน {time.perf_counter() - t0:.2f}s")
+
+def requires_ready(view):
+    """ตอบ 503 จนกว่า startup จะโหลดทรัพยากรครบ"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not startup.ready:
+            return jsonify({
+                "mode": "error",
+                "reply": "ระบบกำลังเริ่มต้น กรุณาลองใหม่อีกครั้งในอีกสักครู่ครับ",
+            }), 503
+        return view(*args, **kwargs)
+    return wrapper
 
 def fuel_to_thai(x):
     s = str(x).strip().lower()
@@ -228,7 +380,7 @@ TRANS_HINTS = {
 BODY_HINTS = {
     "suv": ["suv", "เอสยูวี"],
     "sedan": ["ซีดาน", "sedan","เก๋ง","รถเก๋ง"],
-    "hatchback": ["แฮทช์", "hatch"],
+    "hatchback": ["hatchback", "แฮทช์แบ็ก", "แฮทช์", "hatch"],
     "mpv": ["mpv", "ครอบครัว", "7ที่นั่ง", "7 ที่นั่ง", "อเนกประสงค์"],
     "pickup": ["กระบะ", "ปิคอัพ", "ปิกอัพ", "pickup","รถกระบะ"],
 }
@@ -239,24 +391,71 @@ FUEL_HINTS = {
     "ev": ["ไฟฟ้า", "ev", "bev"],
 }
 NO_WORDS = ("ไม่มี", "ไม่เน้น", "อะไรก็ได้", "เฉยๆ", "เฉย ๆ", "ยัง", "ไม่", "ข้าม")
+EFFICIENCY_WORDS = ["ประหยัด", "กินน้ำมัน", "อัตราสิ้นเปลือง", "กม/ลิตร", "km/l"]
+COMPARE_WORDS = ["เทียบ", "ต่างกัน", "vs", "เปรียบเทียบ"]
+# คำถามปลายเปิด ("...ดีไหม") ส่งให้ LLM ตอบแบบคุยทั่วไป
+OPEN_QUESTION_WORDS = ["ไหม", "ดีไหม", "เหมาะไหม", "คุ้มไหม", "หรือเปล่า", "ใช่ไหม"]
+# usage_text ที่มีคำเหล่านี้พูดถึงสเปก/เกียร์ ไม่ใช่ลักษณะการใช้งาน
+NOT_USAGE_WORDS = [
+    "แรงม้า", "แรงสุด", "เร็ว", "ความเร็ว", "0-100", "แรง",
+    "เกียร์", "ออโต้", "อัตโนมัติ", "ธรรมดา", "manual", "mt", "at", "cvt", "dct"
+]
+NEW_START_TRIGGERS = [
+    "เริ่มใหม่", "เริ่มต้นใหม่", "เริ่มต้นการค้นหาใหม่",
+    "เริ่มระบบใหม่", "อยากเริ่มใหม่", "อยากได้คำแนะนำใหม่",
+    "อยากให้แนะนำใหม่", "แนะนำใหม่", "หารถใหม่ให้หน่อย",
+    "อยากหารถใหม่", "ขอเริ่มใหม่", "ขอคำแนะนำใหม่"
+]
+RESET_ALL = ["เริ่มใหม่", "เริ่มต้นใหม่", "รีเซ็ต", "reset", "เริ่มระบบใหม่"]
+NEW_RECO  = ["ขอใหม่", "หาใหม่", "แนะนำอีกที", "ขอคำแนะนำใหม่", "สุ่มใหม่", "อีก 5 คัน", "แนะนำชุดใหม่","ขอคำแนะนำใหม่"]
+
+def text_hits(text):
+    """คำจากทุก vocabulary ที่พบในข้อความ (ตัวพิมพ์เล็ก) สแกนครั้งเดียวแล้วแคชตามข้อความ ดู utils/text_match.py"""
+    return TEXT_MATCHER.scan((text or "").lower())
 
 def _extract_usage(text):
-    return [k for k in USAGE_HINTS if k in (text or "").lower()]
+    return text_hits(text).keys("usage")
+
+def _first_word(text, vocab):
+    """key แรกของ vocab ที่พบ ไม่นับคำละตินที่อยู่กลางคำที่ยาวกว่า ("at" ใน "hatchback" ไม่ใช่เกียร์ AT)"""
+    t = (text or "").lower()
+    return next(iter(_bounded(text_hits(t), t, vocab)), None)
 
 
 def _extract_transmission(text):
-    s = (text or "").lower()
-    for k, kws in TRANS_HINTS.items():
-        if any(w in s for w in kws):
-            return k
-    return None
+    return _first_word(text, "trans")
 
 def _extract_fuel(text):
-    s = (text or "").lower()
-    for name, kws in FUEL_HINTS.items():
-        if any(w in s for w in kws):
-            return name
-    return None
+    return _first_word(text, "fuel")
+
+DRIVE_HINTS = {
+    "4WD/AWD": ["4wd", "awd", "ขับสี่"],
+    "FWD": ["ขับหน้า", "fwd"],
+    "RWD": ["ขับหลัง", "rwd"],
+}
+
+def _extract_drive(text):
+    return _first_word(text, "drive")
+
+# automaton เดียวของทุก vocabulary ที่ใช้วิเคราะห์ข้อความแชต (เพิ่มคำได้โดยเวลาสแกนต่อ turn ไม่เพิ่ม)
+TEXT_MATCHER = KeywordMatcher({
+    "usage": USAGE_HINTS,
+    "trans": TRANS_HINTS,
+    "body": BODY_HINTS,
+    "fuel": FUEL_HINTS,
+    "drive": DRIVE_HINTS,
+    "no": NO_WORDS,
+    "efficiency": EFFICIENCY_WORDS,
+    "compare": COMPARE_WORDS,
+    "open_question": OPEN_QUESTION_WORDS,
+    "not_usage": NOT_USAGE_WORDS,
+    "new_start": NEW_START_TRIGGERS,
+    "reset": RESET_ALL + NEW_RECO,
+}, cache_size=int(os.getenv("TEXT_MATCH_CACHE_SIZE", "4096")))
+
+def detect_body(text, order=None):
+    """ประเภทตัวถังแรก (ตามลำดับใน BODY_HINTS หรือ order) ที่มีคำพูดถึงในข้อความ"""
+    return text_hits(text).first("body", order)
 
 
 ASK_ORDER = [
@@ -370,8 +569,8 @@ def format_question_for_ui(raw_q: str, answers: dict) -> str:
         return raw_q
 
 
-def choose_natural_question(field: str, answers: dict, prefs: dict) -> str:
-    last_q = (prefs or {}).get("last_question", "")
+def choose_natural_question(field: str, answers: dict, prefs: Prefs) -> str:
+    last_q = prefs.last_question if prefs is not None else ""
     variants = ASK_VARIANTS.get(field, []) or ["ขอรายละเอียดเพิ่มเติมหน่อยครับ?"]
     random.shuffle(variants)
     base_q = variants[0].strip()
@@ -420,16 +619,16 @@ def choose_natural_question(field: str, answers: dict, prefs: dict) -> str:
 
 def _next_missing_field(answers: dict) -> str | None:
     prefs = get_prefs()
-    order = prefs.get("_ask_order")
+    order = prefs.ask_order
 
     if not order:
         middle = ["usage_text", "trans", "fuel", "drive"]  
         random.shuffle(middle)
         order = ["price", "make"] + middle + ["extra"]
-        prefs["_ask_order"] = order
+        prefs.ask_order = order
         save_prefs(prefs)
 
-    skip = set(prefs.get("_skip", []))
+    skip = set(prefs.skip)
     for f in order:
         if answers.get(f) or f in skip:
             continue
@@ -439,7 +638,7 @@ def _next_missing_field(answers: dict) -> str | None:
 
 def _fallback_question(field: str) -> str:
     prefs = get_prefs()
-    return choose_natural_question(field, prefs.get("answers", {}), prefs)
+    return choose_natural_question(field, prefs.answers, prefs)
 
 SYSTEM_PLANNER = (
     "คุณคือผู้ช่วยด้านรถยนต์ หน้าที่คือ 'ถามต่อหนึ่งคำถามสั้น ๆ' เพื่อคัดเลือกรถได้แม่นขึ้น\n"
@@ -485,42 +684,6 @@ def next_question(user_input: str, answers: dict):
 
     return {"ask_for": miss, "question": q}
 
-def price_llm(text: str) -> tuple[int|None, int|None]:
-    
-    if not text or not text.strip():
-        return (None, None)
-
-    sys = (
-        "คุณคือตัวแยกราคาไทย ให้ตอบ JSON เท่านั้น "
-        "price_min/price_max เป็นจำนวนเต็มบาท ถ้าเป็น 'ไม่เกิน X' ให้ min=0,max=X; "
-        "ถ้า 'ตั้งแต่ X ขึ้นไป' ให้ min=X,max=null; ช่วง X–Y ให้ min=X,max=Y; "
-        "รองรับรูปแบบ 1,000,000 / 1ล้าน / 900k / 0.8m / 7-9แสน / ประมาณ 1 ล้าน "
-        "อย่าใส่หน่วยลงในตัวเลข"
-    )
-    user = f"""ข้อความ: "{text}"
-ตอบ JSON เท่านั้น เช่น {{"price_min": 0, "price_max": 1000000}} หรือ {{"price_min": 700000, "price_max": 900000}} 
-ถ้าระบุไม่ได้ ให้ตอบ {{"price_min": null, "price_max": null}}"""
-
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0.0,
-            max_tokens=60,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": sys},
-                {"role": "user", "content": user},
-            ],
-        )
-        data = json.loads(resp.choices[0].message.content or "{}")
-        mn = data.get("price_min")
-        mx = data.get("price_max")
-        mn = int(mn) if isinstance(mn, (int, float, str)) and str(mn).strip().isdigit() else None
-        mx = int(mx) if isinstance(mx, (int, float, str)) and str(mx).strip().isdigit() else None
-        return (mn, mx)
-    except Exception:
-        return (None, None)
-
 def extract_json(text: str) -> dict:
     """พยายามดึง JSON object ก้อนแรกจากสตริง (กัน LLM ใส่คำพูด/หัวข้อมาเกิน)
     คืน {} ถ้าดึงไม่ได้"""
@@ -540,61 +703,231 @@ def extract_json(text: str) -> dict:
     except Exception:
         return {}
 
-def extract_answers(user_input: str, known_answers: dict) -> dict:
-    try:
-        print("[extract_answers] input:", user_input)
-        prompt = f"""คุณเป็นผู้ช่วยขายรถยนต์
-แยกข้อมูลที่ผู้ใช้ตอบออกเป็น JSON เท่านั้น (ห้ามมีคำอธิบายอื่น)
-คีย์ที่รองรับ: price, usage_text, make, fuel, trans, drive, series
-ถ้าไม่พบให้ใส่ค่าว่าง เช่น "" (string ว่าง) ห้ามลบคีย์ทิ้ง
-
-ตัวอย่าง:
-ผู้ใช้: "ไม่เกิน 1 ล้าน ขอดู nissan"
-คำตอบ:
-{{"price": "ไม่เกิน 1 ล้าน", "make": "nissan", "series": "", "usage_text": "", "fuel": "", "trans": "", "drive": ""}}
-
-ผู้ใช้: "{user_input}"
-ตอบเป็น JSON object เพียงอย่างเดียว
-"""
+# คำที่ไม่มีข้อมูล ใช้ตัดออกตอนวัดว่า parser แบบกฎอธิบายข้อความได้ครบแค่ไหน
+FILLER_WORDS = (
+    "ครับ", "คับ", "ค่ะ", "คะ", "นะ", "จ้า", "ขอ", "ดู", "อยาก", "ได้", "เอา", "แบบ",
+    "รถ", "หน่อย", "งบ", "ประมาณ", "บาท", "ไม่เกิน", "ระหว่าง", "ถึง", "ตั้งแต่", "ช่วง",
+    "ยี่ห้อ", "รุ่น", "เกียร์", "เครื่อง", "และ", "กับ", "หรือ", "ก็", "ค่าย", "ใช้", "ชอบ", "ขับ",
+)
+FILLER_MATCHER = KeywordMatcher({"filler": FILLER_WORDS})
+WORD_CHAR_RE = re.compile(r"[^\s\W_]")
+_PRICE_NUM = r"\d+(?:\.\d+)?\s*(?:ล้าน|แสน|หมื่น|พัน|k(?![a-z]))?"
+# วลีราคาหนึ่งวลีตามรูปที่ extract_price_range อ่านได้ เช่น "ไม่เกิน 8 แสน", "7-9แสน", "1.2 ล้าน"
+PRICE_PHRASE_RE = re.compile(
+    rf"(?:(?:ไม่เกิน|ระหว่าง|ช่วง|ตั้งแต่|เกิน|มากกว่า|>)\s*)?{_PRICE_NUM}(?:\s*(?:ถึง|-)\s*{_PRICE_NUM})?"
+)
+# ตัวเลขที่น่าจะเป็นราคา: มีหน่วย หรือยาวตั้งแต่ 5 หลัก (กัน "7 ที่นั่ง")
+PRICE_LIKE_RE = re.compile(r"\d+(?:\.\d+)?\s*(?:ล้าน|แสน|หมื่น|พัน|k(?![a-z]))|\d{5,}")
+EXTRACT_RULE_MIN_CONFIDENCE = float(os.getenv("EXTRACT_RULE_MIN_CONFIDENCE", "0.8"))
+EXTRACT_STATS = Counter()
+
+def _in_latin_word(text: str, start: int, end: int) -> bool:
+    """คำละตินที่อยู่กลางคำละตินที่ยาวกว่า (เช่น "at" ใน "hatchback")
+    ภาษาไทยไม่มีช่องว่างคั่นคำจึงเช็กเฉพาะขอบที่เป็นตัวอักษร/ตัวเลขละติน"""
+    latin = lambda ch: ch.isascii() and ch.isalnum()
+    return ((start > 0 and latin(text[start]) and latin(text[start - 1]))
+            or (end < len(text) and latin(text[end - 1]) and latin(text[end])))
+
+def _bounded(hits, text: str, vocab: str, skip=()) -> dict:
+    """{key: [(start, end), ...]} ของคำใน vocab ที่ไม่อยู่กลางคำละตินที่ยาวกว่า เรียงตามลำดับ key ใน vocabulary
+    คำที่ทับช่วงใน skip (เช่นวลีราคา) ไม่นับ: "2" ใน "1.2 ล้าน" ไม่ใช่รุ่น"""
+    found = {}
+    for m in hits.matches:
+        if m.vocab != vocab or _in_latin_word(text, m.start, m.end):
+            continue
+        if any(m.start < e and s < m.end for s, e in skip):
+            continue
+        found.setdefault(m.key, []).append((m.start, m.end))
+    return {k: found[k] for k in hits.keys(vocab) if k in found}
+
+def _rule_extract(user_input: str) -> tuple[dict, float]:
+    """tier 1: parser แบบกฎล้วน ไม่เรียก LLM
+    คืน (slots, confidence) โดย confidence = สัดส่วนตัวอักษรที่ parser อธิบายได้
+    นับจากตำแหน่งของคำที่ match จริง ไม่ใช่การลบ substring ออกจากข้อความ"""
+    text = (user_input or "").lower().strip()
+    slots, spans = {}, []
+
+    # อ่านราคาจากวลีราคาที่ match เท่านั้น ไม่ใช่ตัวเลขแรกของข้อความ ("7 ที่นั่ง งบ 1.2 ล้าน")
+    # ตำแหน่งใน text ของแต่ละตัวอักษรหลังตัดจุลภาคคั่นหลักพัน
+    pos = [i for i, ch in enumerate(text) if ch != ","]
+    price_spans = []
+    for m in PRICE_PHRASE_RE.finditer(text.replace(",", "")):
+        if not PRICE_LIKE_RE.search(m.group()):
+            continue
+        pmin, pmax = extract_price_range(m.group())
+        if pmin or pmax:
+            slots["price"] = (pmin, pmax)
+            price_spans.append((pos[m.start()], pos[m.end() - 1] + 1))
+            break
+    spans.extend(price_spans)
+
+    cv_hits = catalogue_vocab.matcher.scan(text)
+    for key in ("make", "series"):
+        found = _bounded(cv_hits, text, key, price_spans)
+        if found:
+            v = next(iter(found))
+            slots[key] = v if key == "make" else catalogue_vocab.roots[v]
+            spans.extend(found[v])
+
+    hits = text_hits(text)
+    for key in ("trans", "fuel", "drive"):
+        found = _bounded(hits, text, key, price_spans)
+        if found:
+            v = next(iter(found))
+            slots[key] = v
+            spans.extend(found[v])
+
+    usage = _bounded(hits, text, "usage", price_spans)
+    if usage:
+        # เฉพาะคำการใช้งานที่พบ: ทั้งประโยคอาจมีคำอย่าง "ออโต้" ที่ทำให้ extract_answers ทิ้ง usage hint
+        slots["usage_text"] = " ".join(usage)
+    body = _bounded(hits, text, "body", price_spans)
+    if body:
+        slots["body"] = next(iter(body))
+    for found in (usage, body, _bounded(FILLER_MATCHER.scan(text), text, "filler", price_spans)):
+        for positions in found.values():
+            spans.extend(positions)
+
+    meaningful = [m.start() for m in WORD_CHAR_RE.finditer(text)]
+    if not meaningful:
+        return slots, 0.0
+    covered = bytearray(len(text))
+    for start, end in spans:
+        covered[start:end] = b"\x01" * (end - start)
+    residual = sum(1 for i in meaningful if not covered[i])
+    return slots, 1.0 - residual / len(meaningful)
+
+def extraction_stats() -> dict:
+    turns = EXTRACT_STATS["turns"]
+    rate = lambda n: round(n / turns, 4) if turns else 0.0
+    return {
+        "turns": turns,
+        "rules_only": EXTRACT_STATS["rules_only"],
+        "llm_calls": EXTRACT_STATS["llm_calls"],
+        "llm_rejected": EXTRACT_STATS["llm_rejected"],
+        "rules_only_rate": rate(EXTRACT_STATS["rules_only"]),
+        "llm_rate": rate(EXTRACT_STATS["llm_calls"]),
+        "fields": {k: v for k, v in EXTRACT_STATS.items() if k.startswith("field:")},
+    }
 
+# schema ของทุกช่องที่ LLM แยกได้ ราคาเป็นตัวเลขบาทแยก min/max
+EXTRACTION_FIELDS = {
+    "price_min": {"type": ["integer", "null"]},
+    "price_max": {"type": ["integer", "null"]},
+    "usage_text": {"type": "string"},
+    "make": {"type": "string"},
+    "series": {"type": "string"},
+    "fuel": {"type": "string", "enum": [*FUEL_HINTS, ""]},
+    "trans": {"type": "string", "enum": [*TRANS_HINTS, ""]},
+    "drive": {"type": "string", "enum": [*DRIVE_HINTS, ""]},
+}
+LLM_SLOT_KEYS = ["price", "usage_text", "make", "fuel", "trans", "drive", "series"]
+
+def extraction_schema(keys: list[str]) -> dict:
+    props = {}
+    for k in keys:
+        if k == "price":
+            props["price_min"] = EXTRACTION_FIELDS["price_min"]
+            props["price_max"] = EXTRACTION_FIELDS["price_max"]
+        elif k in EXTRACTION_FIELDS:
+            props[k] = EXTRACTION_FIELDS[k]
+    return {
+        "type": "object",
+        "properties": props,
+        "required": list(props),
+        "additionalProperties": False,
+    }
+
+_JSON_TYPES = {"string": str, "null": type(None), "integer": int}
+
+def validate_extraction(data, schema: dict) -> dict | None:
+    """ตรวจผลลัพธ์ตาม schema (object ชั้นเดียว) คืน data ถ้าผ่าน ไม่งั้นคืน None"""
+    if not isinstance(data, dict):
+        return None
+    props = schema["properties"]
+    if set(data) - set(props) or set(schema["required"]) - set(data):
+        return None
+    for k, rule in props.items():
+        v = data[k]
+        types = rule["type"] if isinstance(rule["type"], list) else [rule["type"]]
+        if isinstance(v, bool) or not any(isinstance(v, _JSON_TYPES[t]) for t in types):
+            return None
+        if "enum" in rule and v not in rule["enum"]:
+            return None
+        if isinstance(v, int) and v < 0:
+            return None
+    return data
+
+def _llm_extract(user_input: str, keys: list[str]) -> dict:
+    """tier 2: call เดียวแบบ structured output แยกเฉพาะคีย์ที่ parser แบบกฎยังหาไม่ได้
+    ผลที่ไม่ผ่าน validate_extraction จะถูกทิ้ง (ไม่ retry)"""
+    EXTRACT_STATS["llm_calls"] += 1
+    schema = extraction_schema(keys)
+    sys = (
+        "คุณเป็นตัวแยกข้อมูลรถยนต์จากข้อความผู้ใช้ ตอบตาม schema เท่านั้น ถ้าไม่พบให้ใส่ \"\" หรือ null\n"
+        "usage_text: ลักษณะการใช้งานตามที่ผู้ใช้พูด, make: ยี่ห้อ (ภาษาอังกฤษตัวพิมพ์เล็ก), series: รุ่น\n"
+        "price_min/price_max เป็นจำนวนเต็มบาท ถ้าเป็น 'ไม่เกิน X' ให้ min=0,max=X; "
+        "ถ้า 'ตั้งแต่ X ขึ้นไป' ให้ min=X,max=null; ช่วง X–Y ให้ min=X,max=Y; "
+        "รองรับรูปแบบ 1,000,000 / 1ล้าน / 900k / 0.8m / 7-9แสน / ประมาณ 1 ล้าน"
+    )
+    try:
         resp = client.chat.completions.create(
             model="gpt-4o-mini",
-            temperature=0.2,         
-            max_tokens=120,
+            temperature=0.0,
+            max_tokens=150,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "car_slots", "strict": True, "schema": schema},
+            },
             messages=[
-                {"role": "system", "content": "คุณเป็นตัวแยกข้อมูลและต้องตอบเป็น JSON object เท่านั้น"},
-                {"role": "user", "content": prompt},
+                {"role": "system", "content": sys},
+                {"role": "user", "content": user_input},
             ],
         )
-
         llm_text = (resp.choices[0].message.content or "").strip()
-        parsed = extract_json(llm_text)  
-        
-        mk = extract_make_from_query(user_input)
-        if mk:
-            known_answers.update(mk)
-        if not known_answers.get("usage_text") and parsed.get("usage"):
-            known_answers["usage_text"] = parsed["usage"]
-            parsed.pop("usage", None)      
-            
         print("[extract_answers] raw_llm:", llm_text)
+        data = validate_extraction(json.loads(llm_text), schema)
+    except Exception as e:
+        print("extract_answers llm error:", e)
+        data = None
+    if data is None:
+        EXTRACT_STATS["llm_rejected"] += 1
+        return {}
+    return data
+
+def extract_answers(user_input: str, known_answers: dict) -> dict:
+    try:
+        print("[extract_answers] input:", user_input)
+        EXTRACT_STATS["turns"] += 1
+        rule_slots, confidence = _rule_extract(user_input)
+        for k in rule_slots:
+            EXTRACT_STATS[f"field:{k}:rules"] += 1
+        print("[extract_answers] rules:", rule_slots, f"confidence={confidence:.2f}")
+
+        parsed = {}
+        unresolved = [k for k in LLM_SLOT_KEYS if k not in rule_slots]
+        if confidence < EXTRACT_RULE_MIN_CONFIDENCE and unresolved:
+            parsed = _llm_extract(user_input, unresolved)
+            for k, v in parsed.items():
+                if v or v == 0:
+                    EXTRACT_STATS[f"field:{k}:llm"] += 1
+        else:
+            EXTRACT_STATS["rules_only"] += 1
+
+        for k, v in rule_slots.items():
+            if k != "body":
+                known_answers[k] = v
         print("[extract_answers] parsed:", parsed)
-        
-        allow_keys = {"price","usage_text","make","series","fuel","trans","body","drive"}
+
+        allow_keys = {"usage_text","make","series","fuel","trans","drive"}
         for k, v in parsed.items():
             if k in allow_keys and v:
                 known_answers[k] = v
 
         u_text = known_answers.get("usage_text")
         if isinstance(u_text, str) and u_text.strip():
-            t = u_text.lower()
-
-            not_usage_keywords = [
-                "แรงม้า", "แรงสุด", "เร็ว", "ความเร็ว", "0-100", "แรง",    
-                "เกียร์", "ออโต้", "อัตโนมัติ", "ธรรมดา", "manual", "mt", "at", "cvt", "dct"  
-            ]
-            if any(k in t for k in not_usage_keywords):
-                known_answers.pop("usage", None)   
+            if text_hits(u_text).has("not_usage"):
+                known_answers.pop("usage", None)
             else:
                 hints = _extract_usage(u_text)
                 if hints:
@@ -605,28 +938,21 @@ def extract_answers(user_input: str, known_answers: dict) -> dict:
         btext = f"{known_answers.get('usage_text','')} {user_input}".lower()
 
         _body_order = ["sedan", "suv", "mpv", "hatchback", "pickup"]
-        detected_body = None
-
-        for _b in _body_order:
-            if any(w in btext for w in BODY_HINTS[_b]):
-                detected_body = _b
-                break
+        detected_body = detect_body(btext, _body_order)
 
         if detected_body:
             known_answers["body"] = detected_body
 
-        
-        
         ttext = f"{(known_answers.get('usage_text') or '')} {user_input}".lower()
-        tr = _extract_transmission(ttext)  
+        tr = _extract_transmission(ttext)
         if tr:
             known_answers["trans"] = tr
 
         if (known_answers.get("usage_text","").strip() in
             ("ออโต้","เกียร์ออโต้","เกียร์อัตโนมัติ","ธรรมดา","เกียร์ธรรมดา","ชอบขับออโต้")):
             known_answers["usage_text"] = ""
-            
-        mn, mx = price_llm(user_input)
+
+        mn, mx = parsed.get("price_min"), parsed.get("price_max")
         if known_answers.get("price") != (None, None):
             if mn is not None or mx is not None:
                 known_answers["price"] = (mn or 0, mx or 10_000_000_000)
@@ -649,12 +975,10 @@ def detect_reference(user_input: str, last_results: list[dict]) -> int | None:
     return None
 
 def is_efficiency_question(user_input: str) -> bool:
-    t = user_input.lower()
-    return any(k in t for k in ["ประหยัด", "กินน้ำมัน", "อัตราสิ้นเปลือง", "กม/ลิตร", "km/l"])
+    return text_hits(user_input).has("efficiency")
 
 def is_compare_intent(user_input: str) -> bool:
-    t = user_input.lower()
-    return ("เทียบ" in t) or ("ต่างกัน" in t) or ("vs" in t) or ("เปรียบเทียบ" in t)
+    return text_hits(user_input).has("compare")
 
 def rag_retrieve_context(user_query: str, answers: dict, top_n: int = 5):
    
@@ -733,107 +1057,33 @@ def search_similar_rows(user_query, price_min=None, price_max=None,
                         target_make=None, top_n=5, usage_hints=None,answers=None,target_series=None):
           
     target_body = (answers or {}).get("body")
-    def _row_is_body(row, want):
-        t = (row.get("type_norm") or row.get("type") or "").strip().lower()
-        t = BODY_MAP.get(t, t)          # map ให้เป็นคีย์มาตรฐาน
-        return (t == want) if want else True
-
     answers = answers or {}
-    qemb = model.encode([user_query]).astype("float32")
-    faiss.normalize_L2(qemb)
-    
-    k = min(max(top_n * 50, 200), index.ntotal)
-    scores, indices = index.search(qemb, k)  
-    
+    qemb = encode_query(user_query)
 
-    matched = []
-    for s, idx in zip(scores[0], indices[0]):
-        if idx >= len(df):
-            continue  
-        row = df.iloc[idx]
-        if not target_body and usage_hints and ("ในเมือง" in usage_hints):
-            if _row_is_body(row, "pickup"):
-                continue
-        if target_body and not _row_is_body(row, target_body):
-            continue 
-        try:
-            price = float(row["price_thb"])
-            make_in_row = str(row.get("make", "")).strip().lower()
-            series_in_row = str(row.get("series", "")).strip().lower()
-        except Exception:
-            continue
-        trans_pref = (answers or {}).get("trans")
-        if trans_pref:
-            name_join = f"{row.get('full_name','')} {row.get('series','')} {row.get('description','')} {row.get('gears','')}"
-            name_lc = name_join.lower()
-            if trans_pref == "MT":
-                if any(k in name_lc for k in ["a/t", " auto", "ออโต้", "cvt", "dct"]):
-                    continue
-                if re.search(r'\b\d+\s*at\b', name_lc) or re.search(r'\bat\b', name_lc):
-                    continue
-            if trans_pref == "AT":
-                if any(k in name_lc for k in ["m/t", " manual", "ธรรมดา"]):
-                    continue
-                if re.search(r'\b\d+\s*mt\b', name_lc) or re.search(r'\bmt\b', name_lc):
-                    continue
-        if target_make:
-            if isinstance(target_make, str):
-                raw = re.split(r'[,\s/&|]+', target_make.lower())
-                stop = {"และ", "กับ", "หรือ", "and", "or"}
-                makes = [m for m in raw if m and m not in stop]
-            elif isinstance(target_make, list):
-                makes = [m.lower() for m in target_make]
-            else:
-                makes = []
-            car_name = (str(row.get("full_name", "")) + " " + make_in_row).lower()
-            if not any(m in car_name for m in makes):
-                continue
-        if target_series:
-            if str(target_series).strip().lower() not in series_in_row:
-                continue
-        if price_min is not None and price < float(price_min):
-            continue
-        if price_max is not None and price > float(price_max):
-            continue
-        matched.append((float(s), row))
-        if len(matched) >= top_n:
-            break
+    allowed = filters.mask(
+        price_min=price_min,
+        price_max=price_max,
+        target_make=target_make,
+        target_series=target_series,
+        body=target_body,
+        trans=answers.get("trans"),
+        exclude_body="pickup" if (not target_body and usage_hints and "ในเมือง" in usage_hints) else None,
+    )
+
+    scores, ids = filtered_search(index, qemb, allowed, top_n, row_ids)
+    matched = [(float(s), df.iloc[i]) for s, i in zip(scores, ids)]
 
     if len(matched) < top_n:
-        cand = df.copy()
-        if target_make:
-            cand = cand[
-                cand["make"].astype(str).str.lower().str.contains(target_make, na=False)]
-        if price_min is not None:
-            cand = cand[pd.to_numeric(cand["price_thb"], errors="coerce") >= float(price_min)]
-        if price_max is not None:
-            cand = cand[pd.to_numeric(cand["price_thb"], errors="coerce") <= float(price_max)]
-        if target_body:
-            cand = cand[
-                cand["type_norm"].apply(lambda t: BODY_MAP.get(str(t).lower(), str(t).lower()) == target_body)]
-        if cand.empty and (price_min is not None or price_max is not None):
-            cand = df.copy()
-            if target_make:
-                cand = cand[
-                    cand["make"].astype(str).str.lower().str.contains(target_make, na=False)
-                ]
-            target = price_max if price_max is not None else price_min
-            cand["price_diff"] = (
-                pd.to_numeric(cand["price_thb"], errors="coerce") - float(target)
-            ).abs()
-            cand = cand.sort_values("price_diff", ascending=True)
-
-        cand = cand.sort_values("price_thb", ascending=True).head(top_n)
-
-        real_scored = []
-        for ridx, r in cand.iterrows():
-            try:
-                x = np.asarray(index.reconstruct(int(ridx)), dtype="float32")  
-                dist = float(((qemb[0] - x) ** 2).sum())                       
-            except Exception:
-                dist = 1e9 
-            real_scored.append((dist, r))
-        matched = real_scored
+        ids = retriever.retrieve(
+            price_min=price_min,
+            price_max=price_max,
+            target_make=target_make,
+            target_series=target_series,
+            body=target_body,
+            top_n=top_n,
+        )
+        dists = score_rows(qemb[0], ids)
+        matched = [(float(d), df.iloc[i]) for d, i in zip(dists, ids)]
 
     hints = usage_hints or []
 
@@ -888,50 +1138,201 @@ def search_similar_rows(user_query, price_min=None, price_max=None,
     ranked.sort(key=lambda x: x[0])     
     return ranked[:top_n]
 
-def rag_generate_answer(rows, user_query=""):
-    explanations = []
-    for i, row in enumerate(rows, 1):
-        eng_l  = row.get('engine_l')
-        eng_cc = row.get('engine_cc')
-        engine_line = f"{float(eng_l):.1f} L" if pd.notna(eng_l) else "---"
-        if pd.notna(eng_cc):
-            try:
-                engine_line = (engine_line if engine_line != "---" else "") + f" ({int(eng_cc)} cc)"
-                engine_line = engine_line.strip()
-            except Exception:
-                pass
+def _explanation_fallback(row) -> str:
+    """บรรทัดสำรองเมื่อสร้างคำอธิบายไม่ทันเวลา"""
+    try:
+        return f"ราคา {int(row['price_thb']):,} บาท"
+    except Exception:
+        return "ราคา -"
 
-        ctx = (
-            f"รุ่น: {row.get('full_name','-')}\n"
-            f"ซีรีส์/รุ่นย่อย: {row.get('series','-')}\n"
-            f"ปี: {row.get('year','-')}\n"
-            f"ราคา: {int(row['price_thb']):,} บาท\n"
-            f"เครื่องยนต์: {engine_line}\n"
-            f"แรงม้า: {row.get('horsepower_hp','---')}\n"
-            f"เชื้อเพลิง: {row.get('fuel_type','---')}\n"
-            f"รายละเอียด: {row.get('description','')}\n"
+def _explanation_context(row) -> str:
+    eng_l  = row.get('engine_l')
+    eng_cc = row.get('engine_cc')
+    engine_line = f"{float(eng_l):.1f} L" if pd.notna(eng_l) else "---"
+    if pd.notna(eng_cc):
+        try:
+            engine_line = (engine_line if engine_line != "---" else "") + f" ({int(eng_cc)} cc)"
+            engine_line = engine_line.strip()
+        except Exception:
+            pass
+
+    return (
+        f"รุ่น: {row.get('full_name','-')}\n"
+        f"ซีรีส์/รุ่นย่อย: {row.get('series','-')}\n"
+        f"ปี: {row.get('year','-')}\n"
+        f"ราคา: {int(row['price_thb']):,} บาท\n"
+        f"เครื่องยนต์: {engine_line}\n"
+        f"แรงม้า: {row.get('horsepower_hp','---')}\n"
+        f"เชื้อเพลิง: {row.get('fuel_type','---')}\n"
+        f"รายละเอียด: {row.get('description','')}\n"
+    )
+
+def _build_explanation_prompt(row, user_query: str) -> str:
+    return (
+        f'จากข้อมูลรถ:\n{_explanation_context(row)}\nผู้ใช้ต้องการ: "{user_query}"\n'
+        "ช่วยสรุปแบบภาษาคนคุยกัน เป็น 2–3 ประโยค อ่านง่าย ตรงประเด็น "
+        "อธิบายว่ารุ่นนี้เด่น/เหมาะเพราะอะไร พร้อมข้อสังเกตสั้น ๆ หากมี "
+        "ยึดจากข้อมูลข้างบนเท่านั้น"
+    )
+
+def _explain_row(i, row, user_query: str, deadline_at: float) -> str:
+    # รอคิวจนเลยเส้นตายของ request แล้ว ผลจะถูกทิ้งอยู่ดี: ไม่ยิง ปล่อย worker ให้ request ถัดไป
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        return None
+    try:
+        # ไม่ retry และ timeout ไม่เกินเวลาที่เหลือ: call ที่ request เลิกรอแล้วจบเองภายในเส้นตาย ไม่ค้าง worker
+        resp = client.with_options(
+            max_retries=0, timeout=min(EXPLAIN_CALL_TIMEOUT, remaining)
+        ).chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "คุณคือนักขายรถที่อธิบายเก่ง พูดเป็นกันเอง อิงข้อมูลที่ให้เท่านั้น"},
+                {"role": "user", "content": _build_explanation_prompt(row, user_query)},
+            ],
+            temperature=0.7,
+            max_tokens=700,
         )
+        return (resp.choices[0].message.content or "").strip() or None
+    except Exception as e:
+        print(f"RAG GPT error on row {i}: {e}")
+        return None
 
-        prompt = (
-            f'จากข้อมูลรถ:\n{ctx}\nผู้ใช้ต้องการ: "{user_query}"\n'
-            "ช่วยสรุปแบบภาษาคนคุยกัน เป็น 2–3 ประโยค อ่านง่าย ตรงประเด็น "
-            "อธิบายว่ารุ่นนี้เด่น/เหมาะเพราะอะไร พร้อมข้อสังเกตสั้น ๆ หากมี "
-            "ยึดจากข้อมูลข้างบนเท่านั้น"
+def _explain_rows_concurrent(rows, user_query: str, deadline_at: float) -> list:
+    """คืนลิสต์ตามลำดับ rows; None = สร้างไม่สำเร็จหรือไม่ทันเส้นตาย deadline_at (time.monotonic())"""
+    futures = [
+        _explain_pool.submit(_explain_row, i, row, user_query, deadline_at)
+        for i, row in enumerate(rows, 1)
+    ]
+    done, _ = wait(futures, timeout=max(0.0, deadline_at - time.monotonic()))
+
+    explanations = []
+    for i, fut in enumerate(futures, 1):
+        if fut in done:
+            explanations.append(fut.result())
+        else:
+            print(f"RAG GPT deadline exceeded on row {i}")
+            explanations.append(None)
+    return explanations
+
+def _row_key(i, row) -> str:
+    rid = row.get("row_id")
+    return str(int(rid)) if rid is not None and pd.notna(rid) else f"car{i}"
+
+def _explain_rows_batch(rows, user_query: str, deadline_at: float) -> dict:
+    """ขอคำอธิบายทุกคันใน call เดียว คืน {row_key: ข้อความ} เฉพาะที่ผ่านการตรวจ
+    คืน {} ถ้า parse JSON ไม่ได้หรือเลยเส้นตาย deadline_at แล้ว"""
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        return {}
+    keys = [_row_key(i, row) for i, row in enumerate(rows, 1)]
+    blocks = "\n".join(
+        f"[row_id: {k}]\n{_explanation_context(row)}" for k, row in zip(keys, rows)
+    )
+    prompt = (
+        f"จากข้อมูลรถ {len(rows)} คัน:\n{blocks}\nผู้ใช้ต้องการ: \"{user_query}\"\n"
+        "สำหรับแต่ละคัน ช่วยสรุปแบบภาษาคนคุยกัน เป็น 2–3 ประโยค อ่านง่าย ตรงประเด็น "
+        "อธิบายว่ารุ่นนี้เด่น/เหมาะเพราะอะไร พร้อมข้อสังเกตสั้น ๆ หากมี "
+        "ยึดจากข้อมูลของคันนั้นเท่านั้น\n"
+        'ตอบ JSON เท่านั้น: {"explanations": [{"row_id": "<row_id>", "text": "<คำอธิบาย>"}]} '
+        "ครบทุก row_id"
+    )
+    try:
+        resp = client.with_options(max_retries=0, timeout=remaining).chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "คุณคือนักขายรถที่อธิบายเก่ง พูดเป็นกันเอง อิงข้อมูลที่ให้เท่านั้น"},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.7,
+            max_tokens=EXPLAIN_BATCH_TOKENS_PER_ROW * len(rows),
+            response_format={"type": "json_object"},
         )
-        try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "คุณคือนักขายรถที่อธิบายเก่ง พูดเป็นกันเอง อิงข้อมูลที่ให้เท่านั้น"},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.7,
-                max_tokens=700,
-            )
-            explanations.append((resp.choices[0].message.content or "").strip())
-        except Exception as e:
-            print(f"RAG GPT error on row {i}: {e}")
-            explanations.append("ไม่สามารถสร้างคำอธิบายได้")
+        parsed = extract_json(resp.choices[0].message.content or "")
+    except Exception as e:
+        print("RAG GPT batch error:", e)
+        return {}
+
+    items = parsed.get("explanations") if isinstance(parsed, dict) else None
+    if not isinstance(items, list):
+        return {}
+    wanted = set(keys)
+    out = {}
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        k = str(it.get("row_id", "")).strip()
+        text = it.get("text")
+        if k in wanted and isinstance(text, str) and text.strip():
+            out[k] = text.strip()
+    return out
+
+def _intent_signature(user_query: str, answers: dict | None = None) -> str:
+    """สรุปเจตนาของผู้ใช้ให้เป็นสตริงมาตรฐาน (ช่วงราคา/การใช้งาน/ตัวถัง/เชื้อเพลิง)
+    ใช้เป็นส่วนหนึ่งของคีย์แคชคำอธิบาย"""
+    a = answers if isinstance(answers, dict) else {}
+    q = (user_query or "").lower()
+
+    price = a.get("price")
+    if isinstance(price, str):
+        price = extract_price_range(price)
+    if not isinstance(price, (list, tuple)) or len(price) != 2 or price == (None, None):
+        price = extract_price_range(q)
+    band = "/".join(
+        "-" if v is None else str(int(float(v)) // 100_000) for v in price
+    )
+
+    usage = sorted(set(a.get("usage") or []) | set(_extract_usage(q)))
+    body = a.get("body")
+    if not body:
+        body = detect_body(q) or ""
+    fuel = a.get("fuel") or _extract_fuel(q) or ""
+    return f"p={band};u={','.join(usage)};b={body};f={fuel}"
+
+def rag_generate_answer(rows, user_query="", answers=None):
+    """สร้างคำอธิบายรายคัน คืนลิสต์ตามลำดับ rows
+    คันที่เคยอธิบายด้วยเจตนาเดียวกันจะดึงจาก explain_cache
+    โหมด batch ขอทุกคันใน call เดียว คันที่ได้ไม่ครบจะยิงแยกรายคันด้วยเวลาที่เหลือ
+    โหมด per_row ยิงพร้อมกันทุกคัน
+    ทั้งสองโหมดใช้เส้นตายเดียวกัน EXPLAIN_DEADLINE คันไหนไม่ทันจะได้บรรทัดราคาแทน"""
+    rows = list(rows or [])
+    if not rows:
+        return []
+
+    intent = _intent_signature(user_query, answers)
+    cache_keys = [
+        explain_cache.make_key(_row_key(i, row), spec_hash(_explanation_context(row)), intent)
+        for i, row in enumerate(rows, 1)
+    ]
+    explanations = [explain_cache.get(k) for k in cache_keys]
+    todo = [i for i, text in enumerate(explanations) if text is None]
+    if not todo:
+        return explanations
+
+    pending = [rows[i] for i in todo]
+    fresh = [None] * len(pending)
+    deadline_at = time.monotonic() + EXPLAIN_DEADLINE
+    if RAG_EXPLAIN_MODE == "batch":
+        by_key = _explain_rows_batch(pending, user_query, deadline_at)
+        keys = [_row_key(i, row) for i, row in enumerate(pending, 1)]
+        fresh = [by_key.get(k) for k in keys]
+        missing = [j for j, text in enumerate(fresh) if text is None]
+        if missing and time.monotonic() >= deadline_at:
+            print(f"RAG GPT batch incomplete ({len(missing)}/{len(pending)}), deadline exceeded")
+        elif missing:
+            print(f"RAG GPT batch incomplete ({len(missing)}/{len(pending)}), falling back to per-row")
+            missed = [pending[j] for j in missing]
+            for j, text in zip(missing, _explain_rows_concurrent(missed, user_query, deadline_at)):
+                fresh[j] = text
+    else:
+        fresh = _explain_rows_concurrent(pending, user_query, deadline_at)
+
+    for i, text in zip(todo, fresh):
+        if text:
+            explain_cache.put(cache_keys[i], text)
+            explanations[i] = text
+        else:
+            explanations[i] = _explanation_fallback(rows[i])
     return explanations
 
 def llm_followup_answer(user_input, last_results):
@@ -1043,6 +1444,30 @@ def llm_detail_answer(user_input: str, row: dict) -> str:
 def home():
     return render_template("index.html")
 
+@app.route("/metrics")
+def metrics():
+    return jsonify({
+        "explain_cache": explain_cache.stats(),
+        "extraction": extraction_stats(),
+        "query_embedding_cache": query_cache.stats(),
+        "encoder_batching": encoder_service.stats(),
+        "startup": startup.status(),
+        "text_match_cache": TEXT_MATCHER.cache_info()._asdict(),
+        "catalogue_vocab": catalogue_vocab.stats() if catalogue_vocab else None,
+        "sessions": app.session_interface.stats(),
+    })
+
+@app.route("/healthz")
+def healthz():
+    # process ยังตอบได้ (liveness) ไม่สนว่าโหลดทรัพยากรเสร็จหรือยัง
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz")
+def readyz():
+    # load balancer ส่ง traffic มาเมื่อได้ 200 เท่านั้น; เวลาของแต่ละขั้นอยู่ใน phases
+    st = startup.status()
+    return jsonify(st), (200 if st["ready"] else 503)
+
 START_TRIGGERS = [
     "ช่วยแนะนำรถ",
     "เริ่มใหม่",
@@ -1055,23 +1480,16 @@ START_TRIGGERS = [
 ]
 
 def is_new_start(text: str, answers: dict) -> bool:
-    triggers = [
-        "เริ่มใหม่", "เริ่มต้นใหม่", "เริ่มต้นการค้นหาใหม่",
-        "เริ่มระบบใหม่", "อยากเริ่มใหม่", "อยากได้คำแนะนำใหม่",
-        "อยากให้แนะนำใหม่", "แนะนำใหม่", "หารถใหม่ให้หน่อย",
-        "อยากหารถใหม่", "ขอเริ่มใหม่", "ขอคำแนะนำใหม่"
-    ]
-    text = text.lower().strip()
-    return any(t in text for t in triggers)
+    return text_hits(text).has("new_start")
 
 def no_answer(text: str) -> bool:
-    t = (text or "").strip().lower()
-    return any(w in t for w in NO_WORDS)
+    return text_hits(text).has("no")
 
 WELCOME = "ยินดีต้อนรับสู่ระบบแนะนำรถยนต์ครับ  ผมพร้อมช่วยคุณหารถที่เหมาะกับคุณ!"
 FIRST_Q = "เริ่มจากงบประมาณก่อนนะครับ — ตั้งไว้ประมาณเท่าไหร่ดี?"
 
 @app.route("/chat", methods=["POST"])
+@requires_ready
 def chat():
 
     has_greeted = bool(session.get("has_greeted"))
@@ -1080,44 +1498,40 @@ def chat():
     ui = user_input.lower()
     handled_pending = False
 
-    RESET_ALL = ["เริ่มใหม่", "เริ่มต้นใหม่", "รีเซ็ต", "reset", "เริ่มระบบใหม่"]
-    NEW_RECO  = ["ขอใหม่", "หาใหม่", "แนะนำอีกที", "ขอคำแนะนำใหม่", "สุ่มใหม่", "อีก 5 คัน", "แนะนำชุดใหม่","ขอคำแนะนำใหม่"]
-
-    if data.get("reset") is True or any(t in ui for t in (RESET_ALL + NEW_RECO)):
+    if data.get("reset") is True or text_hits(ui).has("reset"):
         reset_state_all()
         session["has_greeted"] = True
         try:
             first_q = (choose_natural_question(
-                "price", get_prefs().get("answers", {}), get_prefs()
+                "price", get_prefs().answers, get_prefs()
             ) or FIRST_Q).strip()
         except Exception:
             first_q = FIRST_Q
-        first_q = format_question_for_ui(first_q, get_prefs().get("answers", {}))
-        prefs = get_prefs() or {}
-        prefs["pending_key"] = "price"
-        prefs["last_question"] = first_q
+        first_q = format_question_for_ui(first_q, get_prefs().answers)
+        prefs = get_prefs()
+        prefs.pending_key = "price"
+        prefs.last_question = first_q
         save_prefs(prefs)
         return jsonify({"mode": "intro", "reply": WELCOME, "next": first_q})
 
 
     prefs = get_prefs()
-    answers = prefs["answers"]
-    prefs.setdefault("_skip", [])
+    answers = prefs.answers
 
 
-    if any(t in ui for t in (RESET_ALL + NEW_RECO)):
+    if text_hits(ui).has("reset"):
         reset_state_all()
         session["has_greeted"] = True
         if has_greeted:
             return jsonify({"mode": "ask", "reply": "โอเค มาใส่ข้อมูลใหม่กันครับ — ตั้งงบไว้ประมาณเท่าไหร่?"})
         else:
             try:
-                first_q = (choose_natural_question("price", get_prefs().get("answers", {}), get_prefs()) or FIRST_Q).strip()
+                first_q = (choose_natural_question("price", get_prefs().answers, get_prefs()) or FIRST_Q).strip()
             except Exception:
                 first_q = FIRST_Q
-            prefs = get_prefs() or {}
-            prefs["pending_key"] = "price"
-            prefs["last_question"] = first_q
+            prefs = get_prefs()
+            prefs.pending_key = "price"
+            prefs.last_question = first_q
             save_prefs(prefs)
             first_q = format_question_for_ui(first_q, answers)
             return jsonify({"mode":"intro","reply":welcome,"next":first_q})
@@ -1125,21 +1539,20 @@ def chat():
 
 
     prefs = get_prefs()
-    answers = prefs["answers"]
-    prefs.setdefault("_skip", [])
+    answers = prefs.answers
     
     if is_new_start(user_input, answers):
-        prefs = {"answers": {}, "asked": [], "pending_key": "price", "last_question": None, "_skip": []}
+        prefs = Prefs(pending_key="price")
         save_prefs(prefs)
 
         welcome = "ยินดีต้อนรับสู่ระบบแนะนำรถยนต์ครับ ถ้าคุณต้องการคำแนะนำ ผมสามารถช่วยคุณค้นหารถที่เหมาะกับคุณได้ครับ 😊"
         try:
-            q = (choose_natural_question("price", get_prefs().get("answers", {}), get_prefs()) or FIRST_Q).strip()
+            q = (choose_natural_question("price", get_prefs().answers, get_prefs()) or FIRST_Q).strip()
         except Exception:
             q = FIRST_Q
-        prefs = get_prefs() or {}
-        prefs["pending_key"] = "price"
-        prefs["last_question"] = q
+        prefs = get_prefs()
+        prefs.pending_key = "price"
+        prefs.last_question = q
         save_prefs(prefs)
         return jsonify({
             "mode": "intro",
@@ -1148,14 +1561,13 @@ def chat():
         })
 
 
-    if prefs.get("pending_key"):
-        key = prefs["pending_key"].lower()
+    if prefs.pending_key:
+        key = prefs.pending_key.lower()
         ui = user_input.lower()
-        prefs.setdefault("_skip", [])
 
         if no_answer(ui):
-            if key not in prefs["_skip"]: prefs["_skip"].append(key)
-            prefs["pending_key"] = None
+            if key not in prefs.skip: prefs.skip.append(key)
+            prefs.pending_key = None
             save_prefs(prefs)
         else:
             if key in ("budget", "price"):
@@ -1180,19 +1592,14 @@ def chat():
                 fu = _extract_fuel(ui)
                 answers["fuel"] = fu or answers.get("fuel")
             elif key in ("drive", "drivetrain", "ขับเคลื่อน"):
-                if "4wd" in ui or "awd" in ui or "ขับสี่" in ui:
-                    answers["drive"] = "4WD/AWD"
-                elif "ขับหน้า" in ui or "fwd" in ui:
-                    answers["drive"] = "FWD"
-                elif "ขับหลัง" in ui or "rwd" in ui:
-                    answers["drive"] = "RWD"
+                dr = _extract_drive(ui)
+                if dr:
+                    answers["drive"] = dr
             elif key in ("usage", "usage_text"):
                 answers["usage_text"] = user_input.strip()
-                btxt = answers["usage_text"].lower()
-                for _body, _kws in BODY_HINTS.items():
-                    if any(w in btxt for w in _kws):
-                        answers["body"] = _body
-                        break
+                _body = detect_body(answers["usage_text"])
+                if _body:
+                    answers["body"] = _body
             elif key == "extra":
                 txt = (user_input or "").strip()
                 lo  = txt.lower()
@@ -1215,13 +1622,12 @@ def chat():
                         answers["make"] = mk["make"]
                     if "series" in mk:        
                         answers["series"] = mk["series"]
-                prefs.setdefault("_skip", [])
-                if "model" not in prefs["_skip"]:
-                    prefs["_skip"].append("model")
+                if "model" not in prefs.skip:
+                    prefs.skip.append("model")
 
-        prefs.setdefault("asked", []).append(key)
-        prefs["answers"] = answers
-        prefs["pending_key"] = None
+        prefs.asked.append(key)
+        prefs.answers = answers
+        prefs.pending_key = None
         handled_pending = True
         save_prefs(prefs)
 
@@ -1241,7 +1647,7 @@ def chat():
 
     save_prefs(prefs)
 
-    if prefs.get("stage") == "results" and session.get("recent_ids") and not prefs.get("pending_key"):
+    if prefs.stage == "results" and session.get("recent_ids") and not prefs.pending_key:
         ids = session["recent_ids"]
         cols = [
             "full_name","price_thb","engine_l","engine_cc","horsepower_hp",
@@ -1254,24 +1660,23 @@ def chat():
 
         reply_text = llm_followup_answer(user_input, last5)
         return jsonify({"mode": "followup", "reply": reply_text, "results": []})
-    if prefs.get("stage") != "results":
+    if prefs.stage != "results":
         if not handled_pending:
-            prefs["answers"] = extract_answers(user_input, prefs["answers"])
-            answers = prefs["answers"]
+            prefs.answers = extract_answers(user_input, prefs.answers)
+            answers = prefs.answers
             save_prefs(prefs)
         else:
-            answers = prefs["answers"]
+            answers = prefs.answers
     else:
-        answers = prefs["answers"]
+        answers = prefs.answers
 
-    prefs.setdefault("extra_done", False)  
 
     core_fields = ["make", "usage_text", "trans", "price", "fuel", "drive"]
-    skip = set(prefs.get("_skip", []))
+    skip = set(prefs.skip)
     core_flags = {k: (bool(answers.get(k)) or k in skip) for k in core_fields}
     ready = all(core_flags.values())
 
-    print("DEBUG core_flags:", core_flags, "ready:", ready, "extra_done:", prefs.get("extra_done"))
+    print("DEBUG core_flags:", core_flags, "ready:", ready, "extra_done:", prefs.extra_done)
 
     if not ready:
         plan = next_question(user_input, answers)
@@ -1280,28 +1685,28 @@ def chat():
 
         if (
             (not follow_q)
-            or (follow_q == prefs.get("last_question"))
+            or (follow_q == prefs.last_question)
             or (len(follow_q.split()) > 20)
         ):
             missing = _next_missing_field(answers) or "usage"
             ask_for  = missing
             follow_q = choose_natural_question(ask_for, answers, prefs).strip() or _fallback_question(missing)
-        prefs["pending_key"] = ask_for
-        prefs["last_question"] = follow_q
+        prefs.pending_key = ask_for
+        prefs.last_question = follow_q
         save_prefs(prefs)
         follow_q = format_question_for_ui(follow_q, answers)
         return jsonify({"mode": "ask", "reply": follow_q})
 
 
-    if ready and not prefs.get("extra_done"):
+    if ready and not prefs.extra_done:
         q = choose_natural_question("extra", answers, prefs)  
-        prefs["pending_key"] = "extra"
-        prefs["last_question"] = q
-        prefs["extra_done"] = True
+        prefs.pending_key = "extra"
+        prefs.last_question = q
+        prefs.extra_done = True
         save_prefs(prefs)
         return jsonify({"mode": "ask", "reply": q})
    
-    if prefs.get("stage") == "results" and not prefs.get("pending_key"):
+    if prefs.stage == "results" and not prefs.pending_key:
         ids = session.get("recent_ids") or []
         last_results = []
         if ids:
@@ -1350,7 +1755,7 @@ def chat():
         return jsonify({"mode": "followup", "reply": follow})
 
 
-    if any(word in user_input for word in ["ไหม", "ดีไหม", "เหมาะไหม", "คุ้มไหม", "หรือเปล่า", "ใช่ไหม"]):
+    if text_hits(user_input).has("open_question"):
         try:
             resp = client.chat.completions.create(
                 model="gpt-4o-mini",
@@ -1382,19 +1787,14 @@ def chat():
                 answers["series"] = root
     if answers.get("series"):
         sr = str(answers["series"]).lower()
-        if not df["series"].fillna("").astype(str).str.lower().str.contains(sr).any():
+        if not catalogue_vocab.has_series(sr):
             answers.pop("series", None)
     _series = str((answers or {}).get("series", "")).strip().lower()
     s_norm  = _series.replace(" ", "")  
     if _series in {"ไม่มี", "ไม่ระบุ", "อะไรก็ได้", "รุ่นไหนก็ได้", "แล้วแต่", "ไม่กำหนด"} \
     or s_norm in {"อะไรก็ได้".replace(" ", ""), "รุ่นไหนก็ได้".replace(" ", ""), "ไม่กำหนด"}: 
         answers.pop("series", None)
-    _body_from_now = None
-    btxt_now = f"{answers.get('usage_text','')} {user_input}".lower()
-    for _b, _kws in BODY_HINTS.items():
-        if any(w in btxt_now for w in _kws):
-            _body_from_now = _b
-            break
+    _body_from_now = detect_body(f"{answers.get('usage_text','')} {user_input}")
     if _body_from_now:
         answers["body"] = _body_from_now
 
@@ -1443,7 +1843,7 @@ def chat():
             print(f"FINAL >> {i}. {name} |  ราคา: {price:,.0f} บาท")
         except Exception:
             pass
-    gpt_explanations = rag_generate_answer(top_rows, user_input) if top_rows else []
+    gpt_explanations = rag_generate_answer(top_rows, user_input, answers=answers) if top_rows else []
 
     rendered, serializable = [], []
     for i, row in enumerate(top_rows):
@@ -1521,8 +1921,8 @@ def chat():
     except Exception:
        
         session["last_results"] = list(range(len(top_rows[:5])))
-    prefs["stage"] = "results"
-    prefs["pending_key"] = None
+    prefs.stage = "results"
+    prefs.pending_key = None
     save_prefs(prefs)
 
 
@@ -1532,20 +1932,18 @@ def chat():
         reply = "ขออภัยด้วยครับ ไม่มีรถที่มีสเปคที่คุณต้องการ แต่เราสามารถหาคำแนะนำใหม่ให้ได้ครับ"
 
     print("=== DEBUG FAISS (exactly the same as UI) ===")
-    _qemb = model.encode([combined_query]).astype("float32")
-    faiss.normalize_L2(_qemb)
-
-    for i, r in enumerate(top_rows[:5], 1):
+    shown = top_rows[:5]
+    need = [i for i, r in enumerate(shown) if r.get("_final_sc") is None]
+    rescored = {}
+    if need:
+        _qemb = encode_query(combined_query)
+        rids = [int(shown[i].get("row_id")) for i in need]
+        rescored = dict(zip(need, score_rows(_qemb[0], rids)))
+
+    for i, r in enumerate(shown, 1):
         try:
-            sc = r.get("_final_sc")
-            if sc is None:
-                rid = int(r.get("row_id"))
-                x = np.asarray(index.reconstruct(rid), dtype="float32")
-                sc = float(((_qemb[0] - x) ** 2).sum())
-            else:
-                sc = float(sc)
-
-            l2sq = sc
+            sc = rescored.get(i - 1, r.get("_final_sc"))
+            l2sq = float(sc)
             cos  = 1.0 - (l2sq / 2.0)
             legacy = 18.0 + 1.75 * l2sq
             name = str(r.get("full_name") or "")
@@ -1560,6 +1958,7 @@ def chat():
     
     
 @app.route("/followup", methods=["POST"])
+@requires_ready
 def followup():
     data = request.get_json(force=True) or {}
     user_input = (data.get("message") or "").strip()
@@ -0,0 +1,97 @@
+"""Benchmark + ตรวจความเท่ากัน: utils/body_type.py เทียบกับ detect_type เดิมของ data/type.py (.apply รายแถว)
+
+ข้อความสังเคราะห์แบบ scraped: สุ่ม series + description จาก Dataset.csv แล้วแทรก keyword ของประเภทอื่น
+ช่องว่างซ้ำ และตัวพิมพ์ใหญ่ ให้ลำดับความสำคัญของประเภทถูกใช้จริง
+
+รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.bench_body_type --rows 1000000
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.body_type import (BODY_TYPE_RULES, HATCHBACK_KEYWORDS, MPV_KEYWORDS, PICKUP_KEYWORDS,
+                             SEDAN_KEYWORDS, SUV_KEYWORDS, body_type_text, classify_body_type)
+
+DATASET = "data/Dataset.csv"
+NOISE = ["", " ", "  NEW ", " Pickup", " suvs", " Crossover ", " รถครอบครัว 7 ที่นั่ง", " CITY e:HEV", "\n"]
+
+
+def legacy_norm(s):
+    if pd.isna(s):
+        return ""
+    return re.sub(r"\s+", " ", str(s)).strip().lower()
+
+
+def legacy_detect_type(s: str) -> str:
+    """สำเนา detect_type เดิมจาก data/type.py"""
+    t = s
+    if any(re.search(k, t) if k.startswith(r"\b") else (k in t) for k in PICKUP_KEYWORDS):
+        return "Pickup"
+    if any(re.search(k, t) if k.startswith(r"\b") else (k in t) for k in SUV_KEYWORDS):
+        return "SUV"
+    if any(k in t for k in SEDAN_KEYWORDS):
+        return "Sedan"
+    if any(k in t for k in HATCHBACK_KEYWORDS):
+        return "Hatchback"
+    if any(k in t for k in MPV_KEYWORDS):
+        return "MPV"
+    return "Other"
+
+
+def legacy_classify(df):
+    text = (df["series"].apply(legacy_norm) + " " + df["description"].apply(legacy_norm)).str.strip()
+    return text.apply(legacy_detect_type)
+
+
+def synthetic(raw, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    body = raw[["series", "description"]].reset_index(drop=True)
+    df = body.iloc[rng.integers(0, len(body), rows)].reset_index(drop=True)
+    keywords = np.array([k for _, kws in BODY_TYPE_RULES for k in kws if not k.startswith("\\")] + NOISE,
+                        dtype=object)
+    extra = keywords[rng.integers(0, len(keywords), rows)]
+    # ครึ่งหนึ่งแทรก keyword/noise ท้ายรายละเอียด อีกส่วนตัดรายละเอียดสั้นลงให้หลายแถวตกเป็น Other
+    desc = df["description"].fillna("").astype(str)
+    cut = rng.integers(5, 200, rows)
+    short = pd.Series([d[:c] for d, c in zip(desc, cut)], dtype=object)
+    mixed = np.where(rng.random(rows) < 0.5, desc + " " + extra.astype(str), short)
+    df["description"] = pd.Series(mixed, dtype=object).str.upper().where(rng.random(rows) < 0.2, mixed)
+    df.loc[rng.random(rows) < 0.1, "series"] = np.nan
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--skip-legacy", action="store_true")
+    args = ap.parse_args()
+
+    raw = pd.read_csv(DATASET, encoding="utf-8-sig")
+    df = synthetic(raw, args.rows)
+
+    t0 = time.perf_counter()
+    text = body_type_text(df)
+    t_text = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    result = classify_body_type(text)
+    t_cls = time.perf_counter() - t0
+    print(f"{args.rows:,} แถว: ข้อความ {t_text:.2f}s + จัดประเภท {t_cls:.2f}s = {t_text + t_cls:.2f}s")
+    print(result["body_type"].value_counts().to_string())
+    print("keyword ที่ match บ่อยสุด:")
+    print(result["keyword"].value_counts().head(10).to_string())
+
+    if not args.skip_legacy:
+        t0 = time.perf_counter()
+        old = legacy_classify(df)
+        t_old = time.perf_counter() - t0
+        diff = (old != result["body_type"]).sum()
+        assert diff == 0, f"ประเภทต่างจากเดิม {diff} แถว"
+        print(f"legacy: {t_old:.2f}s (เร็วขึ้น {t_old / (t_text + t_cls):.1f}x, ประเภทเหมือนเดิมทุกแถว)")
+
+
+if __name__ == "__main__":
+    main()
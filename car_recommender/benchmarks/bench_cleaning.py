@@ -0,0 +1,235 @@
+"""Benchmark + ตรวจความเท่ากัน: load_and_clean_data แบบ vectorized เทียบกับแบบเดิม (.apply รายแถว)
+
+1) ผลบน data/Dataset.csv ต้องเหมือนของเดิมทุกค่า (assert_frame_equal)
+2) วัดเวลาบน dataset สังเคราะห์ (ค่าเริ่มต้น 1M แถว) ที่สุ่มแถวจาก Dataset.csv แล้วสลับรูปแบบ
+   ข้อความ type / fuel_type / engine ให้ทุกกิ่งของกฎถูกใช้ และตรวจความเท่ากันบนชุดนี้ด้วย
+
+รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.bench_cleaning --rows 1000000
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_body_type import legacy_detect_type, legacy_norm
+from utils.process_data import clean_frame
+
+DATASET = "data/Dataset.csv"
+
+TYPE_VARIANTS = [
+    "Sedan", "  sedan ", "รถเก๋ง", "Hatchback", "แฮทช์แบ็ค", "Pickup", "กระบะ 4 ประตู", "ปิคอัพ",
+    "SUV", "Compact  SUV", "เอสยูวี", "MPV", "รถตู้", "Wagon", "Coupe", "Other", "crossover", None,
+]
+FUEL_VARIANTS = [
+    "ดีเซล", " Diesel ", "เบนซิน", "Gasoline", "ไฮบริด", "e:HEV", "EV", "PHEV", "E20",
+    "ดีเซล , ไบโอดีเซล B5", "เบนซิน 95 , แก๊สโซฮอล์ 91", None,
+]
+ENGINE_VARIANTS = [
+    "เครื่องยนต์ 1.5 ลิตร 4 สูบ", "2.4L turbo", "เครื่องยนต์ 2 .0 ลิตร เทอร์โบคู่", "1 . 2 VVT-i",
+    "มอเตอร์ไฟฟ้า", None,
+]
+
+
+def legacy_clean_frame(df):
+    """สำเนา load_and_clean_data เดิม (ก่อนเปลี่ยนเป็น vectorized) ตัดแค่บรรทัด read_csv ออก
+    และเติม type ที่ว่างแบบรายแถวตามที่ clean_frame ทำภายหลัง"""
+
+    # รีเนมคอลัมน์หลัก
+    df = df.rename(columns={
+        "Model Name": "full_name",
+        "Price": "price_thb",
+        "Details": "description",
+        "model": "make",
+        "engine": "engine",
+        "horsepower_hp": "horsepower_hp",
+        "gears": "gears",
+        "fuel_type": "fuel_type",
+    })
+
+    #ทำความสะอาดราคา 
+    df = df.dropna(subset=["full_name", "price_thb", "description", "make"])
+    df = df[df["description"].astype(str).str.strip() != ""]
+
+    df["price_thb"] = (
+        df["price_thb"].astype(str)
+        .str.replace("บาท", "", regex=False)
+        .str.replace(",", "", regex=False)
+        .str.replace("฿", "", regex=False)
+        .str.strip()
+    )
+    df["price_thb"] = pd.to_numeric(df["price_thb"], errors="coerce")
+    df = df.dropna(subset=["price_thb"])
+    df["price_thb"] = df["price_thb"].astype(int)
+
+    for col in ["engine_l", "horsepower_hp", "gears", "fuel_type"]:
+        if col not in df.columns:
+            df[col] = np.nan
+
+    #horsepower_hp
+    df["horsepower_hp"] = (
+        df["horsepower_hp"]
+        .astype(str)
+        .str.replace("แรงม้า", "", regex=False)
+        .str.extract(r"(\d+)", expand=False)
+    )
+    df["horsepower_hp"] = pd.to_numeric(df["horsepower_hp"], errors="coerce")
+
+    #gears
+    df["gears"] = (
+        df["gears"]
+        .astype(str)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+    df.loc[df["gears"].str.lower().isin(["nan", "none", ""]), "gears"] = np.nan
+
+    #engine_cc:
+    if "engine_cc" in df.columns:
+        cc_num = (
+            df["engine_cc"].astype(str)
+            .str.replace(",", "", regex=False)
+            .str.replace("CC", "", regex=False)
+            .str.extract(r"(\d+)", expand=False)
+        )
+        cc_num = pd.to_numeric(cc_num, errors="coerce")
+        df["engine_cc"] = cc_num.astype("Int64")
+
+        liters_from_cc = cc_num / 1000.0
+        df["engine_l"] = df["engine_l"].fillna(liters_from_cc)
+
+    #engine: 
+    if "engine" in df.columns:
+        def _parse_engine_l(x):
+            if pd.isna(x):
+                return np.nan
+            s = str(x).replace(" .", ".")
+            m = re.search(r"(\d+(?:\.\d+)?)\s*(?:L|ลิตร)", s, flags=re.I)
+            if m:
+                try:
+                    return float(m.group(1))
+                except:
+                    return np.nan
+            m2 = re.search(r"(\d)\s*\.\s*(\d)", s)  
+            if m2:
+                try:
+                    return float(f"{m2.group(1)}.{m2.group(2)}")
+                except:
+                    return np.nan
+            return np.nan
+
+        df["engine_l"] = df["engine_l"].fillna(df["engine"].apply(_parse_engine_l))
+
+    #year
+    if "year_from_model_name" in df.columns:
+        year_num = pd.to_numeric(df["year_from_model_name"], errors="coerce")
+        df["year"] = year_num.astype("Int64")
+    elif "year" in df.columns:
+        df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
+    else:
+        df["year"] = pd.Series([pd.NA] * len(df), dtype="Int64")
+
+    #series
+    if "series" in df.columns:
+        df["series"] = df["series"].astype(str).str.strip()
+        df.loc[df["series"].isin(["", "nan", "None"]), "series"] = np.nan
+    else:
+        df["series"] = np.nan
+
+    #normalize fuel_type 
+    def _normalize_fuel(x):
+        if pd.isna(x): return x
+        s = str(x).strip().lower()
+        mapping = {
+            "ดีเซล": "Diesel", "diesel": "Diesel",
+            "เบนซิน": "Petrol", "gasoline": "Petrol", "petrol": "Petrol",
+            "ไฟฟ้า": "EV", "electric": "EV", "bev": "EV", "ev": "EV",
+            "ไฮบริด": "Hybrid", "hybrid": "Hybrid", "hev": "Hybrid", "e:hev": "Hybrid",
+            "ปลั๊กอินไฮบริด": "PHEV", "plug-in hybrid": "PHEV", "phev": "PHEV",
+            "e20": "E20", "e85": "E85", "cng": "CNG", "lpg": "LPG", "mhev": "MHEV", "mild hybrid": "MHEV"
+        }
+        return mapping.get(s, x)
+    df["fuel_type"] = df["fuel_type"].apply(_normalize_fuel)
+    #ody type
+    CANONICAL_TYPES = {
+        "sedan": "sedan", "ซีดาน": "sedan", "รถเก๋ง": "sedan", "เก๋ง": "sedan",
+        "hatchback": "hatchback", "แฮทช์แบ็ก": "hatchback", "แฮทช์แบ็ค": "hatchback",
+        "pickup": "pickup", "ปิคอัพ": "pickup", "ปิกอัพ": "pickup", "กระบะ": "pickup",
+        "suv": "suv", "เอสยูวี": "suv", "รถอเนกประสงค์": "suv",
+        "mpv": "mpv", "รถตู้": "van", "van": "van", "wagon": "wagon",
+        "coupe": "coupe", "คูเป้": "coupe", "convertible": "convertible"
+    }
+
+    def _normalize_type(x: str):
+        if pd.isna(x):
+            return x
+        s = str(x).strip().lower()
+        s = re.sub(r"\s+", " ", s)
+        if s in CANONICAL_TYPES:
+            return CANONICAL_TYPES[s]
+        for key, val in CANONICAL_TYPES.items():
+            if key in s:
+                return val
+        return s 
+
+    # เติม type ที่ว่างด้วย detect_type เดิมของ data/type.py (กฎเดียวกับ utils/body_type.py)
+    if "type" not in df.columns:
+        df["type"] = np.nan
+    missing = df["type"].isna()
+    if missing.any():
+        text = (df.loc[missing, "series"].apply(legacy_norm) + " "
+                + df.loc[missing, "description"].apply(legacy_norm)).str.strip()
+        guessed = text.apply(legacy_detect_type)
+        df["type"] = df["type"].astype(object)
+        df.loc[missing, "type"] = guessed.where(guessed != "Other")
+    df["type"] = df["type"].apply(_normalize_type)
+
+    df = df.drop_duplicates(subset=["full_name", "make", "price_thb", "description"])
+
+    return df
+
+
+def synthetic(raw, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    body = raw.dropna(subset=["full_name"]).reset_index(drop=True)
+    df = body.iloc[rng.integers(0, len(body), rows)].reset_index(drop=True)
+    df["type"] = np.array(TYPE_VARIANTS, dtype=object)[rng.integers(0, len(TYPE_VARIANTS), rows)]
+    df["fuel_type"] = np.array(FUEL_VARIANTS, dtype=object)[rng.integers(0, len(FUEL_VARIANTS), rows)]
+    df["engine"] = np.array(ENGINE_VARIANTS, dtype=object)[rng.integers(0, len(ENGINE_VARIANTS), rows)]
+    # ให้ราว 40% ไม่มี engine_cc จะได้ไปใช้การแยกลิตรจากข้อความ engine
+    df.loc[rng.random(rows) < 0.4, "engine_cc"] = np.nan
+    # ให้ไม่ซ้ำกันส่วนใหญ่ (drop_duplicates ไม่ตัดทิ้งจนเหลือน้อย)
+    df["full_name"] = df["full_name"].astype(str) + " #" + pd.Series(np.arange(rows)).astype(str)
+    return df
+
+
+def timed(fn, df):
+    t0 = time.perf_counter()
+    out = fn(df.copy())
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--skip-legacy", action="store_true", help="วัดเฉพาะแบบใหม่ (แบบเดิมช้ามากที่ 1M แถว)")
+    args = ap.parse_args()
+
+    raw = pd.read_csv(DATASET, encoding="utf-8-sig")
+    pd.testing.assert_frame_equal(legacy_clean_frame(raw.copy()), clean_frame(raw.copy()))
+    print(f"{DATASET}: ผลเหมือนเดิมทุกค่า ({len(raw)} แถว)")
+
+    df = synthetic(raw, args.rows)
+    new, t_new = timed(clean_frame, df)
+    print(f"synthetic {args.rows:,} แถว -> {len(new):,} แถว")
+    print(f"  vectorized: {t_new:.2f}s")
+    if not args.skip_legacy:
+        old, t_old = timed(legacy_clean_frame, df)
+        pd.testing.assert_frame_equal(old, new)
+        print(f"  legacy    : {t_old:.2f}s  (เร็วขึ้น {t_old / t_new:.1f}x, ผลเหมือนกัน)")
+
+
+if __name__ == "__main__":
+    main()
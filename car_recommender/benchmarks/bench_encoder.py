@@ -0,0 +1,75 @@
+"""Benchmark ต่อ backend ของ encoder: latency ต่อ query เดี่ยว และหน่วยความจำ (RSS)
+
+แต่ละ backend รันใน process แยกเพื่อให้ RSS ไม่ปนกัน
+รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.bench_encoder --backends torch onnx onnx-int8
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.encoder_parity import QUERIES
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def run_one(backend, rounds):
+    from utils.encoders import load_encoder
+
+    base = rss_mb()
+    t0 = time.perf_counter()
+    enc = load_encoder(backend)
+    load_s = time.perf_counter() - t0
+    enc.encode(["warmup"])
+
+    lat = []
+    for _ in range(rounds):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            enc.encode([q])
+            lat.append((time.perf_counter() - t0) * 1000)
+    lat = np.array(lat)
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p95_ms": round(float(np.percentile(lat, 95)), 2),
+        "rss_mb": round(rss_mb(), 1),
+        "model_rss_mb": round(rss_mb() - base, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(run_one(args.child, args.rounds)))
+        return
+
+    print(f"{'backend':10s} {'load s':>7s} {'p50 ms':>7s} {'p95 ms':>7s} {'RSS MB':>7s} {'model MB':>8s}")
+    for backend in args.backends:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_encoder", "--child", backend, "--rounds", str(args.rounds)],
+            capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{r['backend']:10s} {r['load_s']:7.2f} {r['p50_ms']:7.2f} {r['p95_ms']:7.2f} "
+              f"{r['rss_mb']:7.1f} {r['model_rss_mb']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
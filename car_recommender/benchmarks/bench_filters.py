@@ -0,0 +1,115 @@
+"""Microbenchmark: กรอง candidate จาก FAISS แบบวนทีละแถว (เดิม) เทียบกับ mask ของ CatalogueFilters
+
+รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.bench_filters --scale 100
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.retrieval import BODY_MAP, CatalogueFilters, split_makes
+
+QUERIES = [
+    dict(price_min=0, price_max=800_000, target_make="toyota", trans="AT"),
+    dict(price_min=700_000, price_max=1_200_000, body="pickup", trans="MT"),
+    dict(price_min=None, price_max=None, target_make="honda", target_series="city"),
+    dict(price_min=0, price_max=1_000_000, exclude_body="pickup", trans="AT"),
+    dict(price_min=1_000_000, price_max=2_000_000, body="suv"),
+]
+
+
+def legacy_filter(df, ids, top_n, price_min=None, price_max=None, target_make=None,
+                  target_series=None, body=None, trans=None, exclude_body=None):
+    """สำเนาลูปกรองเดิมของ search_similar_rows"""
+    def _row_is_body(row, want):
+        t = (row.get("type_norm") or row.get("type") or "").strip().lower()
+        t = BODY_MAP.get(t, t)
+        return (t == want) if want else True
+
+    out = []
+    for idx in ids:
+        if idx >= len(df):
+            continue
+        row = df.iloc[idx]
+        if exclude_body and _row_is_body(row, exclude_body):
+            continue
+        if body and not _row_is_body(row, body):
+            continue
+        price = float(row["price_thb"])
+        series_in_row = str(row.get("series", "")).strip().lower()
+        make_in_row = str(row.get("make", "")).strip().lower()
+        if trans:
+            name_lc = f"{row.get('full_name','')} {row.get('series','')} {row.get('description','')} {row.get('gears','')}".lower()
+            if trans == "MT":
+                if any(k in name_lc for k in ["a/t", " auto", "ออโต้", "cvt", "dct"]):
+                    continue
+                if re.search(r'\b\d+\s*at\b', name_lc) or re.search(r'\bat\b', name_lc):
+                    continue
+            if trans == "AT":
+                if any(k in name_lc for k in ["m/t", " manual", "ธรรมดา"]):
+                    continue
+                if re.search(r'\b\d+\s*mt\b', name_lc) or re.search(r'\bmt\b', name_lc):
+                    continue
+        if target_make:
+            car_name = (str(row.get("full_name", "")) + " " + make_in_row).lower()
+            if not any(m in car_name for m in split_makes(target_make)):
+                continue
+        if target_series and str(target_series).strip().lower() not in series_in_row:
+            continue
+        if price_min is not None and price < float(price_min):
+            continue
+        if price_max is not None and price > float(price_max):
+            continue
+        out.append(int(idx))
+        if len(out) >= top_n:
+            break
+    return out
+
+
+def mask_filter(filters, ids, top_n, **q):
+    allowed = filters.mask(**q)
+    ids = ids[(ids >= 0) & (ids < filters.n)]
+    return ids[allowed[ids]][:top_n].tolist()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default="embeddings/clean_data.csv")
+    ap.add_argument("--scale", type=int, default=100)
+    ap.add_argument("--k", type=int, default=2000, help="จำนวน candidate ที่จำลองว่าได้จาก FAISS")
+    ap.add_argument("--top-n", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    base = pd.read_csv(args.csv)
+    df = pd.concat([base] * args.scale, ignore_index=True)
+    df["type_norm"] = df["type"].fillna("").astype(str).str.lower().str.strip()
+    print(f"rows: {len(df):,}")
+
+    t0 = time.perf_counter()
+    filters = CatalogueFilters(df)
+    print(f"CatalogueFilters build: {(time.perf_counter() - t0) * 1000:.1f} ms (ครั้งเดียวตอนโหลด)")
+
+    rng = np.random.default_rng(0)
+    cands = [rng.choice(len(df), size=min(args.k, len(df)), replace=False) for _ in range(args.repeat)]
+
+    for q in QUERIES:
+        legacy_t = mask_t = 0.0
+        for ids in cands:
+            t0 = time.perf_counter()
+            a = legacy_filter(df, ids, args.top_n, **q)
+            legacy_t += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            b = mask_filter(filters, ids, args.top_n, **q)
+            mask_t += time.perf_counter() - t0
+            assert a == b, (q, a, b)
+        n = len(cands)
+        print(f"{q}\n  loop: {legacy_t / n * 1000:8.2f} ms/query   mask: {mask_t / n * 1000:8.3f} ms/query"
+              f"   x{legacy_t / max(mask_t, 1e-9):.0f}")
+
+
+if __name__ == "__main__":
+    main()
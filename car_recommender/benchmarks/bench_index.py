@@ -0,0 +1,119 @@
+"""Benchmark ชนิดของ FAISS index (Flat / HNSW32 / IVF-Flat / IVF-PQ) บน catalogue สังเคราะห์
+
+เวกเตอร์ตั้งต้นคือ embedding ของ catalogue จริง (จาก Dataset.csv ผ่าน process_data) แล้วขยายเป็น N แถว
+ด้วยการสุ่มแถวต้นแบบ + noise แล้ว normalize ใหม่ query สร้างแบบเดียวกันจากแถวต้นแบบ
+รายงาน recall@5 เทียบ Flat, latency ต่อ query (p50/p99), เวลา build และขนาด index
+
+รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.bench_index --sizes 10000 100000 --ef-search 64 --nprobe 16
+    python -m benchmarks.bench_index --sizes 100000 --filter-frac 0.2   # ค้นผ่าน IDSelector แบบใน app
+"""
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+
+from utils.indexer import EMBEDDINGS_FILE, INDEX_KINDS, build_index, factory_string
+from utils.retrieval import configure_index, search_params
+
+K = 5
+
+
+def base_vectors(store="embeddings/catalogue", legacy_index="embeddings/faiss_index.idx"):
+    path = os.path.join(store, EMBEDDINGS_FILE)
+    if os.path.exists(path):
+        return np.load(path)
+    index = faiss.read_index(legacy_index)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def synthesize(base, n, noise, rng):
+    """สุ่มแถวต้นแบบแล้วบวก noise (สัดส่วนต่อความยาวเวกเตอร์) จากนั้น normalize"""
+    d = base.shape[1]
+    out = base[rng.integers(0, len(base), n)].astype(np.float32)
+    out += rng.normal(0, noise / np.sqrt(d), size=out.shape).astype(np.float32)
+    faiss.normalize_L2(out)
+    return out
+
+
+def recall_at_k(found, truth):
+    hits = [len(set(f[f >= 0]) & set(t[t >= 0])) / max(1, min(K, (t >= 0).sum()))
+            for f, t in zip(found, truth)]
+    return float(np.mean(hits))
+
+
+def run(kind, emb, ids, queries, truth, ef_search, nprobe, sel):
+    t0 = time.perf_counter()
+    index = build_index(kind, emb, ids)
+    build_s = time.perf_counter() - t0
+    configure_index(index, ef_search=ef_search, nprobe=nprobe)
+    size_mb = len(faiss.serialize_index(index)) / 1e6
+
+    # แอปค้นทีละ query จึงวัด latency แบบ query เดี่ยว
+    faiss.omp_set_num_threads(1)
+    lat = []
+    found = np.empty((len(queries), K), dtype=np.int64)
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        _, I = index.search(q[None, :], K, params=search_params(index, sel))
+        lat.append((time.perf_counter() - t0) * 1000)
+        found[i] = I[0]
+    faiss.omp_set_num_threads(os.cpu_count() or 1)
+    lat = np.asarray(lat)
+    return {
+        "kind": kind,
+        "factory": factory_string(kind, emb.shape[1], len(emb)),
+        "recall@5": round(recall_at_k(found, truth), 4),
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        "build_s": round(build_s, 2),
+        "size_mb": round(size_mb, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000])
+    ap.add_argument("--kinds", nargs="+", default=list(INDEX_KINDS), choices=INDEX_KINDS)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--noise", type=float, default=0.3)
+    ap.add_argument("--ef-search", type=int, default=64)
+    ap.add_argument("--nprobe", type=int, default=16)
+    ap.add_argument("--filter-frac", type=float, default=0.0,
+                    help="สัดส่วนแถวที่ผ่านตัวกรอง (0 = ไม่กรอง)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base = base_vectors()
+    print(f"base vectors: {base.shape}")
+    for n in args.sizes:
+        emb = synthesize(base, n, args.noise, rng)
+        # id แบบ hash เหมือน utils/indexer.py (ไม่ต่อเนื่อง)
+        ids = rng.choice(np.iinfo(np.int64).max, size=n, replace=False).astype(np.int64)
+        queries = synthesize(base, args.queries, args.noise, rng)
+
+        sel = None
+        allowed = np.ones(n, dtype=bool)
+        if args.filter_frac > 0:
+            allowed = rng.random(n) < args.filter_frac
+            sel = faiss.IDSelectorBatch(ids[allowed])
+
+        # ground truth: exact search เฉพาะแถวที่ผ่านตัวกรอง
+        flat = faiss.IndexFlatL2(emb.shape[1])
+        flat.add(emb[allowed])
+        _, gt = flat.search(queries, K)
+        truth = np.where(gt >= 0, ids[np.flatnonzero(allowed)][np.maximum(gt, 0)], -1)
+
+        print(f"\n=== n={n:,} queries={args.queries} filter_frac={args.filter_frac or 1.0} ===")
+        print(f"{'kind':9} {'factory':22} {'recall@5':>9} {'p50_ms':>8} {'p99_ms':>8} {'build_s':>8} {'size_mb':>8}")
+        for kind in args.kinds:
+            r = run(kind, emb, ids, queries, truth, args.ef_search, args.nprobe, sel)
+            print(f"{r['kind']:9} {r['factory']:22} {r['recall@5']:>9} {r['p50_ms']:>8} "
+                  f"{r['p99_ms']:>8} {r['build_s']:>8} {r['size_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
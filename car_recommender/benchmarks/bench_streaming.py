@@ -0,0 +1,90 @@
+"""เทียบหน่วยความจำสูงสุด: load_and_clean_data (อ่านทั้งไฟล์) กับ iter_clean_chunks (streaming)
+
+สร้าง CSV สังเคราะห์จาก Dataset.csv (ดู benchmarks/bench_cleaning.py) แล้ววัดแต่ละโหมดใน process แยก
+(ru_maxrss ของ process ลูก) พร้อมตรวจว่าแถวที่ได้เหมือนกันด้วย hash ของทั้งตาราง
+ไม่ encode จริง: วัดเฉพาะการอ่าน + ทำความสะอาด + ตัดแถวซ้ำ + เขียน store (CatalogueWriter)
+
+รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.bench_streaming --rows 2000000 --chunksize 100000
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.bench_cleaning import DATASET, synthetic
+
+
+def _digest(df):
+    return int(pd.util.hash_pandas_object(df.reset_index(drop=True).astype(str), index=False).sum())
+
+
+def run_mode(mode, csv_path, chunksize, out_dir):
+    from utils.catalogue_store import CatalogueWriter, write_catalogue
+    from utils.process_data import iter_clean_chunks, load_and_clean_data
+
+    t0 = time.perf_counter()
+    digest = rows = 0
+    if mode == "full":
+        df = load_and_clean_data(csv_path)
+        digest, rows = _digest(df), len(df)
+        write_catalogue(df, out_dir)
+    else:
+        writer = CatalogueWriter(out_dir)
+        for df in iter_clean_chunks(csv_path, chunksize):
+            digest += _digest(df)
+            rows += len(df)
+            writer.append(df)
+        writer.close()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode}\t{rows}\t{digest % 2**64}\t{time.perf_counter() - t0:.2f}\t{peak_mb:.0f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--chunksize", type=int, default=100_000)
+    ap.add_argument("--mode", choices=["full", "stream"], help=argparse.SUPPRESS)
+    ap.add_argument("--csv", help=argparse.SUPPRESS)
+    ap.add_argument("--out", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.mode:
+        run_mode(args.mode, args.csv, args.chunksize, args.out)
+        return
+
+    work = tempfile.mkdtemp(prefix="bench_streaming_")
+    try:
+        csv_path = os.path.join(work, "dump.csv")
+        raw = pd.read_csv(DATASET, encoding="utf-8-sig", dtype=str)
+        synth = synthetic(raw, args.rows)
+        # แถวซ้ำทั้งแถวกระจายทั่วไฟล์ ให้การตัดแถวซ้ำข้าม chunk ถูกใช้จริง
+        dup = synth.sample(frac=0.1, random_state=1)
+        synth = pd.concat([synth, dup]).sample(frac=1.0, random_state=2)
+        synth.to_csv(csv_path, index=False, encoding="utf-8-sig")
+        del raw, synth, dup
+        print(f"CSV {os.path.getsize(csv_path) / 1e6:,.0f} MB, chunksize {args.chunksize:,}")
+
+        results = {}
+        for mode in ("full", "stream"):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_streaming", "--mode", mode, "--csv", csv_path,
+                 "--chunksize", str(args.chunksize), "--out", os.path.join(work, mode)],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().splitlines()[-1]
+            name, rows, digest, secs, peak = out.split("\t")
+            results[mode] = (int(rows), digest)
+            print(f"  {name:6}: {int(rows):,} แถว  {secs}s  peak RSS {peak} MB")
+        assert results["full"] == results["stream"], results
+        print("ผลเหมือนกัน (จำนวนแถวและ hash ของทั้งตาราง)")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark: วิเคราะห์ข้อความแชตหนึ่ง turn ด้วย KeywordMatcher (Aho-Corasick รอบเดียว) เทียบกับ
+การเช็ก `word in text` ทีละคำแบบ helper เดิมใน app.py และตรวจว่าผลเท่ากันทุกข้อความ
+
+vocabulary เป็นสำเนาจาก app.py (ไม่ import app เพราะจะโหลดโมเดลและ catalogue)
+--extra N เติมคำสุ่ม N คำต่อ vocabulary เพื่อดูว่าเวลาต่อ turn โตตามจำนวนคำแค่ไหน
+
+รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.bench_text_match --extra 0 100 1000
+"""
+import argparse
+import random
+import time
+
+from utils.text_match import KeywordMatcher
+
+VOCABS = {
+    "usage": ["ครอบครัว", "เดินทางไกล", "ในเมือง", "ออฟโรด", "บรรทุก", "ประหยัดน้ำมัน", "แรง", "กว้าง",
+              "คอมแพค", "suv", "ซีดาน", "กระบะ", "mpv", "ขนของ", "ขึ้นเขา"],
+    "trans": {"AT": ["ออโต้", "อัตโนมัติ", "auto", "at", "cvt", "dct", "เกียร์อัตโนมัติ"],
+              "MT": ["ธรรมดา", "เกียร์ธรรมดา", "manual", "mt"]},
+    "body": {"suv": ["suv", "เอสยูวี"], "sedan": ["ซีดาน", "sedan", "เก๋ง", "รถเก๋ง"],
+             "hatchback": ["แฮทช์", "hatch"], "mpv": ["mpv", "ครอบครัว", "7ที่นั่ง", "7 ที่นั่ง", "อเนกประสงค์"],
+             "pickup": ["กระบะ", "ปิคอัพ", "ปิกอัพ", "pickup", "รถกระบะ"]},
+    "fuel": {"diesel": ["ดีเซล", "diesel"], "petrol": ["เบนซิน", "gasoline", "petrol"],
+             "hybrid": ["ไฮบริด", "hev", "mhev", "phev", "ปลั๊กอิน"], "ev": ["ไฟฟ้า", "ev", "bev"]},
+    "drive": {"4WD/AWD": ["4wd", "awd", "ขับสี่"], "FWD": ["ขับหน้า", "fwd"], "RWD": ["ขับหลัง", "rwd"]},
+    "no": ["ไม่มี", "ไม่เน้น", "อะไรก็ได้", "เฉยๆ", "เฉย ๆ", "ยัง", "ไม่", "ข้าม"],
+    "efficiency": ["ประหยัด", "กินน้ำมัน", "อัตราสิ้นเปลือง", "กม/ลิตร", "km/l"],
+    "compare": ["เทียบ", "ต่างกัน", "vs", "เปรียบเทียบ"],
+    "open_question": ["ไหม", "ดีไหม", "เหมาะไหม", "คุ้มไหม", "หรือเปล่า", "ใช่ไหม"],
+    "not_usage": ["แรงม้า", "แรงสุด", "เร็ว", "ความเร็ว", "0-100", "แรง", "เกียร์", "ออโต้", "อัตโนมัติ",
+                  "ธรรมดา", "manual", "mt", "at", "cvt", "dct"],
+    "new_start": ["เริ่มใหม่", "เริ่มต้นใหม่", "เริ่มต้นการค้นหาใหม่", "เริ่มระบบใหม่", "อยากเริ่มใหม่",
+                  "อยากได้คำแนะนำใหม่", "อยากให้แนะนำใหม่", "แนะนำใหม่", "หารถใหม่ให้หน่อย", "อยากหารถใหม่",
+                  "ขอเริ่มใหม่", "ขอคำแนะนำใหม่"],
+    "reset": ["เริ่มใหม่", "เริ่มต้นใหม่", "รีเซ็ต", "reset", "เริ่มระบบใหม่", "ขอใหม่", "หาใหม่", "แนะนำอีกที",
+              "ขอคำแนะนำใหม่", "สุ่มใหม่", "อีก 5 คัน", "แนะนำชุดใหม่"],
+}
+
+MESSAGES = [
+    "อยากได้รถ SUV ดีเซล เกียร์ออโต้ งบ 1 ล้าน ใช้กับครอบครัว เดินทางไกลบ่อย",
+    "ขอรถเก๋งประหยัดน้ำมัน ในเมือง ไม่เกิน 8 แสน",
+    "กระบะ 4WD ขับสี่ บรรทุกของหนัก ขึ้นเขา",
+    "Toyota Yaris กับ Honda City ต่างกันยังไง เปรียบเทียบให้หน่อย",
+    "คันที่ 2 กินน้ำมันกี่ กม/ลิตร",
+    "ไม่มี",
+    "อะไรก็ได้ครับ",
+    "รถไฟฟ้า EV ชาร์จไวไหม คุ้มไหม",
+    "ขอคำแนะนำใหม่ เริ่มใหม่หมดเลย",
+    "manual ก็ได้ ชอบขับ mt แรงม้าเยอะๆ 0-100 เร็วๆ",
+    "hybrid หรือ phev ดีกว่ากัน สำหรับคนทำงานในเมือง",
+    "mpv 7 ที่นั่ง ครอบครัวใหญ่ กว้างๆ",
+    "budget around 1.5m, awd preferred, petrol or hybrid, compact suv for city use",
+    "ซีดาน หรือ hatch ก็ได้ ขับหน้า ประหยัด",
+]
+
+
+def legacy_analyze(text, vocabs):
+    t = text.lower()
+    out = {}
+    for vocab, entries in vocabs.items():
+        if isinstance(entries, dict):
+            out[vocab] = [k for k, kws in entries.items() if any(w in t for w in kws)]
+        else:
+            out[vocab] = [w for w in entries if w in t]
+    return out
+
+
+def matcher_analyze(text, matcher, vocabs):
+    hits = matcher.scan(text.lower())
+    return {vocab: hits.keys(vocab) for vocab in vocabs}
+
+
+def with_extra(n, seed=0):
+    if not n:
+        return VOCABS
+    rng = random.Random(seed)
+    alphabet = "กขคงจฉชซญดตถทนบปผพฟมยรลวสหอฮะาิีึืุูเแโใไ่้๊๋abcdefghijklmnopqrstuvwxyz"
+
+    def word():
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(4, 10)))
+
+    out = {}
+    for vocab, entries in VOCABS.items():
+        if isinstance(entries, dict):
+            out[vocab] = {k: kws + [word() for _ in range(n // len(entries))] for k, kws in entries.items()}
+        else:
+            out[vocab] = entries + [word() for _ in range(n)]
+    return out
+
+
+def per_turn_us(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for m in MESSAGES:
+            fn(m)
+    return (time.perf_counter() - t0) / (repeat * len(MESSAGES)) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--extra", nargs="+", type=int, default=[0, 100, 1000])
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    print(f"{'extra/vocab':>11} {'words':>7} {'legacy_us':>10} {'scan_us':>8} {'cached_us':>9}")
+    for n in args.extra:
+        vocabs = with_extra(n)
+        words = sum(len(sum(e.values(), [])) if isinstance(e, dict) else len(e) for e in vocabs.values())
+        cold = KeywordMatcher(vocabs, cache_size=0)
+        warm = KeywordMatcher(vocabs)
+        for m in MESSAGES:
+            assert matcher_analyze(m, cold, vocabs) == legacy_analyze(m, vocabs), m
+        legacy = per_turn_us(lambda m: legacy_analyze(m, vocabs), args.repeat)
+        scan = per_turn_us(lambda m: matcher_analyze(m, cold, vocabs), args.repeat)
+        cached = per_turn_us(lambda m: matcher_analyze(m, warm, vocabs), args.repeat)
+        print(f"{n:>11} {words:>7} {legacy:>10.1f} {scan:>8.1f} {cached:>9.1f}")
+    print("ผลเท่ากับการเช็กทีละคำทุกข้อความ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Parity check: backend ของ encoder ต้องได้ top-5 จาก FAISS index ตรงกับ PyTorch
+
+รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.encoder_parity --backends onnx onnx-int8
+"""
+import argparse
+
+import faiss
+import numpy as np
+
+from utils.encoders import load_encoder
+
+QUERIES = [
+    "รถครอบครัว ไม่เกิน 1 ล้าน",
+    "กระบะ ดีเซล ขับสี่ ลุยได้",
+    "รถเก๋งประหยัดน้ำมัน ขับในเมือง",
+    "toyota yaris ออโต้",
+    "suv 7 ที่นั่ง เดินทางไกล",
+    "honda city e:hev ไฮบริด",
+    "รถเล็ก จอดง่าย มือใหม่",
+    "isuzu d-max ขนของ บรรทุก",
+    "mazda 2 hatchback สวยๆ",
+    "ford ranger raptor แรงๆ",
+    "mitsubishi xpander mpv",
+    "nissan almera งบ 6 แสน",
+]
+# สัดส่วน top-5 ที่ต้องตรงกับ torch โดยเฉลี่ย
+MIN_AGREEMENT = {"onnx": 1.0, "onnx-int8": 0.8}
+
+
+def top5(encoder, index):
+    emb = encoder.encode(QUERIES).astype("float32")
+    faiss.normalize_L2(emb)
+    _, ids = index.search(emb, 5)
+    return ids
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", default="embeddings/faiss_index.idx")
+    ap.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"])
+    args = ap.parse_args()
+
+    index = faiss.read_index(args.index)
+    ref = top5(load_encoder("torch"), index)
+
+    failed = []
+    for backend in args.backends:
+        got = top5(load_encoder(backend), index)
+        overlap = np.array([len(set(a) & set(b)) / 5 for a, b in zip(ref, got)])
+        exact = int(sum((a == b).all() for a, b in zip(ref, got)))
+        need = MIN_AGREEMENT.get(backend, 1.0)
+        ok = overlap.mean() >= need
+        print(f"{backend:10s} top-5 agreement {overlap.mean():.3f} (min {overlap.min():.1f}) "
+              f"same order {exact}/{len(QUERIES)}  [{'OK' if ok else 'FAIL'} >= {need}]")
+        for q, o in zip(QUERIES, overlap):
+            if o < 1.0:
+                print(f"    {o:.1f}  {q}")
+        if not ok:
+            failed.append(backend)
+
+    assert not failed, f"top-5 parity failed for: {', '.join(failed)}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""ตรวจ parser แบบกฎของ extract_answers (tier 1) กับข้อความที่เคยพลาด
+
+- ข้อความที่กฎอธิบายได้ครบต้องไม่เรียก LLM และต้องได้ค่าตามที่คาด
+- คำละตินที่อยู่กลางคำที่ยาวกว่าต้องไม่ถูกนับเป็นคำตอบ (เช่น "at" ใน "hatchback" ไม่ใช่เกียร์ AT)
+
+import app จึงโหลด catalogue และโมเดลตามปกติ รันจากโฟลเดอร์ car_recommender:
+    python -m benchmarks.rule_extract_check
+"""
+import app as A
+
+# (ข้อความ, ค่าที่ต้องได้ใน answers, ต้องข้าม LLM หรือไม่)
+CASES = [
+    ("toyota ออโต้ ดีเซล ในเมือง",
+     {"make": "toyota", "trans": "AT", "fuel": "diesel", "usage_text": "ในเมือง", "usage": ["ในเมือง"]}, True),
+    ("ขอรถ hatchback ในเมือง", {"usage": ["ในเมือง"], "body": "hatchback"}, None),
+    ("งบ 8 แสน ขับหน้า เบนซิน", {"price": (700000, 900000), "drive": "FWD", "fuel": "petrol"}, True),
+    # ราคาต้องมาจากวลีราคา ไม่ใช่ตัวเลขแรกของข้อความ และ "2" ใน "1.2 ล้าน" ไม่ใช่รุ่น
+    ("อยากได้รถครอบครัว 7 ที่นั่ง งบ 1.2 ล้าน", {"price": (1100000, 1300000), "series": None, "body": "mpv"}, None),
+    ("mazda 2 hatchback งบ 6 แสน", {"make": "mazda", "price": (500000, 700000), "body": "hatchback"}, True),
+]
+# ห้ามได้ค่าเหล่านี้ทั้งจาก parser แบบกฎและจาก extract_answers
+FORBIDDEN = [
+    ("ขอรถ hatchback ในเมือง", {"trans": "AT"}),
+    ("อยากได้รถครอบครัว 7 ที่นั่ง งบ 1.2 ล้าน", {"series": "2", "price": (0, 100007)}),
+    ("mazda 2 hatchback งบ 6 แสน", {"price": (0, 100002)}),
+]
+
+
+def main():
+    A.startup.wait()
+    failed = 0
+    for text, expected, rules_only in CASES:
+        slots, confidence = A._rule_extract(text)
+        calls = A.EXTRACT_STATS["llm_calls"]
+        got = A.extract_answers(text, {})
+        used_llm = A.EXTRACT_STATS["llm_calls"] > calls
+        wrong = {k: got.get(k) for k, v in expected.items() if got.get(k) != v}
+        ok = not wrong and (rules_only is None or used_llm != rules_only)
+        failed += not ok
+        print(f"[{'OK' if ok else 'FAIL'}] {text!r} confidence={confidence:.2f} llm={used_llm} {wrong or ''}")
+    for text, bad in FORBIDDEN:
+        slots, _ = A._rule_extract(text)
+        got = A.extract_answers(text, {})
+        hit = {k: v for k, v in bad.items() if v in (slots.get(k), got.get(k))}
+        failed += bool(hit)
+        print(f"[{'FAIL' if hit else 'OK'}] {text!r} ไม่มี {bad} {hit or ''}")
+    if failed:
+        raise SystemExit(f"{failed} กรณีไม่ผ่าน")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""วัดหน่วยความจำต่อ worker ของ gunicorn ว่าแชร์กับ master ได้แค่ไหน (Linux เท่านั้น)
+
+อ่าน /proc/<pid>/smaps_rollup ของ master และ worker ทุกตัว
+- private_mb = Private_Clean + Private_Dirty = หน่วยความจำที่ worker นั้นจ่ายเองจริง
+- pss_mb = ส่วนแบ่งตามสัดส่วน (หน้าที่แชร์ถูกหารตามจำนวน process)
+ถ้า preload ทำงานถูก private_mb ของ worker ควรเหลือแค่ state ต่อ request ไม่ใช่ขนาดโมเดล/catalogue
+
+ใช้:
+    gunicorn -c gunicorn.conf.py app:app &
+    python -m benchmarks.worker_rss --master <pid ของ gunicorn master> --warm http://127.0.0.1:8000
+"""
+import argparse
+import json
+import os
+import urllib.request
+
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def smaps_rollup(pid):
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in FIELDS:
+                out[key] = int(rest.split()[0]) / 1024
+    return out
+
+
+def children(pid):
+    kids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # ฟิลด์ที่ 4 (ppid) อยู่หลังชื่อ process ที่ปิดด้วย ")"
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        if ppid == pid:
+            kids.append(int(entry))
+    return sorted(kids)
+
+
+def row(role, pid):
+    m = smaps_rollup(pid)
+    return {
+        "role": role,
+        "pid": pid,
+        "rss_mb": round(m.get("Rss", 0), 1),
+        "pss_mb": round(m.get("Pss", 0), 1),
+        "shared_mb": round(m.get("Shared_Clean", 0) + m.get("Shared_Dirty", 0), 1),
+        "private_mb": round(m.get("Private_Clean", 0) + m.get("Private_Dirty", 0), 1),
+    }
+
+
+def warm(base_url, n):
+    # ยิง /chat สั้น ๆ ให้ worker ผ่านเส้นทางจริงก่อนวัด (กระจายไปหลาย worker ตาม n)
+    body = json.dumps({"message": "ช่วยแนะนำรถ"}).encode()
+    for _ in range(n):
+        req = urllib.request.Request(base_url.rstrip("/") + "/chat", data=body,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(req, timeout=30).read()
+        except OSError as e:
+            print(f"warm request failed: {e}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--master", type=int, required=True)
+    ap.add_argument("--warm", help="base URL ของแอป ถ้าระบุจะยิง request ก่อนวัด")
+    ap.add_argument("--requests", type=int, default=50)
+    args = ap.parse_args()
+
+    if args.warm:
+        warm(args.warm, args.requests)
+
+    rows = [row("master", args.master)] + [row("worker", p) for p in children(args.master)]
+    print(f"{'role':8} {'pid':>8} {'rss_mb':>9} {'pss_mb':>9} {'shared_mb':>10} {'private_mb':>11}")
+    for r in rows:
+        print(f"{r['role']:8} {r['pid']:>8} {r['rss_mb']:>9} {r['pss_mb']:>9} "
+              f"{r['shared_mb']:>10} {r['private_mb']:>11}")
+    workers = [r for r in rows if r["role"] == "worker"]
+    if workers:
+        avg = sum(r["private_mb"] for r in workers) / len(workers)
+        total = sum(r["pss_mb"] for r in rows)
+        print(f"\nworkers={len(workers)} private ต่อ worker เฉลี่ย {avg:.1f} MB, PSS รวมทั้งกลุ่ม {total:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
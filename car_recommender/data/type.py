@@ -1,69 +1,31 @@
+import os
+import sys
+
 import pandas as pd
-import re
+
+# รันจากโฟลเดอร์ data (python type.py): ให้ import utils.* ของ car_recommender ได้
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.body_type import body_type_text, classify_body_type
 
 # ---- 1) โหลดข้อมูล ----
 df = pd.read_csv("Dataset.csv", encoding="utf-8-sig")
 # บางไฟล์ใช้ utf-8 ปกติ
 # df = pd.read_csv("Dataset.csv", encoding="utf-8")
 
-# ---- 2) เตรียมข้อความสำหรับตรวจจับประเภท ----
-def norm(s):
-    if pd.isna(s):
-        return ""
-    # ลบช่องว่างพิเศษและทำเป็นตัวพิมพ์เล็ก
-    return re.sub(r"\s+", " ", str(s)).strip().lower()
-
-series_norm  = df.get("series", "").apply(norm)
-details_norm = df.get("Details", "").apply(norm)
-
-text = (series_norm + " " + details_norm).str.strip()
-
-# ---- 3) กฎจัดประเภท (เรียงจากเฉพาะทาง → กว้าง) ----
-# หมายเหตุ: ปรับ/เติม keyword ได้ตาม dataset จริง
-PICKUP_KEYWORDS = [
-    r"\bpickup\b", "รถกระบะ", "กระบะ", "raptor", "revo", "triton", "navara",
-    "ranger", "d-max", "bt-50", "wildtrak", "double cab", "open cab", "standard cab"
-]
-SUV_KEYWORDS = [
-    r"\bsuv\b", "เอสยูวี", "ครอสโอเวอร์", "crossover",
-    "fortuner", "pajero", "mu-x", "cr-v", "hr-v", "cx-5", "cx-8",
-    "x-trail", "corolla cross", "crosstrek", "outlander", "xpv", "xpv cross"
-]
-SEDAN_KEYWORDS = [
-    "sedan", "ซีดาน", "เก๋ง", "camry", "accord", "altis", "civic",
-    "city e:hev", "almera", "attrage", "mazda 3", "sylphy"
-]
-HATCHBACK_KEYWORDS = [
-    "hatchback", "แฮทช์แบ็ก", "แฮทช์แบ็ค", "yaris", "swift", "jazz"
-]
-MPV_KEYWORDS = [
-    "mpv", "รถครอบครัว", "7 ที่นั่ง", "stargazer", "avanza", "ertiga", "xpander"
-]
-
-def detect_type(s: str) -> str:
-    t = s
-    # Pickup
-    if any(re.search(k, t) if k.startswith(r"\b") else (k in t) for k in PICKUP_KEYWORDS):
-        return "Pickup"
-    # SUV
-    if any(re.search(k, t) if k.startswith(r"\b") else (k in t) for k in SUV_KEYWORDS):
-        return "SUV"
-    # Sedan
-    if any(k in t for k in SEDAN_KEYWORDS):
-        return "Sedan"
-    # Hatchback
-    if any(k in t for k in HATCHBACK_KEYWORDS):
-        return "Hatchback"
-    # MPV
-    if any(k in t for k in MPV_KEYWORDS):
-        return "MPV"
-    return "Other"
+# ---- 2) เตรียมข้อความสำหรับตรวจจับประเภท (series + Details, ตัวพิมพ์เล็ก) ----
+text = body_type_text(df)
 
-df["type"] = text.apply(detect_type)
+# ---- 3) จัดประเภทตามกฎใน utils/body_type.py (เรียงจากเฉพาะทาง → กว้าง) ----
+# หมายเหตุ: ปรับ/เติม keyword ได้ที่ utils/body_type.py
+result = classify_body_type(text)
+df["type"] = result["body_type"]
+df["type_keyword"] = result["keyword"]
 
 # ---- 4) สรุปจำนวนต่อประเภทรถ ----
 counts = df["type"].value_counts().rename_axis("vehicle_type").reset_index(name="count")
 print(counts)
+# keyword ที่ทำให้ได้ประเภทนั้นบ่อยที่สุด (ไว้ตรวจกฎที่จับผิด)
+print(result.dropna().value_counts().head(20))
 
 # ---- 5) บันทึกผลลัพธ์ ----
 counts.to_csv("type_counts.csv", index=False, encoding="utf-8-sig")
@@ -71,4 +33,4 @@ df.to_csv("Dataset_with_type.csv", index=False, encoding="utf-8-sig")
 
 print("\nSaved:")
 print(" - type_counts.csv (ยอดรวมต่อประเภทรถ)")
-print(" - Dataset_with_type.csv (เพิ่มคอลัมน์ type แล้ว)")
+print(" - Dataset_with_type.csv (เพิ่มคอลัมน์ type และ type_keyword แล้ว)")
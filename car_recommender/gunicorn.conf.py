@@ -0,0 +1,40 @@
+# รันจากโฟลเดอร์ car_recommender (ต้อง pip install gunicorn เพิ่ม):
+#     gunicorn -c gunicorn.conf.py app:app
+#
+# preload_app: master import app.py ครั้งเดียว (APP_PRELOAD=1 โหลด catalogue / index / โมเดลให้เสร็จ)
+# แล้วค่อย fork worker ทุกตัวแชร์หน้าหน่วยความจำเหล่านั้นแบบ copy-on-write
+#
+# หน่วยความจำต่อ worker:
+# - แชร์กับ master: น้ำหนักโมเดล, คอลัมน์ตัวเลข / categorical ของ DataFrame catalogue (memory-map จาก store),
+#   อาร์เรย์ NumPy ใน CatalogueFilters / StructuredRetriever (readonly), เมทริกซ์ embedding และ FAISS index
+# - แชร์ได้ไม่ถาวร: คอลัมน์ข้อความ (object dtype: full_name, series, description, ... ที่ _decode_strings
+#   แปลงเป็น str ของ Python รวมถึงคอลัมน์ข้อความที่ app / CatalogueFilters สร้างต่อ) ทุกครั้งที่ worker อ่าน
+#   str ตัวหนึ่ง (df.iloc, .str, to_dict) refcount ในหัวอ็อบเจกต์ถูกเขียน หน้านั้นจึงถูก copy เข้า worker
+#   gc.freeze() กันแค่ GC ไม่ได้กัน refcount ส่วนนี้จึงค่อย ๆ กลายเป็นของ worker ตามแถวที่ถูกใช้
+#   (มากสุดราวขนาดข้อความทั้ง catalogue ต่อ worker) การ decode ตอนอ่านต้องใช้ string array ที่ไม่ใช่อ็อบเจกต์
+#   ของ Python (เช่น pandas ที่มี pyarrow) ซึ่งยังไม่ได้เป็น dependency ของโปรเจกต์
+# - ของ worker เอง: thread ของ BatchingEncoder, แคชใน process (query_cache, explain_cache ชั้น hot,
+#   mask ของ series), connection SQLite, buffer ของ torch ตอน encode และ state ต่อ request
+# วัดจริงด้วย python -m benchmarks.worker_rss --master <pid> (ดูคอลัมน์ private_mb)
+# ถ้า private_mb ของ worker ใกล้ขนาดโมเดล แปลว่ามีการเขียนทับหน้าที่แชร์ (เช่น ลืม readonly หรือโหลดซ้ำใน worker)
+# ส่วนที่โตช้า ๆ ตามจำนวน request ไม่เกินขนาดคอลัมน์ข้อความคือ refcount ของ str ด้านบน
+import multiprocessing
+import os
+
+os.environ.setdefault("APP_PRELOAD", "1")
+# worker หลายตัวต่อเครื่อง: จำกัด thread ของ torch ต่อ worker ไม่ให้แย่ง CPU กันเอง
+# (ต้องตั้งก่อน master import torch)
+os.environ.setdefault("OMP_NUM_THREADS", os.getenv("TORCH_THREADS_PER_WORKER", "1"))
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+
+
+def post_fork(server, worker):
+    import app
+
+    app.post_fork_worker()
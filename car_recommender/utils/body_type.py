@@ -0,0 +1,111 @@
+"""จัดประเภทตัวถังรถ (Pickup / SUV / Sedan / Hatchback / MPV) จากข้อความ series + รายละเอียด
+
+กฎเดิมของ data/type.py: ไล่ประเภทตามลำดับใน BODY_TYPE_RULES (เฉพาะทาง -> กว้าง) ประเภทแรกที่มี keyword
+ปรากฏในข้อความได้ไป ไม่มีเลยได้ OTHER
+แต่ละประเภทคอมไพล์เป็น regex ก้อนเดียว (alternation ของทุก keyword) จึงค้นครั้งเดียวต่อประเภทแทนการวนทีละ
+keyword และคืนคำที่ match ได้ด้วยว่าทำไมถึงได้ประเภทนั้น
+
+ใช้จาก data/type.py (สร้างคอลัมน์ type ของ dataset) และ utils/process_data.py (เติม type ที่ว่าง)
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+OTHER = "Other"
+
+# keyword ที่ขึ้นต้นด้วย \b เป็น regex นอกนั้นเป็นข้อความตรงตัว (เทียบกับข้อความที่ normalize แล้ว)
+PICKUP_KEYWORDS = [
+    r"\bpickup\b", "รถกระบะ", "กระบะ", "raptor", "revo", "triton", "navara",
+    "ranger", "d-max", "bt-50", "wildtrak", "double cab", "open cab", "standard cab"
+]
+SUV_KEYWORDS = [
+    r"\bsuv\b", "เอสยูวี", "ครอสโอเวอร์", "crossover",
+    "fortuner", "pajero", "mu-x", "cr-v", "hr-v", "cx-5", "cx-8",
+    "x-trail", "corolla cross", "crosstrek", "outlander", "xpv", "xpv cross"
+]
+SEDAN_KEYWORDS = [
+    "sedan", "ซีดาน", "เก๋ง", "camry", "accord", "altis", "civic",
+    "city e:hev", "almera", "attrage", "mazda 3", "sylphy"
+]
+HATCHBACK_KEYWORDS = [
+    "hatchback", "แฮทช์แบ็ก", "แฮทช์แบ็ค", "yaris", "swift", "jazz"
+]
+MPV_KEYWORDS = [
+    "mpv", "รถครอบครัว", "7 ที่นั่ง", "stargazer", "avanza", "ertiga", "xpander"
+]
+
+BODY_TYPE_RULES = [
+    ("Pickup", PICKUP_KEYWORDS),
+    ("SUV", SUV_KEYWORDS),
+    ("Sedan", SEDAN_KEYWORDS),
+    ("Hatchback", HATCHBACK_KEYWORDS),
+    ("MPV", MPV_KEYWORDS),
+]
+
+
+def _keyword_regex(k: str) -> str:
+    if not k.startswith(r"\b"):
+        return re.escape(k)
+    # re ข้ามไปยังตำแหน่งที่ตัวอักษรแรกเป็นตัวขึ้นต้นของ keyword ได้เร็ว (charset prefix) ก็ต่อเมื่อทุกทางเลือก
+    # ขึ้นต้นด้วยตัวอักษรตรงตัว: "\bpickup" จึงเขียนเป็น "p(?<!\wp)ickup" ซึ่งมีความหมายเดียวกัน
+    body = k[2:]
+    first = body[:1]
+    if first.isalnum():
+        return f"{first}(?<!\\w{first}){body[1:]}"
+    return k
+
+
+def compile_keywords(keywords) -> re.Pattern:
+    # คำยาวก่อน: ตำแหน่งเดียวกันที่ match ได้หลายคำ (xpv / xpv cross) จะรายงานคำที่เจาะจงกว่า
+    return re.compile("|".join(_keyword_regex(k) for k in sorted(keywords, key=len, reverse=True)))
+
+
+BODY_TYPE_PATTERNS = [(name, compile_keywords(kws)) for name, kws in BODY_TYPE_RULES]
+
+
+def normalize_text(s: pd.Series) -> pd.Series:
+    """ช่องว่างหลายตัวเหลือหนึ่ง ตัดหัวท้าย ตัวพิมพ์เล็ก ค่าว่างเป็น "" """
+    # " ".join(x.split()) ให้ผลเท่ากับ re.sub(r"\s+", " ", x).strip() (นิยามช่องว่างเดียวกัน) แต่เร็วกว่าราวสองเท่า
+    values = [" ".join(x.split()).lower() for x in s.fillna("").astype(str)]
+    return pd.Series(values, index=s.index, dtype=object)
+
+
+def body_type_text(df: pd.DataFrame) -> pd.Series:
+    """ข้อความที่ใช้จัดประเภท: series + รายละเอียด (คอลัมน์ Details ของไฟล์ดิบ หรือ description หลังรีเนม)"""
+    empty = pd.Series("", index=df.index)
+    series = normalize_text(df["series"]) if "series" in df.columns else empty
+    col = "Details" if "Details" in df.columns else "description"
+    details = normalize_text(df[col]) if col in df.columns else empty
+    return (series + " " + details).str.strip()
+
+
+def detect_type(text: str):
+    """จัดประเภทข้อความเดียว (normalize แล้ว) คืน (ประเภท, keyword ที่ match หรือ None)"""
+    for name, pattern in BODY_TYPE_PATTERNS:
+        m = pattern.search(text)
+        if m:
+            return name, m.group(0)
+    return OTHER, None
+
+
+def classify_body_type(text: pd.Series) -> pd.DataFrame:
+    """จัดประเภททั้งคอลัมน์ (ข้อความ normalize แล้ว เช่นจาก body_type_text)
+
+    คืน DataFrame (index เดียวกับ text) คอลัมน์ body_type และ keyword (NaN ถ้าเป็น OTHER)
+    แต่ละประเภทค้นเฉพาะแถวที่ประเภทก่อนหน้ายังไม่ match
+    """
+    body = np.full(len(text), OTHER, dtype=object)
+    keyword = np.full(len(text), np.nan, dtype=object)
+    pos = np.arange(len(text))
+    rest = text.fillna("").astype(str).tolist()
+    for name, pattern in BODY_TYPE_PATTERNS:
+        if not rest:
+            break
+        matches = list(map(pattern.search, rest))
+        found = np.fromiter((m is not None for m in matches), dtype=bool, count=len(matches))
+        body[pos[found]] = name
+        keyword[pos[found]] = [m.group(0) for m in matches if m is not None]
+        pos = pos[~found]
+        rest = [t for t, f in zip(rest, found) if not f]
+    return pd.DataFrame({"body_type": body, "keyword": keyword}, index=text.index)
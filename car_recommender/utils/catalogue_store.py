@@ -0,0 +1,383 @@
+"""ที่เก็บ catalogue แบบคอลัมน์ไบนารีพร้อม schema ชัดเจน (แทนการอ่าน clean_data.csv ทุกครั้งที่บูต)
+
+โครงสร้างโฟลเดอร์:
+    CURRENT               ชื่อโฟลเดอร์เวอร์ชันที่ใช้อยู่ (v<เวลา ns>) สลับเวอร์ชันด้วย os.replace ไฟล์นี้ไฟล์เดียว
+    v<ns>/                หนึ่งชุด catalogue ต่อโฟลเดอร์ มีไฟล์ด้านล่าง (เก็บเวอร์ชันก่อนหน้าไว้หนึ่งชุด)
+    schema.json           ชนิดของแต่ละคอลัมน์, dictionary ของคอลัมน์ categorical, จำนวนแถว
+    c<i>.values.npy       ค่าตัวเลข (int64 / float64) หรือ code ของ categorical (int32, -1 = ว่าง)
+    c<i>.na.npy           mask ค่าว่างของคอลัมน์ int ที่ nullable (True = ว่าง)
+    c<i>.data.npy         ข้อความ utf-8 ต่อกันเป็น uint8 ก้อนเดียว
+    c<i>.offsets.npy      ขอบของแต่ละแถวใน data (int64 ยาว n+1)
+    (ไฟล์อื่นที่ผูกกับ catalogue ชุดนี้ เช่น FAISS index และ embeddings.npy ของ utils/indexer.py
+    เขียนลงโฟลเดอร์เดียวกันผ่าน extra_files จึงสลับเป็นชุดใหม่พร้อมกันทั้งหมด)
+store แบบเดิมที่ไม่มี CURRENT (ไฟล์อยู่ที่รากโฟลเดอร์) ยังอ่านได้ และถูกลบเมื่อเขียนเวอร์ชันแรก
+
+ผู้อ่านต้อง resolve_catalogue ครั้งเดียวแล้วเปิดทุกไฟล์จากโฟลเดอร์ที่ได้ ไม่งั้นอาจได้ไฟล์คนละเวอร์ชัน
+
+ตอนโหลดใช้ np.load(mmap_mode="r") คอลัมน์ตัวเลขจึงชี้ไปที่ไฟล์ตรง ๆ ไม่ copy
+ส่วนคอลัมน์ข้อความต้อง decode เป็น str ของ Python หนึ่งครั้งตอนโหลด (อ็อบเจกต์เหล่านี้แชร์ข้าม fork ได้ไม่ถาวร
+เพราะ refcount ถูกเขียนทุกครั้งที่อ่าน ดู gunicorn.conf.py)
+
+แปลง CSV เดิมเป็น store (รันจากโฟลเดอร์ car_recommender):
+    python -m utils.catalogue_store embeddings/clean_data.csv embeddings/catalogue
+"""
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+SCHEMA_FILE = "schema.json"
+CURRENT_FILE = "CURRENT"
+VERSION_RE = re.compile(r"v(\d+)")
+# เวอร์ชันปัจจุบัน + ก่อนหน้าหนึ่งชุด: process ที่ resolve ไปแล้วแต่ยังเปิดไฟล์ไม่ครบยังอ่านจนจบได้
+KEEP_VERSIONS = 2
+CATEGORICAL_COLUMNS = ("make", "fuel_type", "type", "drive")
+# คอลัมน์ตัวเลขที่ต้องเป็นจำนวนเต็มแม้ค่าจะว่างได้ (pandas Int64)
+INTEGER_COLUMNS = ("price_thb", "engine_cc", "horsepower_hp", "year")
+
+
+def _column_kind(name, s: pd.Series, categorical):
+    if name in categorical or isinstance(s.dtype, pd.CategoricalDtype):
+        return "category"
+    if isinstance(s.dtype, pd.Int64Dtype) or name in INTEGER_COLUMNS:
+        return "int" if s.notna().all() else "nullable_int"
+    if pd.api.types.is_bool_dtype(s.dtype):
+        return "bool"
+    if pd.api.types.is_integer_dtype(s.dtype):
+        return "int"
+    if pd.api.types.is_float_dtype(s.dtype):
+        return "float"
+    return "string"
+
+
+class NpyAppender:
+    """เขียนอาร์เรย์ลงไฟล์ .npy ทีละส่วนตามแกนแรก: จองที่ header ไว้ตอนเปิดแล้วเขียนทับด้วยจำนวนแถวจริงตอนปิด
+    (header ของ .npy เว้นที่ให้ตัวเลขแกนแรกยาวขึ้นได้ ความยาว header จึงคงที่)"""
+
+    def __init__(self, path, dtype, tail=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.tail = tuple(tail)
+        self.count = 0
+        self._f = open(path, "wb")
+        self._header_len = len(self._header(0))
+        self._f.write(self._header(0))
+
+    def _header(self, n):
+        buf = io.BytesIO()
+        np.lib.format.write_array_header_1_0(buf, {
+            "descr": np.lib.format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (n,) + self.tail,
+        })
+        return buf.getvalue()
+
+    def append(self, arr):
+        arr = np.ascontiguousarray(arr, dtype=self.dtype)
+        if arr.shape[1:] != self.tail:
+            raise ValueError(f"{self.path}: shape {arr.shape[1:]} != {self.tail}")
+        self._f.write(arr.tobytes())
+        self.count += len(arr)
+
+    def close(self):
+        header = self._header(self.count)
+        if len(header) != self._header_len:
+            raise ValueError(f"{self.path}: header ยาวเกินที่จองไว้")
+        self._f.seek(0)
+        self._f.write(header)
+        self._f.close()
+
+
+class _ColumnWriter:
+    """เขียนคอลัมน์หนึ่งทีละ chunk ชนิดคอลัมน์กำหนดจาก chunk แรกที่มีค่า (chunk ที่ว่างทั้งหมดรอไว้ก่อน)"""
+
+    def __init__(self, out_dir, i, name, categorical):
+        self.out_dir = out_dir
+        self.i = i
+        self.name = name
+        self.categorical = categorical
+        self.kind = None
+        self.first = None
+        self.pending = 0
+        self.has_na = False
+        self.files = {}
+        self.categories = {}
+        self.offset = 0
+
+    def _open(self, part, dtype):
+        self.files[part] = NpyAppender(os.path.join(self.out_dir, f"c{self.i}.{part}.npy"), dtype)
+
+    def _start(self, kind):
+        # int กับ nullable_int เขียน mask ไว้ก่อนเสมอ รู้ว่ามีค่าว่างหรือไม่ตอนปิด
+        self.kind = "int" if kind == "nullable_int" else kind
+        if self.kind == "category":
+            self._open("values", np.int32)
+        elif self.kind == "int":
+            self._open("values", np.int64)
+            self._open("na", bool)
+        elif self.kind == "bool":
+            self._open("values", bool)
+        elif self.kind == "float":
+            self._open("values", np.float64)
+        else:
+            self._open("data", np.uint8)
+            self._open("offsets", np.int64)
+            self._open("na", bool)
+            self.files["offsets"].append(np.zeros(1, dtype=np.int64))
+        if self.pending:
+            self._write(pd.Series([np.nan] * self.pending, dtype=object))
+            self.pending = 0
+
+    def append(self, s: pd.Series):
+        if self.first is None:
+            self.first = s.iloc[:0]
+        if self.kind is None:
+            fixed = (self.name in self.categorical or self.name in INTEGER_COLUMNS
+                     or isinstance(s.dtype, (pd.CategoricalDtype, pd.Int64Dtype)))
+            if not fixed and not s.notna().any():
+                self.pending += len(s)
+                return
+            self._start(_column_kind(self.name, s, self.categorical))
+        self._write(s)
+
+    def _write(self, s: pd.Series):
+        f = self.files
+        if self.kind == "category":
+            vals = s.astype(object)
+            text = vals.where(vals.isna(), vals.astype(str))
+            for v in pd.unique(text.dropna()):
+                self.categories.setdefault(v, len(self.categories))
+            f["values"].append(text.map(self.categories).fillna(-1).to_numpy(dtype=np.int32))
+        elif self.kind == "int":
+            num = pd.to_numeric(s, errors="coerce")
+            na = num.isna().to_numpy()
+            self.has_na |= bool(na.any())
+            f["values"].append(num.fillna(0).round().to_numpy(dtype=np.int64))
+            f["na"].append(na)
+        elif self.kind == "bool":
+            if s.isna().any():
+                raise ValueError(f"คอลัมน์ {self.name}: bool มีค่าว่างไม่ได้")
+            f["values"].append(s.to_numpy(dtype=bool))
+        elif self.kind == "float":
+            try:
+                f["values"].append(s.to_numpy(dtype=np.float64))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"คอลัมน์ {self.name}: chunk ก่อนหน้าเป็นตัวเลข แต่ chunk นี้ไม่ใช่ ({e})") from e
+        else:
+            valid = s.notna().to_numpy()
+            encoded = [str(v).encode("utf-8") if ok else b""
+                       for v, ok in zip(s.to_numpy(dtype=object), valid)]
+            ends = self.offset + np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+            f["data"].append(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            f["offsets"].append(ends)
+            f["na"].append(~valid)
+            if len(ends):
+                self.offset = int(ends[-1])
+
+    def close(self):
+        if self.kind is None:
+            # ทุก chunk ว่าง: ใช้ชนิดตาม dtype ของ chunk แรกเหมือนเขียนทั้งก้อน
+            self._start(_column_kind(self.name, self.first, self.categorical))
+        for appender in self.files.values():
+            appender.close()
+        spec = {"name": self.name, "kind": self.kind, "files": {}}
+        if self.kind == "int":
+            if self.has_na:
+                spec["kind"] = "nullable_int"
+            else:
+                os.remove(self.files.pop("na").path)
+        if self.kind == "category":
+            spec["categories"] = self._sort_categories()
+        spec["files"] = {part: os.path.basename(a.path) for part, a in self.files.items()}
+        return spec
+
+    def _sort_categories(self, chunk_rows=1_000_000):
+        # code ตามลำดับที่พบ -> code ตามลำดับที่เรียงแล้ว (แบบ pd.Categorical) โดยแก้ไฟล์ทีละช่วง
+        cats = sorted(self.categories)
+        remap = np.empty(len(cats) + 1, dtype=np.int32)
+        for new, c in enumerate(cats):
+            remap[self.categories[c]] = new
+        remap[-1] = -1
+        codes = np.load(self.files["values"].path, mmap_mode="r+")
+        for lo in range(0, len(codes), chunk_rows):
+            codes[lo:lo + chunk_rows] = remap[codes[lo:lo + chunk_rows]]
+        codes.flush()
+        del codes
+        return cats
+
+
+class CatalogueWriter:
+    """เขียน catalogue ลง store ทีละ chunk (หน่วยความจำตามขนาด chunk ไม่ใช่ทั้งไฟล์)
+
+    ทุก chunk ต้องมีคอลัมน์ชุดเดียวกันเรียงเหมือนกัน ผลลัพธ์เหมือนเขียน DataFrame ทั้งก้อนด้วย write_catalogue
+        w = CatalogueWriter(path)
+        for chunk in chunks:
+            w.append(chunk)
+        w.close()
+    """
+
+    def __init__(self, path: str, categorical=CATEGORICAL_COLUMNS):
+        self.path = path
+        self.categorical = categorical
+        # เขียนลงโฟลเดอร์เวอร์ชันใหม่ตรง ๆ ผู้อ่านไม่เห็นจนกว่า CURRENT จะชี้มา
+        self.version = f"v{time.time_ns()}"
+        self.tmp = os.path.join(path, self.version)
+        self.rows = 0
+        self._columns = None
+        os.makedirs(self.tmp)
+
+    def append(self, df: pd.DataFrame):
+        df = df.reset_index(drop=True)
+        if self._columns is None:
+            self._columns = [_ColumnWriter(self.tmp, i, name, self.categorical)
+                             for i, name in enumerate(df.columns)]
+        elif list(df.columns) != [c.name for c in self._columns]:
+            raise ValueError(f"คอลัมน์ไม่ตรงกับ chunk แรก: {list(df.columns)}")
+        for col in self._columns:
+            col.append(df[col.name])
+        self.rows += len(df)
+
+    def close(self, extra_files=None) -> str:
+        """ปิดไฟล์ เขียน schema แล้วสลับเวอร์ชันแบบ atomic
+
+        extra_files: {ชื่อไฟล์: writer(path_เต็ม)} สำหรับไฟล์ที่ต้องเปลี่ยนพร้อม catalogue
+        """
+        columns = [c.close() for c in self._columns or []]
+        for fname, writer in (extra_files or {}).items():
+            writer(os.path.join(self.tmp, fname))
+        schema = {
+            "format": FORMAT_VERSION,
+            "rows": self.rows,
+            "created_at": time.time(),
+            "columns": columns,
+            "extra_files": sorted(extra_files or {}),
+        }
+        with open(os.path.join(self.tmp, SCHEMA_FILE), "w", encoding="utf-8") as f:
+            json.dump(schema, f, ensure_ascii=False, indent=1)
+
+        # os.replace ไฟล์ CURRENT ครั้งเดียว: ไม่มีช่วงที่ store หายไป ผู้อ่านเห็นชุดเก่าหรือชุดใหม่ทั้งชุด
+        pointer = os.path.join(self.path, CURRENT_FILE)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.version)
+        os.replace(pointer + ".tmp", pointer)
+        self._prune()
+        return self.path
+
+    def _prune(self):
+        """ลบเวอร์ชันที่เก่ากว่า KEEP_VERSIONS และไฟล์ของ store แบบเดิมที่รากโฟลเดอร์
+        process ที่ memory-map ไฟล์ชุดเก่าอยู่ยังอ่านต่อได้ หลังลบไฟล์บน POSIX"""
+        current = int(self.version[1:])
+        versions = sorted(
+            int(m.group(1)) for m in map(VERSION_RE.fullmatch, os.listdir(self.path))
+            if m and int(m.group(1)) <= current
+        )
+        # เวอร์ชันที่ใหม่กว่า current คือ build อื่นที่ยังเขียนอยู่ ไม่แตะ
+        for v in versions[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(self.path, f"v{v}"), ignore_errors=True)
+        # store แบบเดิมนับเป็นเวอร์ชันก่อนหน้า: ลบเมื่อมีเวอร์ชันใหม่ครบ KEEP_VERSIONS แล้ว
+        legacy = os.path.join(self.path, SCHEMA_FILE)
+        if len(versions) >= KEEP_VERSIONS and os.path.isfile(legacy):
+            with open(legacy, encoding="utf-8") as f:
+                schema = json.load(f)
+            names = [n for spec in schema.get("columns", []) for n in spec.get("files", {}).values()]
+            for name in names + schema.get("extra_files", []) + [SCHEMA_FILE]:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+
+def write_catalogue(df: pd.DataFrame, path: str, categorical=CATEGORICAL_COLUMNS,
+                    extra_files=None) -> str:
+    """เขียน df ลงโฟลเดอร์ path แบบ atomic (เขียนโฟลเดอร์เวอร์ชันใหม่ก่อนแล้วค่อยสลับ CURRENT)
+
+    extra_files: {ชื่อไฟล์: writer(path_เต็ม)} สำหรับไฟล์ที่ต้องเปลี่ยนพร้อม catalogue
+    """
+    writer = CatalogueWriter(path, categorical)
+    writer.append(df)
+    return writer.close(extra_files)
+
+
+def resolve_catalogue(path: str) -> str:
+    """โฟลเดอร์ของเวอร์ชันที่ CURRENT ชี้อยู่ (store แบบเดิมที่ไม่มี CURRENT คือ path เอง)"""
+    try:
+        with open(os.path.join(path, CURRENT_FILE), encoding="utf-8") as f:
+            return os.path.join(path, f.read().strip())
+    except FileNotFoundError:
+        return path
+
+
+def has_catalogue(path: str) -> bool:
+    return os.path.isfile(os.path.join(resolve_catalogue(path), SCHEMA_FILE))
+
+
+def read_schema(path: str) -> dict:
+    with open(os.path.join(resolve_catalogue(path), SCHEMA_FILE), encoding="utf-8") as f:
+        schema = json.load(f)
+    if schema.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: catalogue format {schema.get('format')!r}, expected {FORMAT_VERSION}")
+    return schema
+
+
+def _decode_strings(data: np.ndarray, offsets: np.ndarray, na: np.ndarray) -> np.ndarray:
+    raw = data.tobytes()
+    out = np.empty(len(offsets) - 1, dtype=object)
+    bounds = offsets.tolist()
+    for i, missing in enumerate(na.tolist()):
+        out[i] = np.nan if missing else raw[bounds[i]:bounds[i + 1]].decode("utf-8")
+    return out
+
+
+def read_catalogue(path: str, mmap=True, columns=None) -> pd.DataFrame:
+    """โหลด store กลับเป็น DataFrame: ตัวเลขอ่านจากไฟล์แบบ memory-map (อ่านอย่างเดียว),
+    make / fuel_type / type / drive เป็น pandas Categorical
+
+    columns: โหลดเฉพาะคอลัมน์เหล่านี้ (ที่ไม่มีใน store ข้ามไป)"""
+    path = resolve_catalogue(path)
+    schema = read_schema(path)
+    mode = "r" if mmap else None
+
+    def load(spec, part):
+        return np.load(os.path.join(path, spec["files"][part]), mmap_mode=mode)
+
+    cols = {}
+    for spec in schema["columns"]:
+        if columns is not None and spec["name"] not in columns:
+            continue
+        kind = spec["kind"]
+        if kind == "category":
+            values = pd.Categorical.from_codes(load(spec, "values"), categories=spec["categories"])
+        elif kind == "nullable_int":
+            values = pd.arrays.IntegerArray(load(spec, "values"), load(spec, "na"))
+        elif kind == "string":
+            values = _decode_strings(load(spec, "data"), load(spec, "offsets"), load(spec, "na"))
+        else:
+            values = load(spec, "values")
+        cols[spec["name"]] = pd.Series(values, copy=False)
+    # copy=False: หนึ่งบล็อกต่อคอลัมน์ ไม่รวมบล็อก (ซึ่งจะ copy อาร์เรย์ที่ map มาจากไฟล์)
+    return pd.DataFrame(cols, copy=False)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("usage: python -m utils.catalogue_store <clean_data.csv> <out_dir>")
+        return 2
+    src, out = argv
+    writer = CatalogueWriter(out)
+    for chunk in pd.read_csv(src, encoding="utf-8-sig", chunksize=100_000):
+        writer.append(chunk)
+    writer.close()
+    print(f"เขียน {writer.rows} แถว -> {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
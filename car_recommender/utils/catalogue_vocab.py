@@ -0,0 +1,119 @@
+"""ดัชนีคำของ catalogue (ยี่ห้อ / รุ่น) สร้างครั้งเดียวตอนโหลด catalogue ใช้หา make / series ในข้อความผู้ใช้
+
+- ยี่ห้อและชื่อ series (ทั้งชื่อเต็มและคำแรก) อยู่ใน KeywordMatcher ตัวเดียว พร้อมชื่อเรียกภาษาไทย
+  (MAKE_ALIASES / SERIES_ALIASES) หาในข้อความได้ในรอบเดียว ไม่ต้องวนทุกค่าใน catalogue ต่อ request
+- ลำดับความสำคัญเหมือนลูปเดิม: ยี่ห้อ / series แรกตามลำดับที่พบใน catalogue
+- has_series: เช็กว่าชื่อรุ่นที่ผู้ใช้พูดมีใน catalogue ด้วย set ของช่วงคำ (1..MAX_SPAN_TOKENS คำติดกัน)
+  ไม่เจอค่อยค้น substring ในชื่อ series ที่ไม่ซ้ำ (แคชผลไว้)
+catalogue เปลี่ยนเมื่อไรให้สร้าง CatalogueVocabulary ใหม่จาก DataFrame ชุดใหม่
+"""
+from functools import lru_cache
+
+import pandas as pd
+
+from utils.text_match import KeywordMatcher
+
+# ชื่อเรียกภาษาไทย -> ชื่อใน catalogue (ตัวพิมพ์เล็ก) ใช้เฉพาะยี่ห้อ / รุ่นที่มีใน catalogue
+# ไม่ใส่ชื่อที่เป็น substring ของคำทั่วไป (เช่น "เกีย" อยู่ใน "เกียร์")
+MAKE_ALIASES = {
+    "toyota": ["โตโยต้า"],
+    "honda": ["ฮอนด้า"],
+    "isuzu": ["อีซูซุ", "อีซูสุ"],
+    "mitsubishi": ["มิตซูบิชิ", "มิตซู"],
+    "nissan": ["นิสสัน", "นิสัน"],
+    "mazda": ["มาสด้า", "มาสดา"],
+    "ford": ["ฟอร์ด"],
+    "suzuki": ["ซูซูกิ"],
+    "mg": ["เอ็มจี"],
+    "hyundai": ["ฮุนได", "ฮุนไดย์"],
+    "bmw": ["บีเอ็มดับเบิลยู", "บีเอ็ม"],
+    "mercedes-benz": ["เบนซ์", "เมอร์เซเดส"],
+    "byd": ["บีวายดี"],
+    "subaru": ["ซูบารุ"],
+    "volvo": ["วอลโว่"],
+    "lexus": ["เล็กซัส"],
+    "chevrolet": ["เชฟโรเลต"],
+    "peugeot": ["เปอโยต์"],
+}
+SERIES_ALIASES = {
+    "ranger": ["เรนเจอร์"],
+    "d-max": ["ดีแม็กซ์", "ดีแม็ก", "ดีแมก"],
+    "mu-x": ["มิวเอ็กซ์", "มิวx"],
+    "triton": ["ไทรทัน"],
+    "pajero": ["ปาเจโร่"],
+    "xpander": ["เอ็กซ์แพนเดอร์"],
+    "attrage": ["แอททราจ", "แอทราจ"],
+    "mirage": ["มิราจ"],
+    "navara": ["นาวาร่า"],
+    "almera": ["อัลเมร่า"],
+    "kicks": ["คิกส์"],
+    "yaris": ["ยาริส"],
+    "vios": ["วีออส"],
+    "city": ["ซิตี้"],
+    "civic": ["ซีวิค"],
+    "cr-v": ["ซีอาร์วี"],
+    "br-v": ["บีอาร์วี"],
+    "mobilio": ["โมบิลิโอ"],
+    "cx-3": ["ซีเอ็กซ์3", "ซีเอ็กซ์ 3"],
+}
+# ความยาวสูงสุด (จำนวนคำ) ของช่วงคำที่เก็บใน set สำหรับ has_series
+MAX_SPAN_TOKENS = 3
+
+
+def _lower_unique(s: pd.Series) -> list:
+    values = pd.unique(s.dropna().astype(str).str.lower())
+    return [v for v in values if v.strip()]
+
+
+class CatalogueVocabulary:
+    def __init__(self, df: pd.DataFrame, make_aliases=MAKE_ALIASES, series_aliases=SERIES_ALIASES):
+        self.makes = _lower_unique(df["make"]) if "make" in df.columns else []
+        self.series = _lower_unique(df["series"]) if "series" in df.columns else []
+        # series -> คำแรก (ค่าที่ extract คืนเป็น answers["series"])
+        self.roots = {sr: sr.split()[0] for sr in self.series}
+        self.matcher = KeywordMatcher({
+            "make": {mk: [mk, *make_aliases.get(mk, ())] for mk in self.makes},
+            "series": {sr: [sr, root, *series_aliases.get(root, ())] for sr, root in self.roots.items()},
+        })
+        self.spans = set()
+        for sr in self.series:
+            tokens = sr.split()
+            for n in range(1, MAX_SPAN_TOKENS + 1):
+                for i in range(len(tokens) - n + 1):
+                    self.spans.add(" ".join(tokens[i:i + n]))
+        self._contains = lru_cache(maxsize=1024)(self._scan_series)
+
+    def extract(self, text: str) -> dict:
+        """{"make": ..., "series": คำแรกของชื่อรุ่น} ที่พบในข้อความ (ตัวพิมพ์เล็กแล้ว) หรือ {}"""
+        hits = self.matcher.scan(text)
+        found = {}
+        mk = hits.first("make")
+        if mk:
+            found["make"] = mk
+        sr = hits.first("series")
+        if sr:
+            found["series"] = self.roots[sr]
+        return found
+
+    def words(self, text: str) -> list:
+        """คำในข้อความที่ทำให้ได้ make / series จาก extract (รวมชื่อเรียกภาษาไทย)"""
+        hits = self.matcher.scan(text)
+        out = []
+        for vocab in ("make", "series"):
+            key = hits.first(vocab)
+            if key:
+                out.extend(hits.words(vocab, key))
+        return out
+
+    def has_series(self, name: str) -> bool:
+        """มีชื่อรุ่นนี้ (เป็นส่วนหนึ่งของชื่อ series ใด) ใน catalogue หรือไม่"""
+        q = " ".join(str(name).lower().split())
+        if not q or q in self.spans:
+            return True
+        return self._contains(q)
+
+    def _scan_series(self, q: str) -> bool:
+        return any(q in sr for sr in self.series)
+
+    def stats(self) -> dict:
+        return {"makes": len(self.makes), "series": len(self.series), "spans": len(self.spans)}
@@ -0,0 +1,88 @@
+"""encode ข้อความจำนวนมากลงไฟล์ .npy ทีละ chunk พร้อม checkpoint ให้ทำต่อได้หลัง crash
+
+ผลลัพธ์เขียนลง .npy ที่ memory-map ไว้ (np.lib.format.open_memmap) ทีละ chunk จึงไม่ต้องถือ
+เมทริกซ์ทั้งก้อนในหน่วยความจำ หลังแต่ละ chunk จะ flush แล้วบันทึก manifest (<out>.manifest.json)
+รันใหม่ด้วยข้อความชุดเดิม + chunk_rows เดิม จะข้าม chunk ที่เสร็จแล้ว
+"""
+import hashlib
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+
+def texts_fingerprint(texts) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for t in texts:
+        h.update(str(t).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _read_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def encode_to_npy(texts, out_path, encode, chunk_rows=10_000, normalize=True, log=print):
+    """encode(list[str]) -> ndarray (n, d); คืน memmap (n, d) float32 ของผลลัพธ์ทั้งหมด
+
+    texts ต้องเป็นลำดับที่ index ได้ (list / pandas Series) และชุดเดิมทุกครั้งที่ resume
+    """
+    n = len(texts)
+    if n == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    manifest_path = out_path + ".manifest.json"
+    fingerprint = texts_fingerprint(texts)
+    n_chunks = (n + chunk_rows - 1) // chunk_rows
+
+    manifest = _read_manifest(manifest_path)
+    out = None
+    if (manifest and manifest.get("fingerprint") == fingerprint and manifest.get("rows") == n
+            and manifest.get("chunk_rows") == chunk_rows and os.path.exists(out_path)):
+        out = np.lib.format.open_memmap(out_path, mode="r+")
+        if out.shape != (n, manifest["dim"]):
+            out = None
+    if out is None:
+        manifest = {"fingerprint": fingerprint, "rows": n, "chunk_rows": chunk_rows,
+                    "dim": None, "completed": 0}
+    elif manifest["completed"]:
+        log(f"resume {out_path}: ข้าม {manifest['completed']}/{n_chunks} chunk ที่เสร็จแล้ว")
+
+    t_start = time.perf_counter()
+    start_row = manifest["completed"] * chunk_rows
+    for c in range(manifest["completed"], n_chunks):
+        lo, hi = c * chunk_rows, min(n, (c + 1) * chunk_rows)
+        vecs = np.ascontiguousarray(encode([str(t) for t in texts[lo:hi]]), dtype=np.float32)
+        if normalize:
+            faiss.normalize_L2(vecs)
+        if out is None:
+            # รู้มิติจาก chunk แรกจึงค่อยสร้างไฟล์
+            manifest["dim"] = int(vecs.shape[1])
+            out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=(n, vecs.shape[1]))
+        out[lo:hi] = vecs
+        out.flush()
+        manifest["completed"] = c + 1
+        _write_manifest(manifest_path, manifest)
+        rate = (hi - start_row) / max(time.perf_counter() - t_start, 1e-9)
+        log(f"chunk {c + 1}/{n_chunks}: แถว {hi:,}/{n:,} ({rate:,.0f} แถว/วินาที)")
+    return out
+
+
+def cleanup(out_path):
+    """ลบไฟล์ผลลัพธ์และ manifest หลังนำไปใช้เสร็จแล้ว"""
+    for p in (out_path, out_path + ".manifest.json"):
+        if os.path.exists(p):
+            os.remove(p)
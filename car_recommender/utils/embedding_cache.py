@@ -0,0 +1,132 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    """คีย์ของแคช: NFC + ช่องว่างเหลือช่องเดียว
+
+    ไม่แปลงเป็นตัวพิมพ์เล็ก เพราะ tokenizer ของ MiniLM แยกตัวพิมพ์ ("Toyota" กับ "toyota"
+    ได้เวกเตอร์ต่างกัน) ส่วน NFC/ช่องว่าง tokenizer ทำ normalize เองอยู่แล้ว จึงใช้คีย์ร่วมกันได้
+    """
+    s = unicodedata.normalize("NFC", str(text or ""))
+    return re.sub(r"\s+", " ", s).strip()
+
+
+class QueryEmbeddingCache:
+    """แคช embedding ของ query แบบ LRU + TTL ใช้ร่วมกันทุกจุดที่ encode query
+
+    เก็บเวกเตอร์ที่ normalize แล้ว (อ่านอย่างเดียว) ถ้าระบุ path จะเขียนลง SQLite ด้วย
+    เพื่อให้อยู่ข้ามการ restart; แคชบนดิสก์ถูกล้างเมื่อ model_id เปลี่ยน
+    """
+
+    def __init__(self, maxsize=10_000, ttl=24 * 3600, path=None, model_id=""):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.model_id = model_id
+        self.path = path
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = os.getpid()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            self._open_db(path)
+
+    def _open_db(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS query_emb ("
+            " key TEXT PRIMARY KEY, vec BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        row = db.execute("SELECT v FROM meta WHERE k='model_id'").fetchone()
+        if row is None or row[0] != self.model_id:
+            db.execute("DELETE FROM query_emb")
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('model_id', ?)", (self.model_id,))
+        db.execute("DELETE FROM query_emb WHERE created_at < ?", (time.time() - self.ttl,))
+        db.commit()
+        self._db = db
+
+    def _remember(self, key, vec, created):
+        self._mem[key] = (vec, created)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+
+    def _ensure_db(self):
+        # connection SQLite ใช้ข้าม fork ไม่ได้ process ลูก (เช่น gunicorn worker) จึงเปิดใหม่เอง
+        # เรียกขณะถือ _lock อยู่แล้ว
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            if self.path:
+                self._open_db(self.path)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            self._ensure_db()
+            item = self._mem.get(key)
+            if item is not None and now - item[1] <= self.ttl:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._mem[key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vec, created_at FROM query_emb WHERE key=?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    vec = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vec, row[1])
+                    self.disk_hits += 1
+                    return vec
+            self.misses += 1
+            return None
+
+    def put(self, key, vec):
+        vec = np.array(vec, dtype=np.float32).reshape(-1)
+        vec.flags.writeable = False
+        now = time.time()
+        with self._lock:
+            self._ensure_db()
+            self._remember(key, vec, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_emb VALUES (?, ?, ?)", (key, vec.tobytes(), now)
+                )
+                self._db.commit()
+        return vec
+
+    def get_or_encode(self, text, encode):
+        """encode(list[str]) -> ndarray (n, d) ที่ normalize แล้ว
+
+        normalize เฉพาะคีย์ของแคช ส่วนที่ส่งให้โมเดลคือข้อความเดิม
+        """
+        key = normalize_query(text)
+        vec = self.get(key)
+        if vec is None:
+            vec = self.put(key, encode([str(text or "")])[0])
+        return vec
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._mem),
+            }
@@ -0,0 +1,107 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchingEncoder:
+    """รวม query จากทุก request thread แล้ว encode เป็น batch เดียว
+
+    thread เบื้องหลังรอ query แรก จากนั้นเก็บต่ออีกไม่เกิน max_wait_ms หรือจนครบ max_batch
+    แล้วเรียก encode_fn ครั้งเดียว ผลลัพธ์ส่งกลับทาง Future ของแต่ละ query
+    ถ้าคิวเต็ม query นั้นจะถูก encode ใน thread ของผู้เรียกเลย (ไม่รอคิว)
+    """
+
+    def __init__(self, encode_fn, max_batch=32, max_wait_ms=5.0, max_queue=1024):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._q = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._batch_sizes = deque(maxlen=1000)
+        self._batch_ms = deque(maxlen=1000)
+        self.batches = 0
+        self.items = 0
+        self.inline = 0
+
+    def _ensure_worker(self):
+        # เริ่ม thread ครั้งแรกที่ใช้งาน และเริ่มใหม่ใน process ลูกหลัง fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._q = queue.Queue(maxsize=self._q.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="encoder-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, text) -> Future:
+        self._ensure_worker()
+        fut = Future()
+        try:
+            self._q.put_nowait((text, fut))
+        except queue.Full:
+            self.inline += 1
+            fut.set_result(np.asarray(self.encode_fn([text]), dtype=np.float32)[0])
+        return fut
+
+    def encode(self, texts, timeout=30.0) -> np.ndarray:
+        futures = [self.submit(t) for t in texts]
+        return np.stack([f.result(timeout=timeout) for f in futures])
+
+    def _collect(self):
+        batch = [self._q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [t for t, _ in batch]
+            t0 = time.perf_counter()
+            try:
+                emb = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            took = (time.perf_counter() - t0) * 1000
+            for (_, fut), vec in zip(batch, emb):
+                fut.set_result(vec)
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._batch_ms.append(took)
+
+    def stats(self):
+        with self._lock:
+            sizes = np.asarray(self._batch_sizes) if self._batch_sizes else np.zeros(1)
+            ms = np.asarray(self._batch_ms) if self._batch_ms else np.zeros(1)
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "inline": self.inline,
+                "queue_depth": self._q.qsize(),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "batch_size_avg": round(float(sizes.mean()), 2),
+                "batch_size_max": int(sizes.max()),
+                "batch_ms_p50": round(float(np.percentile(ms, 50)), 2),
+                "batch_ms_p95": round(float(np.percentile(ms, 95)), 2),
+            }
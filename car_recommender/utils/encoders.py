@@ -0,0 +1,81 @@
+import os
+
+from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+# torch = PyTorch FP32 (เดิม), onnx = ONNX Runtime FP32, onnx-int8 = ONNX dynamic quantization int8
+# สอง backend หลังต้องติดตั้ง optimum[onnxruntime] เพิ่ม
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def int8_file_name(quantization="avx2"):
+    return f"onnx/model_qint8_{quantization}.onnx"
+
+
+def export_int8(model_name=MODEL_NAME, out_dir="embeddings/encoder_onnx", quantization="avx2"):
+    """export โมเดลเป็น ONNX แล้วทำ dynamic quantization int8 เก็บไว้ที่ out_dir"""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    onnx_model = SentenceTransformer(model_name, backend="onnx")
+    onnx_model.save(out_dir)
+    export_dynamic_quantized_onnx_model(onnx_model, quantization, out_dir)
+    return os.path.join(out_dir, int8_file_name(quantization))
+
+
+def load_encoder(backend="torch", model_name=MODEL_NAME, onnx_dir="embeddings/encoder_onnx",
+                 quantization="avx2"):
+    """คืน SentenceTransformer ตาม backend ที่เลือก ทุกตัวใช้ .encode() แบบเดียวกัน
+
+    onnx-int8 จะ export ลง onnx_dir ให้ครั้งแรกถ้ายังไม่มีไฟล์
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"unknown encoder backend {backend!r}, expected one of {ENCODER_BACKENDS}")
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs={"provider": "CPUExecutionProvider"})
+
+    file_name = int8_file_name(quantization)
+    if not os.path.exists(os.path.join(onnx_dir, file_name)):
+        export_int8(model_name, onnx_dir, quantization)
+    return SentenceTransformer(
+        onnx_dir,
+        backend="onnx",
+        model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider"},
+    )
+
+
+class MultiProcessEncoder:
+    """encode ตอน build ด้วย SentenceTransformer.encode_multi_process กระจายหลาย process บน CPU
+
+    workers <= 1 ใช้ model.encode ตามปกติ; pool เริ่มเมื่อเรียกครั้งแรกและปิดด้วย close()
+    """
+
+    def __init__(self, model, workers=None, batch_size=64):
+        self.model = model
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.batch_size = batch_size
+        self._pool = None
+
+    def __call__(self, texts):
+        if self.workers <= 1:
+            return self.model.encode(texts, batch_size=self.batch_size)
+        if self._pool is None:
+            # process ลูก (spawn) import torch ใหม่: ใช้ 1 thread ต่อ process ไม่แย่ง core กันเอง
+            os.environ.setdefault("OMP_NUM_THREADS", "1")
+            self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+        # แบ่งงานให้แต่ละ process พอ ๆ กัน แต่ไม่เล็กกว่า batch
+        chunk = max(self.batch_size, -(-len(texts) // (self.workers * 4)))
+        return self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size,
+                                               chunk_size=chunk)
+
+    def close(self):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
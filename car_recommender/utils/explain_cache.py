@@ -0,0 +1,244 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def catalogue_fingerprint(path):
+    """ลายนิ้วมือของไฟล์ catalogue (mtime + ขนาด) ใช้ตรวจว่าถูก build ใหม่หรือยัง"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def spec_hash(text):
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:16]
+
+
+class ExplanationCache:
+    """แคชคำอธิบายรถ 2 ชั้น: LRU ในหน่วยความจำ + SQLite บนดิสก์
+
+    คีย์คือ (row_id, spec_hash, intent) — spec_hash กันกรณีสเปครถเปลี่ยน
+    ทุกคีย์ผูกกับ fingerprint ของ catalogue ที่โหลดอยู่ (set_fingerprint ตอนโหลด catalogue ใหม่)
+    รายการของ catalogue อื่นจึงไม่ถูกอ่าน แม้ worker ตัวอื่นยังเขียนด้วย fingerprint เก่าอยู่
+
+    ไฟล์ SQLite ใช้ร่วมกันหลาย worker: ถ้าดิสก์ผิดพลาด (เช่น "database is locked" เกิน busy_timeout)
+    get จะนับเป็น miss และ put ข้ามการเขียน ไม่โยน error ขึ้นไปถึง request (นับไว้ใน stats()["db_errors"])
+    """
+
+    # เขียน accessed_at ของรายการที่อ่านจากดิสก์สะสมไว้ แล้ว flush ทีเดียวตอน put หรือเมื่อครบจำนวนนี้
+    TOUCH_BATCH = 256
+
+    def __init__(self, path=None, fingerprint="", ttl=7 * 24 * 3600,
+                 max_entries=50_000, hot_size=2_048, busy_timeout=1.0):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hot_size = hot_size
+        self.busy_timeout = busy_timeout
+        self._hot = OrderedDict()
+        self._touched = {}
+        # _db_rows นับเฉพาะคีย์ที่ process นี้เขียน แต่ worker อื่นเขียนไฟล์เดียวกันด้วย
+        # จึงนับใหม่จาก SQLite ทุก 1% ของเพดาน และก่อน evict ทุกครั้ง
+        self._recount_every = max(1, max_entries // 100)
+        self._since_count = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = os.getpid()
+        self._db_rows = 0
+        self.hits_hot = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db_errors = 0
+        if path:
+            self._open_db(path)
+
+    def _open_db(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = sqlite3.connect(path, timeout=self.busy_timeout, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS explanations ("
+            " key TEXT PRIMARY KEY, text TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS ix_accessed ON explanations(accessed_at)")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        # รายการของ catalogue อื่น (รวมคีย์แบบเดิมที่ไม่มี fingerprint นำหน้า) อ่านไม่ได้อีกแล้ว ลบทิ้ง
+        prefix = self._scoped("")
+        db.execute("DELETE FROM explanations WHERE substr(key, 1, ?) != ?", (len(prefix), prefix))
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+        db.execute("DELETE FROM explanations WHERE created_at < ?", (time.time() - self.ttl,))
+        db.commit()
+        self._db_rows = db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        self._db = db
+
+    def _db_failed(self, op, e):
+        """ดิสก์ผิดพลาด: ย้อน transaction ที่ค้าง แล้วทำงานต่อเหมือนไม่มีชั้นดิสก์สำหรับ call นี้"""
+        self.db_errors += 1
+        print(f"[explain_cache] {op} error: {e}")
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+
+    @staticmethod
+    def make_key(row_id, row_spec_hash, intent):
+        return f"{row_id}|{row_spec_hash}|{intent}"
+
+    def _scoped(self, key):
+        return f"{self.fingerprint}|{key}"
+
+    def set_fingerprint(self, fingerprint):
+        """เรียกทุกครั้งที่โหลด catalogue: fingerprint เปลี่ยน = ทิ้งคำอธิบายของ catalogue อื่นทั้งหมด"""
+        with self._lock:
+            self._ensure_db()
+            if fingerprint == self.fingerprint:
+                return
+            self.fingerprint = fingerprint
+            self._hot.clear()
+            if self._db is None:
+                return
+            self._touched.clear()
+            prefix = self._scoped("")
+            try:
+                self._db.execute("DELETE FROM explanations WHERE substr(key, 1, ?) != ?", (len(prefix), prefix))
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+                self._db.commit()
+                self._db_rows = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+            except sqlite3.Error as e:
+                # คีย์มี fingerprint นำหน้าอยู่แล้ว รายการเก่าที่ลบไม่สำเร็จจึงไม่ถูกอ่าน แค่ค้างจนหมด TTL/ถูก evict
+                self._db_failed("set_fingerprint", e)
+
+    def _ensure_db(self):
+        # connection SQLite ใช้ข้าม fork ไม่ได้ process ลูก (เช่น gunicorn worker) จึงเปิดใหม่เอง
+        # เรียกขณะถือ _lock อยู่แล้ว
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._db = None
+            self._touched.clear()
+            if self.path:
+                try:
+                    self._open_db(self.path)
+                except sqlite3.Error as e:
+                    # เปิดไม่ได้ (เช่นถูก lock นานเกิน busy_timeout): process นี้ใช้แค่ชั้นหน่วยความจำ
+                    self.db_errors += 1
+                    print(f"[explain_cache] open error, memory only: {e}")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            self._ensure_db()
+            key = self._scoped(key)
+            item = self._hot.get(key)
+            if item is not None:
+                text, created = item
+                if now - created <= self.ttl:
+                    self._hot.move_to_end(key)
+                    self.hits_hot += 1
+                    return text
+                del self._hot[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT text, created_at FROM explanations WHERE key=?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    self._db_failed("get", e)
+                    row = None
+                if row is not None and now - row[1] <= self.ttl:
+                    # ไม่เขียนทันที: การ commit ทุกครั้งที่อ่านทำให้ผู้อ่านต้องต่อคิว write lock
+                    self._touched[key] = now
+                    if len(self._touched) >= self.TOUCH_BATCH:
+                        self._flush_touched()
+                    self._remember(key, row[0], row[1])
+                    self.hits_disk += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        now = time.time()
+        with self._lock:
+            self._ensure_db()
+            key = self._scoped(key)
+            self._remember(key, text, now)
+            if self._db is None:
+                return
+            self._touched.pop(key, None)
+            try:
+                # INSERT OR REPLACE รายงาน rowcount 1 แม้เป็นการเขียนทับ: นับเพิ่มเฉพาะคีย์ใหม่
+                exists = self._db.execute("SELECT 1 FROM explanations WHERE key=?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO explanations VALUES (?, ?, ?, ?)", (key, text, now, now)
+                )
+                if exists is None:
+                    self._db_rows += 1
+                    self._since_count += 1
+                if self._db_rows > self.max_entries or self._since_count >= self._recount_every:
+                    self._recount()
+                if self._db_rows > self.max_entries:
+                    self._evict_disk(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db_failed("put", e)
+                return
+            self._flush_touched()
+
+    def _flush_touched(self):
+        """เขียน accessed_at ที่สะสมไว้ใน transaction เดียว เขียนไม่สำเร็จก็ทิ้งได้ (ใช้แค่จัดลำดับการ evict)"""
+        if not self._touched or self._db is None:
+            return
+        touched, self._touched = self._touched, {}
+        try:
+            self._db.executemany(
+                "UPDATE explanations SET accessed_at=? WHERE key=?",
+                [(t, k) for k, t in touched.items()],
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            self._db_failed("touch", e)
+
+    def _recount(self):
+        self._db_rows = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        self._since_count = 0
+
+    def _remember(self, key, text, created):
+        self._hot[key] = (text, created)
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._db.execute("DELETE FROM explanations WHERE created_at < ?", (now - self.ttl,))
+        # ตัดเหลือ 90% ของเพดาน โดยทิ้งรายการที่ไม่ได้ถูกอ่านนานที่สุด
+        keep = int(self.max_entries * 0.9)
+        cur = self._db.execute(
+            "DELETE FROM explanations WHERE key IN ("
+            " SELECT key FROM explanations ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (keep,),
+        )
+        self.evictions += max(cur.rowcount, 0)
+        self._recount()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_hot + self.hits_disk + self.misses
+            return {
+                "hits_hot": self.hits_hot,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": round((self.hits_hot + self.hits_disk) / lookups, 4) if lookups else 0.0,
+                "hot_entries": len(self._hot),
+                "disk_entries": self._db_rows,
+                "evictions": self.evictions,
+                "db_errors": self.db_errors,
+            }
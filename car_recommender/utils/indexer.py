@@ -0,0 +1,370 @@
+"""ดูแล FAISS index แบบ incremental บน IndexIDMap2 แทนการ encode ใหม่ทั้งชุดทุกครั้ง
+
+แต่ละแถวมี id คงที่ (faiss_id) จาก (full_name, make, series, year) และ content_hash ของ description
+รอบถัดไปเทียบกับ catalogue ชุดก่อนใน store:
+- added    id ใหม่ -> encode แล้ว add_with_ids
+- updated  id เดิมแต่ description เปลี่ยน -> ลบแล้ว encode ใหม่
+- removed  id ที่หายไปจากข้อมูลใหม่ -> remove_ids
+- skipped  description เหมือนเดิม -> ใช้เวกเตอร์เดิม (ราคาและคอลัมน์อื่นยังอัปเดตตามปกติ)
+index, embeddings.npy และ catalogue เขียนลงโฟลเดอร์ store เดียวกันแล้วสลับทีเดียว (atomic)
+การ encode เขียนลง .npy ทีละ chunk ใน <store>.work (ดู utils/embedding_build.py) ถ้า crash กลางทาง
+รันซ้ำจะทำต่อจาก chunk ล่าสุด และเมทริกซ์ทั้งก้อนอยู่บนดิสก์แบบ memory-map ไม่ต้องพอดีกับ RAM
+
+ชนิดของ index (INDEX_KINDS) เลือกได้ตามขนาด catalogue: Flat ค้นแบบ exact และแก้ทีละแถวได้
+ส่วน HNSW32 / IVF-Flat / IVF-PQ สร้างใหม่จาก embeddings.npy ทุกรอบ (ไม่ต้อง encode ซ้ำ)
+เพราะ HNSW ลบเวกเตอร์ไม่ได้ และ IVF ควร train centroid ใหม่เมื่อข้อมูลเปลี่ยน
+
+stream_update_index ทำแบบเดียวกันกับ catalogue ที่มาเป็น chunk (เช่นจาก CSV ขนาดหลาย GB) โดยไม่ถือ
+DataFrame ทั้งก้อน: catalogue, embeddings.npy และ id เขียนต่อท้ายทีละ chunk แล้วสร้าง index จาก memmap
+"""
+import hashlib
+import os
+import shutil
+
+import faiss
+import numpy as np
+import pandas as pd
+
+from utils.catalogue_store import (CatalogueWriter, NpyAppender, has_catalogue, read_catalogue,
+                                   resolve_catalogue, write_catalogue)
+from utils.embedding_build import cleanup, encode_to_npy
+
+KEY_COLUMNS = ("full_name", "make", "series", "year")
+INDEX_KINDS = ("Flat", "HNSW32", "IVF-Flat", "IVF-PQ")
+# จำนวนจุดที่ใช้ train IVF / PQ สูงสุด (สุ่มจาก catalogue)
+MAX_TRAIN_POINTS = 100_000
+# จำนวนแถวต่อรอบเวลา encode / คัดลอกเวกเตอร์ / add เข้า index
+CHUNK_ROWS = 10_000
+INDEX_FILE = "index.faiss"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+
+def _hash64(text: str) -> int:
+    # id ของ FAISS เป็น int64 ที่ต้องไม่ติดลบ (-1 คือ "ไม่พบ")
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def _text(s: pd.Series) -> pd.Series:
+    return s.astype(object).where(s.notna(), "").astype(str).str.strip()
+
+
+class KeyCounter:
+    """นับจำนวนครั้งที่พบ key (hash int64) ข้ามหลาย chunk ใช้หน่วยความจำ ~8 ไบต์ต่อ key
+
+    key ที่เคยพบเก็บเป็นอาร์เรย์เรียงลำดับหลายก้อน (ขนาดลดหลั่นแบบ 2 เท่า รวมก้อนเมื่อขนาดใกล้กัน)
+    จึงเพิ่ม chunk ใหม่ได้โดยไม่ต้องเรียงใหม่ทั้งหมดทุกครั้ง เฉพาะ key ที่พบเกิน 1 ครั้งเก็บจำนวนใน dict
+    """
+
+    def __init__(self):
+        self._runs = []
+        self._repeats = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def counts(self, keys: np.ndarray) -> np.ndarray:
+        """จำนวนครั้งที่พบแต่ละ key มาก่อน (0 = ยังไม่เคยพบ)"""
+        keys = np.asarray(keys, dtype=np.int64)
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self._runs:
+            pos = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            found |= run[pos] == keys
+        out = found.astype(np.int64)
+        if self._repeats:
+            for i in np.flatnonzero(found):
+                out[i] = self._repeats.get(int(keys[i]), 1)
+        return out
+
+    def add(self, keys: np.ndarray) -> np.ndarray:
+        """บันทึก keys แล้วคืนลำดับการพบของแต่ละแถว (0 = ครั้งแรกนับรวมทุก chunk ก่อนหน้า)"""
+        keys = np.asarray(keys, dtype=np.int64)
+        occ = pd.Series(keys).groupby(keys, sort=False).cumcount().to_numpy()
+        uniq, first, n = np.unique(keys, return_index=True, return_counts=True)
+        prior = self.counts(uniq)
+        occ += prior[np.searchsorted(uniq, keys)]
+        for k, total in zip(uniq[prior + n > 1], (prior + n)[prior + n > 1]):
+            self._repeats[int(k)] = int(total)
+        run = uniq[prior == 0]
+        self._size += len(run)
+        while self._runs and len(self._runs[-1]) <= 2 * len(run):
+            run = np.union1d(self._runs.pop(), run)
+        if len(run):
+            self._runs.append(run)
+        return occ
+
+
+def stable_ids(df: pd.DataFrame, counter: KeyCounter = None) -> np.ndarray:
+    """id คงที่ต่อแถว ถ้า key ซ้ำกัน (รุ่นย่อยชื่อเดียวกันหลายราคา) ต่อท้ายด้วยลำดับที่พบ
+
+    counter: ส่ง KeyCounter ตัวเดิมทุก chunk เมื่อสร้างทีละ chunk ลำดับที่พบจึงนับต่อเนื่องข้าม chunk
+    """
+    parts = [_text(df[c]) if c in df.columns else pd.Series([""] * len(df), index=df.index)
+             for c in KEY_COLUMNS]
+    if "year" in df.columns:
+        parts[3] = pd.to_numeric(df["year"], errors="coerce").astype("Int64").astype(str)
+    keys = pd.concat(parts, axis=1, keys=KEY_COLUMNS)
+    if counter is None:
+        occ = keys.groupby(list(KEY_COLUMNS), sort=False).cumcount().to_numpy()
+        out = np.empty(len(df), dtype=np.int64)
+        for i, (row, o) in enumerate(zip(keys.itertuples(index=False, name=None), occ)):
+            key = "\x1f".join(row) + (f"\x1f#{o}" if o else "")
+            out[i] = _hash64(key)
+        return out
+    # id ของการพบครั้งแรกคือ hash ของ key ล้วน ใช้เป็นตัวนับได้เลย
+    joined = ["\x1f".join(row) for row in keys.itertuples(index=False, name=None)]
+    out = np.fromiter((_hash64(k) for k in joined), dtype=np.int64, count=len(joined))
+    occ = counter.add(out)
+    for i in np.flatnonzero(occ):
+        out[i] = _hash64(f"{joined[i]}\x1f#{occ[i]}")
+    return out
+
+
+def content_hashes(df: pd.DataFrame, column="description") -> np.ndarray:
+    return np.fromiter((_hash64(t) for t in _text(df[column])), dtype=np.int64, count=len(df))
+
+
+def ivf_nlist(n: int) -> int:
+    # ~4*sqrt(n) cluster แต่ต้องมีจุด train อย่างน้อย 39 จุดต่อ cluster
+    return int(max(1, min(4 * np.sqrt(n), n // 39)))
+
+
+def factory_string(kind: str, dim: int, n: int) -> str:
+    if kind == "Flat":
+        return "Flat"
+    if kind == "HNSW32":
+        return "HNSW32,Flat"
+    if kind == "IVF-Flat":
+        return f"IVF{ivf_nlist(n)},Flat"
+    if kind == "IVF-PQ":
+        # sub-vector ละ 8 มิติ; codebook 256 ตัวต้องการจุด train ~10k จุด ถ้าน้อยกว่านั้นใช้ 16 ตัว
+        m = dim // 8 if dim % 8 == 0 else dim // 4
+        nbits = 8 if n >= 256 * 39 else 4
+        return f"IVF{ivf_nlist(n)},PQ{m}x{nbits}"
+    raise ValueError(f"unknown index kind {kind!r}, expected one of {INDEX_KINDS}")
+
+
+def _add_chunked(index, emb, ids, rows=None, chunk_rows=CHUNK_ROWS):
+    rows = np.arange(len(emb)) if rows is None else rows
+    for lo in range(0, len(rows), chunk_rows):
+        part = rows[lo:lo + chunk_rows]
+        index.add_with_ids(np.ascontiguousarray(emb[part], dtype=np.float32), ids[part])
+
+
+def _scatter(dst, dst_rows, src, src_rows, chunk_rows=CHUNK_ROWS):
+    # dst[dst_rows] = src[src_rows] ทีละช่วง ไม่สร้างสำเนาทั้งก้อน
+    for lo in range(0, len(dst_rows), chunk_rows):
+        dst[dst_rows[lo:lo + chunk_rows]] = src[src_rows[lo:lo + chunk_rows]]
+
+
+def build_index(kind: str, emb: np.ndarray, ids: np.ndarray, seed=0):
+    """สร้าง IndexIDMap2 ชนิด kind จากเมทริกซ์ที่ normalize แล้ว พร้อม id ต่อแถว"""
+    n, dim = emb.shape
+    inner = faiss.index_factory(dim, factory_string(kind, dim, n), faiss.METRIC_L2)
+    if not inner.is_trained:
+        sample = emb
+        if n > MAX_TRAIN_POINTS:
+            pick = np.random.default_rng(seed).choice(n, MAX_TRAIN_POINTS, replace=False)
+            sample = emb[np.sort(pick)]
+        inner.train(np.ascontiguousarray(sample, dtype=np.float32))
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        # ให้ reconstruct ได้ (EmbeddingStore ใช้เมื่อไม่มี embeddings.npy)
+        ivf.set_direct_map_type(faiss.DirectMap.Array)
+    index = faiss.IndexIDMap2(inner)
+    _add_chunked(index, emb, ids)
+    return index
+
+
+def _previous(store_path, load_index=True):
+    """คืน (faiss_id, content_hash, embeddings แบบ memory-map, index) ของชุดก่อน หรือ None ถ้าใช้ต่อไม่ได้"""
+    if not has_catalogue(store_path):
+        return None
+    # เปิดทุกไฟล์จากเวอร์ชันเดียวกัน แม้ build อื่นจะสลับ CURRENT ระหว่างนี้
+    store_path = resolve_catalogue(store_path)
+    index_path = os.path.join(store_path, INDEX_FILE)
+    emb_path = os.path.join(store_path, EMBEDDINGS_FILE)
+    if not (os.path.exists(index_path) and os.path.exists(emb_path)):
+        return None
+    prev = read_catalogue(store_path, columns=("faiss_id", "content_hash"))
+    if "faiss_id" not in prev.columns or "content_hash" not in prev.columns:
+        return None
+    # index เดิมใช้ต่อเฉพาะตอนแก้ Flat ทีละแถว ชนิดอื่นสร้างใหม่จาก embeddings
+    index = faiss.read_index(index_path) if load_index else None
+    emb = np.load(emb_path, mmap_mode="r")
+    bad_index = index is not None and (not isinstance(index, faiss.IndexIDMap2) or index.ntotal != len(prev))
+    if bad_index or len(emb) != len(prev):
+        print(f"{store_path}: index/embeddings ไม่ตรงกับ catalogue สร้างใหม่ทั้งหมด")
+        return None
+    return prev["faiss_id"].to_numpy(), prev["content_hash"].to_numpy(), emb, index
+
+
+def update_index(df: pd.DataFrame, store_path: str, encode, kind: str = "Flat",
+                 chunk_rows: int = CHUNK_ROWS, work_dir: str = None) -> dict:
+    """อัปเดต store ให้ตรงกับ df โดย encode เฉพาะแถวใหม่/เปลี่ยน (kind: หนึ่งใน INDEX_KINDS)
+
+    encode(list[str]) -> ndarray (n, d) float32 (ยังไม่ต้อง normalize) ถูกเรียกทีละ chunk_rows แถว
+    คืนจำนวนแถว added / updated / removed / skipped
+    """
+    if df.empty:
+        raise ValueError("catalogue ว่าง: ไม่มีแถวให้สร้าง index")
+    df = df.reset_index(drop=True).copy()
+    df["faiss_id"] = stable_ids(df)
+    df["content_hash"] = content_hashes(df)
+    ids = df["faiss_id"].to_numpy()
+    hashes = df["content_hash"].to_numpy()
+
+    prev = _previous(store_path, load_index=(kind == "Flat"))
+    if prev is None:
+        prev_ids = np.empty(0, dtype=np.int64)
+        prev_hashes = prev_ids
+        prev_emb = None
+        index = None
+    else:
+        prev_ids, prev_hashes, prev_emb, index = prev
+
+    prev_pos = {int(i): p for p, i in enumerate(prev_ids)}
+    src = np.array([prev_pos.get(int(i), -1) for i in ids], dtype=np.int64)
+    known = src >= 0
+    unchanged = known.copy()
+    unchanged[known] = prev_hashes[src[known]] == hashes[known]
+    todo = np.flatnonzero(~unchanged)
+    removed = np.setdiff1d(prev_ids, ids)
+    stats = {
+        "added": int((~known).sum()),
+        "updated": int((known & ~unchanged).sum()),
+        "removed": int(len(removed)),
+        "skipped": int(unchanged.sum()),
+    }
+
+    work_dir = work_dir or store_path.rstrip("/\\") + ".work"
+    os.makedirs(work_dir, exist_ok=True)
+    pending_path = os.path.join(work_dir, "pending.npy")
+    new_vecs = None
+    if len(todo):
+        new_vecs = encode_to_npy(df["description"].iloc[todo].tolist(), pending_path, encode,
+                                 chunk_rows=chunk_rows)
+
+    dim = new_vecs.shape[1] if new_vecs is not None else prev_emb.shape[1]
+    # embeddings.npy เรียงตามแถวของ catalogue ชุดใหม่ (ตำแหน่งแถว == ตำแหน่งในเมทริกซ์)
+    emb_path = os.path.join(work_dir, EMBEDDINGS_FILE)
+    emb = np.lib.format.open_memmap(emb_path, mode="w+", dtype=np.float32, shape=(len(df), dim))
+    if stats["skipped"]:
+        _scatter(emb, np.flatnonzero(unchanged), prev_emb, src[unchanged], chunk_rows)
+    if new_vecs is not None:
+        _scatter(emb, todo, new_vecs, np.arange(len(todo)), chunk_rows)
+    emb.flush()
+
+    incremental = (kind == "Flat" and index is not None
+                   and isinstance(faiss.downcast_index(index.index), faiss.IndexFlat))
+    if incremental:
+        stale = np.concatenate([removed, prev_ids[src[known & ~unchanged]]]).astype(np.int64)
+        if len(stale):
+            index.remove_ids(faiss.IDSelectorBatch(stale))
+        if new_vecs is not None:
+            _add_chunked(index, emb, ids, todo, chunk_rows)
+    else:
+        index = build_index(kind, emb, ids)
+
+    write_catalogue(df, store_path, extra_files={
+        INDEX_FILE: lambda p: faiss.write_index(index, p),
+        EMBEDDINGS_FILE: lambda p: os.replace(emb_path, p),
+    })
+    cleanup(pending_path)
+    if not os.listdir(work_dir):
+        os.rmdir(work_dir)
+    stats["rows"] = len(df)
+    stats["ntotal"] = int(index.ntotal)
+    stats["kind"] = kind
+    return stats
+
+
+def stream_update_index(chunks, store_path: str, encode, kind: str = "Flat",
+                        chunk_rows: int = CHUNK_ROWS, work_dir: str = None) -> dict:
+    """แบบ update_index แต่รับ catalogue เป็น iterable ของ DataFrame ที่ทำความสะอาดแล้ว (คอลัมน์เหมือนกันทุก chunk)
+
+    หน่วยความจำขึ้นกับขนาด chunk บวก ~8-16 ไบต์ต่อแถวสำหรับ id ของ catalogue ชุดก่อน/ชุดใหม่
+    index สร้างใหม่จาก embeddings.npy เสมอ (ไม่แก้ Flat ทีละแถวแบบ update_index)
+    เวกเตอร์ที่ encode แล้วเก็บใน <store>.work/pending-<chunk>.npy จนจบ รันซ้ำหลัง crash จึงไม่ encode ซ้ำ
+    """
+    prev = _previous(store_path, load_index=False)
+    if prev is None:
+        prev_ids = np.empty(0, dtype=np.int64)
+        prev_hashes = prev_ids
+        prev_emb = None
+    else:
+        prev_ids, prev_hashes, prev_emb, _ = prev
+    order = np.argsort(prev_ids, kind="stable")
+    sorted_prev = prev_ids[order]
+    matched = np.zeros(len(prev_ids), dtype=bool)
+
+    work_dir = work_dir or store_path.rstrip("/\\") + ".work"
+    os.makedirs(work_dir, exist_ok=True)
+    emb_path = os.path.join(work_dir, EMBEDDINGS_FILE)
+    writer = CatalogueWriter(store_path)
+    counter = KeyCounter()
+    stats = {"added": 0, "updated": 0, "removed": 0, "skipped": 0}
+    all_ids, pending, emb_out = [], [], None
+
+    for c, df in enumerate(chunks):
+        if df.empty:
+            continue
+        df = df.reset_index(drop=True).copy()
+        df["faiss_id"] = stable_ids(df, counter)
+        df["content_hash"] = content_hashes(df)
+        ids = df["faiss_id"].to_numpy()
+        hashes = df["content_hash"].to_numpy()
+
+        src = np.full(len(df), -1, dtype=np.int64)
+        if len(sorted_prev):
+            pos = np.minimum(np.searchsorted(sorted_prev, ids), len(sorted_prev) - 1)
+            hit = sorted_prev[pos] == ids
+            src[hit] = order[pos[hit]]
+        known = src >= 0
+        matched[src[known]] = True
+        unchanged = known.copy()
+        unchanged[known] = prev_hashes[src[known]] == hashes[known]
+        todo = np.flatnonzero(~unchanged)
+        stats["added"] += int((~known).sum())
+        stats["updated"] += int((known & ~unchanged).sum())
+        stats["skipped"] += int(unchanged.sum())
+
+        new_vecs = None
+        if len(todo):
+            path = os.path.join(work_dir, f"pending-{c:06d}.npy")
+            pending.append(path)
+            new_vecs = encode_to_npy(df["description"].iloc[todo].tolist(), path, encode,
+                                     chunk_rows=chunk_rows, log=lambda *_: None)
+        dim = new_vecs.shape[1] if new_vecs is not None else prev_emb.shape[1]
+        vecs = np.empty((len(df), dim), dtype=np.float32)
+        if unchanged.any():
+            vecs[unchanged] = prev_emb[src[unchanged]]
+        if new_vecs is not None:
+            vecs[todo] = new_vecs
+        if emb_out is None:
+            emb_out = NpyAppender(emb_path, np.float32, (dim,))
+        emb_out.append(vecs)
+        writer.append(df)
+        all_ids.append(ids)
+        print(f"chunk {c + 1}: {writer.rows:,} แถว (encode {len(todo):,}, ใช้เวกเตอร์เดิม {int(unchanged.sum()):,})")
+
+    if emb_out is None:
+        shutil.rmtree(writer.tmp, ignore_errors=True)
+        raise ValueError("catalogue ว่าง: ไม่มีแถวให้สร้าง index")
+    emb_out.close()
+    ids = np.concatenate(all_ids)
+    stats["removed"] = int((~matched).sum())
+    index = build_index(kind, np.load(emb_path, mmap_mode="r"), ids)
+    writer.close(extra_files={
+        INDEX_FILE: lambda p: faiss.write_index(index, p),
+        EMBEDDINGS_FILE: lambda p: os.replace(emb_path, p),
+    })
+    for path in pending:
+        cleanup(path)
+    if not os.listdir(work_dir):
+        os.rmdir(work_dir)
+    stats["rows"] = len(ids)
+    stats["ntotal"] = int(index.ntotal)
+    stats["kind"] = kind
+    return stats
@@ -1,37 +1,136 @@
 from sentence_transformers import SentenceTransformer
-import faiss
 import pandas as pd
 import numpy as np
 import os
 import re
+import sys
+
+# รันแบบ python utils/process_data.py จากโฟลเดอร์ car_recommender: ให้ import utils.* ได้
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.body_type import OTHER, body_type_text, classify_body_type
+from utils.encoders import MODEL_NAME, MultiProcessEncoder
+from utils.indexer import KeyCounter, stream_update_index, update_index
+
+COLUMN_RENAMES = {
+    "Model Name": "full_name",
+    "Price": "price_thb",
+    "Details": "description",
+    "model": "make",
+    "engine": "engine",
+    "horsepower_hp": "horsepower_hp",
+    "gears": "gears",
+    "fuel_type": "fuel_type",
+}
+
+FUEL_MAP = {
+    "ดีเซล": "Diesel", "diesel": "Diesel",
+    "เบนซิน": "Petrol", "gasoline": "Petrol", "petrol": "Petrol",
+    "ไฟฟ้า": "EV", "electric": "EV", "bev": "EV", "ev": "EV",
+    "ไฮบริด": "Hybrid", "hybrid": "Hybrid", "hev": "Hybrid", "e:hev": "Hybrid",
+    "ปลั๊กอินไฮบริด": "PHEV", "plug-in hybrid": "PHEV", "phev": "PHEV",
+    "e20": "E20", "e85": "E85", "cng": "CNG", "lpg": "LPG", "mhev": "MHEV", "mild hybrid": "MHEV"
+}
+
+CANONICAL_TYPES = {
+    "sedan": "sedan", "ซีดาน": "sedan", "รถเก๋ง": "sedan", "เก๋ง": "sedan",
+    "hatchback": "hatchback", "แฮทช์แบ็ก": "hatchback", "แฮทช์แบ็ค": "hatchback",
+    "pickup": "pickup", "ปิคอัพ": "pickup", "ปิกอัพ": "pickup", "กระบะ": "pickup",
+    "suv": "suv", "เอสยูวี": "suv", "รถอเนกประสงค์": "suv",
+    "mpv": "mpv", "รถตู้": "van", "van": "van", "wagon": "wagon",
+    "coupe": "coupe", "คูเป้": "coupe", "convertible": "convertible"
+}
+
+# คีย์ของ drop_duplicates ใน clean_frame (โหมด streaming ใช้ hash ของคีย์นี้ตัดแถวซ้ำข้าม chunk)
+DEDUP_COLUMNS = ["full_name", "make", "price_thb", "description"]
+
+ENGINE_L_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:L|ลิตร)", flags=re.I)
+ENGINE_DIGITS_RE = re.compile(r"(\d)\s*\.\s*(\d)")
+# หนึ่งทางเลือกต่อคีย์ เรียงตามลำดับใน CANONICAL_TYPES: regex จะลองคีย์แรกกับทั้งข้อความก่อน
+# แล้วค่อยคีย์ถัดไป จึงได้ "คีย์แรกตามลำดับ dict ที่เป็น substring" เหมือนลูปเดิม
+TYPE_SUBSTRING_RE = re.compile(
+    "^(?:" + "|".join(f".*?({re.escape(k)})" for k in CANONICAL_TYPES) + ")", flags=re.S
+)
+
+
+def by_unique(s: pd.Series, fn) -> pd.Series:
+    """เรียก fn กับค่าที่ไม่ซ้ำของ s ครั้งเดียวแล้วกระจายผลกลับทุกแถว
+
+    คอลัมน์สเปค (type, fuel_type, engine, gears, ราคา ฯลฯ) มีค่าซ้ำกันมาก งานข้อความจึงทำแค่ต่อค่าไม่ซ้ำ
+    fn รับ Series ของค่าไม่ซ้ำ (รวม NaN) และต้องคืน Series ยาวเท่ากัน
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    out = fn(pd.Series(uniques, dtype=s.dtype if len(uniques) == 0 else None)).take(codes)
+    out.index = s.index
+    out.name = s.name
+    return out
+
+
+def _first_group(extracted: pd.DataFrame) -> pd.Series:
+    # กลุ่มที่จับได้ของแต่ละแถว (ทางเลือกใน regex จับได้ทีละกลุ่มเท่านั้น)
+    out = extracted.iloc[:, 0]
+    for c in extracted.columns[1:]:
+        out = out.where(out.notna(), extracted[c])
+    return out
+
+
+def parse_engine_l(engine: pd.Series) -> pd.Series:
+    """ลิตรจากข้อความเครื่องยนต์: "2.4 L" / "2.4 ลิตร" ก่อน ไม่พบค่อยใช้ตัวเลขรูป "2 . 4" """
+    return by_unique(engine, _parse_engine_l)
+
+
+def _parse_engine_l(engine: pd.Series) -> pd.Series:
+    s = engine.astype(str).str.replace(" .", ".", regex=False)
+    litres = pd.to_numeric(s.str.extract(ENGINE_L_RE, expand=False), errors="coerce")
+    digits = s.str.extract(ENGINE_DIGITS_RE)
+    fallback = pd.to_numeric(digits[0] + "." + digits[1], errors="coerce")
+    return litres.fillna(fallback).where(engine.notna())
+
+
+def normalize_fuel(fuel: pd.Series) -> pd.Series:
+    return by_unique(fuel, _normalize_fuel)
+
+
+def _normalize_fuel(fuel: pd.Series) -> pd.Series:
+    mapped = fuel.astype(str).str.strip().str.lower().map(FUEL_MAP)
+    return mapped.where(mapped.notna(), fuel)
+
+
+def normalize_type(t: pd.Series) -> pd.Series:
+    return by_unique(t, _normalize_type)
+
+
+def _normalize_type(t: pd.Series) -> pd.Series:
+    s = t.astype(str).str.strip().str.lower().str.replace(r"\s+", " ", regex=True)
+    out = s.map(CANONICAL_TYPES)
+    rest = out.isna()
+    if rest.any():
+        key = _first_group(s[rest].str.extract(TYPE_SUBSTRING_RE))
+        out[rest] = key.map(CANONICAL_TYPES).fillna(s[rest])
+    return out.where(t.notna())
+
 
 def load_and_clean_data(file_path):
     df = pd.read_csv(file_path, encoding="utf-8-sig")
+    return clean_frame(df)
 
+
+def clean_frame(df):
+    """กฎทำความสะอาดทั้งหมดของ load_and_clean_data กับ DataFrame ที่อ่านมาแล้ว (ไม่มี callback รายแถว)"""
     # รีเนมคอลัมน์หลัก
-    df = df.rename(columns={
-        "Model Name": "full_name",
-        "Price": "price_thb",
-        "Details": "description",
-        "model": "make",
-        "engine": "engine",
-        "horsepower_hp": "horsepower_hp",
-        "gears": "gears",
-        "fuel_type": "fuel_type",
-    })
+    df = df.rename(columns=COLUMN_RENAMES)
 
     #ทำความสะอาดราคา 
     df = df.dropna(subset=["full_name", "price_thb", "description", "make"])
     df = df[df["description"].astype(str).str.strip() != ""]
 
-    df["price_thb"] = (
-        df["price_thb"].astype(str)
+    df["price_thb"] = by_unique(df["price_thb"], lambda u: pd.to_numeric(
+        u.astype(str)
         .str.replace("บาท", "", regex=False)
         .str.replace(",", "", regex=False)
         .str.replace("฿", "", regex=False)
-        .str.strip()
-    )
-    df["price_thb"] = pd.to_numeric(df["price_thb"], errors="coerce")
+        .str.strip(),
+        errors="coerce",
+    ))
     df = df.dropna(subset=["price_thb"])
     df["price_thb"] = df["price_thb"].astype(int)
 
@@ -40,32 +139,28 @@ def load_and_clean_data(file_path):
             df[col] = np.nan
 
     #horsepower_hp
-    df["horsepower_hp"] = (
-        df["horsepower_hp"]
-        .astype(str)
+    df["horsepower_hp"] = by_unique(df["horsepower_hp"], lambda u: pd.to_numeric(
+        u.astype(str)
         .str.replace("แรงม้า", "", regex=False)
-        .str.extract(r"(\d+)", expand=False)
-    )
-    df["horsepower_hp"] = pd.to_numeric(df["horsepower_hp"], errors="coerce")
+        .str.extract(r"(\d+)", expand=False),
+        errors="coerce",
+    ))
 
     #gears
-    df["gears"] = (
-        df["gears"]
-        .astype(str)
-        .str.replace(r"\s+", " ", regex=True)
-        .str.strip()
-    )
-    df.loc[df["gears"].str.lower().isin(["nan", "none", ""]), "gears"] = np.nan
+    def _gears(u):
+        g = u.astype(str).str.replace(r"\s+", " ", regex=True).str.strip()
+        return g.where(~g.str.lower().isin(["nan", "none", ""]), np.nan)
+    df["gears"] = by_unique(df["gears"], _gears)
 
     #engine_cc:
     if "engine_cc" in df.columns:
-        cc_num = (
-            df["engine_cc"].astype(str)
+        cc_num = by_unique(df["engine_cc"], lambda u: pd.to_numeric(
+            u.astype(str)
             .str.replace(",", "", regex=False)
             .str.replace("CC", "", regex=False)
-            .str.extract(r"(\d+)", expand=False)
-        )
-        cc_num = pd.to_numeric(cc_num, errors="coerce")
+            .str.extract(r"(\d+)", expand=False),
+            errors="coerce",
+        ))
         df["engine_cc"] = cc_num.astype("Int64")
 
         liters_from_cc = cc_num / 1000.0
@@ -73,25 +168,7 @@ def load_and_clean_data(file_path):
 
     #engine: 
     if "engine" in df.columns:
-        def _parse_engine_l(x):
-            if pd.isna(x):
-                return np.nan
-            s = str(x).replace(" .", ".")
-            m = re.search(r"(\d+(?:\.\d+)?)\s*(?:L|ลิตร)", s, flags=re.I)
-            if m:
-                try:
-                    return float(m.group(1))
-                except:
-                    return np.nan
-            m2 = re.search(r"(\d)\s*\.\s*(\d)", s)  
-            if m2:
-                try:
-                    return float(f"{m2.group(1)}.{m2.group(2)}")
-                except:
-                    return np.nan
-            return np.nan
-
-        df["engine_l"] = df["engine_l"].fillna(df["engine"].apply(_parse_engine_l))
+        df["engine_l"] = df["engine_l"].fillna(parse_engine_l(df["engine"]))
 
     #year
     if "year_from_model_name" in df.columns:
@@ -104,81 +181,133 @@ def load_and_clean_data(file_path):
 
     #series
     if "series" in df.columns:
-        df["series"] = df["series"].astype(str).str.strip()
-        df.loc[df["series"].isin(["", "nan", "None"]), "series"] = np.nan
+        def _series(u):
+            sr = u.astype(str).str.strip()
+            return sr.where(~sr.isin(["", "nan", "None"]), np.nan)
+        df["series"] = by_unique(df["series"], _series)
     else:
         df["series"] = np.nan
 
     #normalize fuel_type 
-    def _normalize_fuel(x):
-        if pd.isna(x): return x
-        s = str(x).strip().lower()
-        mapping = {
-            "ดีเซล": "Diesel", "diesel": "Diesel",
-            "เบนซิน": "Petrol", "gasoline": "Petrol", "petrol": "Petrol",
-            "ไฟฟ้า": "EV", "electric": "EV", "bev": "EV", "ev": "EV",
-            "ไฮบริด": "Hybrid", "hybrid": "Hybrid", "hev": "Hybrid", "e:hev": "Hybrid",
-            "ปลั๊กอินไฮบริด": "PHEV", "plug-in hybrid": "PHEV", "phev": "PHEV",
-            "e20": "E20", "e85": "E85", "cng": "CNG", "lpg": "LPG", "mhev": "MHEV", "mild hybrid": "MHEV"
-        }
-        return mapping.get(s, x)
-    df["fuel_type"] = df["fuel_type"].apply(_normalize_fuel)
-    #ody type
-    CANONICAL_TYPES = {
-        "sedan": "sedan", "ซีดาน": "sedan", "รถเก๋ง": "sedan", "เก๋ง": "sedan",
-        "hatchback": "hatchback", "แฮทช์แบ็ก": "hatchback", "แฮทช์แบ็ค": "hatchback",
-        "pickup": "pickup", "ปิคอัพ": "pickup", "ปิกอัพ": "pickup", "กระบะ": "pickup",
-        "suv": "suv", "เอสยูวี": "suv", "รถอเนกประสงค์": "suv",
-        "mpv": "mpv", "รถตู้": "van", "van": "van", "wagon": "wagon",
-        "coupe": "coupe", "คูเป้": "coupe", "convertible": "convertible"
-    }
-
-    def _normalize_type(x: str):
-        if pd.isna(x):
-            return x
-        s = str(x).strip().lower()
-        s = re.sub(r"\s+", " ", s)
-        if s in CANONICAL_TYPES:
-            return CANONICAL_TYPES[s]
-        for key, val in CANONICAL_TYPES.items():
-            if key in s:
-                return val
-        return s 
-
-    if "type" in df.columns:
-        df["type"] = df["type"].apply(_normalize_type)
-    else:
+    df["fuel_type"] = normalize_fuel(df["fuel_type"])
+    #body type: แถวที่ไม่มี type จัดประเภทจาก series + description (ไม่เจอ keyword คงเป็นค่าว่าง)
+    if "type" not in df.columns:
         df["type"] = np.nan
+    missing = df["type"].isna()
+    if missing.any():
+        df["type"] = df["type"].astype(object)
+        guessed = classify_body_type(body_type_text(df[missing]))["body_type"]
+        df.loc[missing, "type"] = guessed.where(guessed != OTHER)
+    df["type"] = normalize_type(df["type"])
 
-    df = df.drop_duplicates(subset=["full_name", "make", "price_thb", "description"])
+    df = df.drop_duplicates(subset=DEDUP_COLUMNS)
 
     return df
 
 
+def dedup_hashes(df):
+    # hash 64 บิตของ DEDUP_COLUMNS (แปลงเป็นข้อความก่อน ชนิดที่อนุมานต่างกันในแต่ละ chunk จึงได้ hash เดียวกัน)
+    keys = df[DEDUP_COLUMNS].astype(str)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy().view(np.int64)
+
+
+def iter_clean_chunks(file_path, chunksize=100_000):
+    """load_and_clean_data แบบ streaming: อ่าน CSV ทีละ chunksize แถว ทำความสะอาดด้วยกฎเดียวกัน แล้ว yield ทีละ chunk
+
+    แถวซ้ำข้าม chunk ตัดด้วยชุด hash ของ DEDUP_COLUMNS (~8 ไบต์ต่อแถวที่ไม่ซ้ำ) เก็บแถวแรกที่พบเหมือน drop_duplicates
+    อ่านทุกคอลัมน์เป็นข้อความ ผลจึงไม่ขึ้นกับว่าชนิดที่ pandas อนุมานได้ในแต่ละ chunk ต่างกัน
+    """
+    seen = KeyCounter()
+    for raw in pd.read_csv(file_path, encoding="utf-8-sig", dtype=str, chunksize=chunksize):
+        df = clean_frame(raw)
+        if df.empty:
+            continue
+        yield df[seen.add(dedup_hashes(df)) == 0]
+
+
+class LazyEncoder:
+    """encoder สำหรับ build index ใช้กับ with: โหลดโมเดล (และ pool หลาย process) เมื่อมีแถวต้อง encode จริง
+    เท่านั้น จำนวน process / batch จาก env EMBED_WORKERS / EMBED_BATCH_SIZE ปิด pool ตอนออกจาก with"""
+
+    def __init__(self):
+        self._encoder = None
+
+    def __call__(self, texts):
+        if self._encoder is None:
+            self._encoder = MultiProcessEncoder(
+                SentenceTransformer(MODEL_NAME),
+                workers=int(os.getenv("EMBED_WORKERS", str(os.cpu_count() or 1))),
+                batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+            )
+        return self._encoder(texts)
 
-def build_faiss_index(df, save_path="embeddings/faiss_index.idx"):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._encoder is not None:
+            self._encoder.close()
+            self._encoder = None
+
+
+def build_faiss_index(df, store_path="embeddings/catalogue", kind=None):
+    """อัปเดต index + catalogue ใน store แบบ incremental (encode เฉพาะแถวใหม่หรือ description เปลี่ยน)
+
+    kind: Flat | HNSW32 | IVF-Flat | IVF-PQ (ค่าเริ่มต้นจาก env INDEX_KIND) ดู benchmarks/bench_index.py
+    """
+    kind = kind or os.getenv("INDEX_KIND", "Flat")
     if df.empty:
         print("ไม่มีข้อมูลพร้อมใช้งานสำหรับสร้าง FAISS index")
         return None
 
-    model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-    descriptions = df["description"].tolist()
-    embeddings = model.encode(descriptions, show_progress_bar=True).astype("float32")
+    os.makedirs("embeddings", exist_ok=True)
+    with LazyEncoder() as encode:
+        stats = update_index(df, store_path, encode, kind=kind,
+                             chunk_rows=int(os.getenv("EMBED_CHUNK_ROWS", "10000")))
+
+    # app.py โหลดจาก store แบบไบนารี (ชนิดข้อมูลครบ) ส่วน CSV ไว้ export ให้คนเปิดดูเท่านั้น
+    df.to_csv("embeddings/clean_data.csv", index=False, encoding="utf-8-sig")
+    _print_stats(stats)
+    return stats
 
-    faiss.normalize_L2(embeddings)
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)   
-    index.add(embeddings)
 
+def build_faiss_index_streaming(file_path, store_path="embeddings/catalogue", kind=None, chunksize=None):
+    """อ่าน-ทำความสะอาด-encode-เขียน store ทีละ chunk สำหรับ CSV ที่ใหญ่เกิน RAM
+
+    หน่วยความจำสูงสุดขึ้นกับ chunksize (env CLEAN_CHUNK_ROWS) ไม่ใช่ขนาดไฟล์ ใช้เวกเตอร์เดิมของแถวที่ description
+    ไม่เปลี่ยนเหมือน build_faiss_index และ export clean_data.csv ต่อท้ายทีละ chunk
+    """
+    kind = kind or os.getenv("INDEX_KIND", "Flat")
+    chunksize = chunksize or int(os.getenv("CLEAN_CHUNK_ROWS", "100000"))
     os.makedirs("embeddings", exist_ok=True)
-    faiss.write_index(index, save_path)
+    csv_tmp = "embeddings/clean_data.csv.tmp"
+
+    def export(chunks):
+        for i, df in enumerate(chunks):
+            df.to_csv(csv_tmp, index=False, encoding="utf-8-sig" if i == 0 else "utf-8",
+                      mode="w" if i == 0 else "a", header=(i == 0))
+            yield df
+
+    with LazyEncoder() as encode:
+        stats = stream_update_index(export(iter_clean_chunks(file_path, chunksize)), store_path, encode,
+                                    kind=kind, chunk_rows=int(os.getenv("EMBED_CHUNK_ROWS", "10000")))
+    os.replace(csv_tmp, "embeddings/clean_data.csv")
+    _print_stats(stats)
+    return stats
 
-    
-    df.to_csv("embeddings/clean_data.csv", index=False, encoding="utf-8-sig", float_format="%.0f")
+
+def _print_stats(stats):
     print("สร้างเสร็จเรียบร้อยแล้ว")
-    print(f"rows: {len(df)}  |  index.ntotal: {index.ntotal}")
-    return index
+    print(
+        f"rows: {stats['rows']}  |  index: {stats['kind']} ntotal {stats['ntotal']}  |  "
+        f"added: {stats['added']}  updated: {stats['updated']}  "
+        f"removed: {stats['removed']}  skipped: {stats['skipped']}"
+    )
 
 if __name__ == "__main__":
-    df = load_and_clean_data("data/Dataset.csv")
-    build_faiss_index(df)
+    # CLEAN_CHUNK_ROWS=100000 python utils/process_data.py  -> โหมด streaming สำหรับไฟล์ใหญ่
+    if os.getenv("CLEAN_CHUNK_ROWS"):
+        build_faiss_index_streaming("data/Dataset.csv")
+    else:
+        df = load_and_clean_data("data/Dataset.csv")
+        build_faiss_index(df)
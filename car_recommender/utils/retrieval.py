@@ -0,0 +1,362 @@
+import os
+import re
+
+import faiss
+import numpy as np
+import pandas as pd
+
+BODY_MAP = {
+    "pickup": "pickup", "truck": "pickup", "กระบะ": "pickup",
+    "sedan": "sedan", "saloon": "sedan", "เก๋ง": "sedan", "รถเก๋ง": "sedan",
+    "suv": "suv",
+    "mpv": "mpv", "van": "mpv",
+    "hatchback": "hatchback"
+}
+
+AT_MARKERS = ["a/t", " auto", "ออโต้", "cvt", "dct"]
+MT_MARKERS = ["m/t", " manual", "ธรรมดา"]
+MAKE_STOPWORDS = {"และ", "กับ", "หรือ", "and", "or"}
+MASK_CACHE_SIZE = 512
+
+
+def split_makes(target_make):
+    """'toyota, honda' / ['Toyota'] -> ['toyota', 'honda']"""
+    if isinstance(target_make, str):
+        raw = re.split(r'[,\s/&|]+', target_make.lower())
+        return [m for m in raw if m and m not in MAKE_STOPWORDS]
+    if isinstance(target_make, list):
+        return [m.lower() for m in target_make]
+    return []
+
+
+def _contains_any(s: pd.Series, words) -> np.ndarray:
+    out = np.zeros(len(s), dtype=bool)
+    for w in words:
+        out |= s.str.contains(w, regex=False).to_numpy()
+    return out
+
+
+def readonly(arr: np.ndarray) -> np.ndarray:
+    """ปิดการเขียนอาร์เรย์ที่สร้างครั้งเดียวตอนโหลด ให้ worker หลัง fork แชร์หน้าหน่วยความจำได้
+    (เขียนโดยไม่ตั้งใจจะ error แทนที่จะทำให้หน้าถูก copy เงียบ ๆ)"""
+    arr.flags.writeable = False
+    return arr
+
+
+class CatalogueFilters:
+    """คอลัมน์สำหรับกรองที่คำนวณครั้งเดียวตอนโหลด catalogue
+
+    แต่ละ query สร้าง mask แบบ NumPy ยาวเท่าจำนวนแถว แทนการวนเช็กทีละแถว
+    ตำแหน่งใน mask ตรงกับตำแหน่งแถวใน df (และ id ใน FAISS index)
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.n = len(df)
+        col = lambda c: (df[c] if c in df.columns else pd.Series([""] * self.n, index=df.index))
+        text = lambda c: col(c).astype(str).str.strip().str.lower()
+
+        price = pd.to_numeric(col("price_thb"), errors="coerce")
+        self.price_ok = price.notna().to_numpy()
+        self.price_thb = price.fillna(-1).to_numpy(dtype=np.int64)
+
+        name_lc = (
+            col("full_name").astype(str) + " " + col("series").astype(str) + " "
+            + col("description").astype(str) + " " + col("gears").astype(str)
+        ).str.lower()
+        has_at = _contains_any(name_lc, AT_MARKERS) | name_lc.str.contains(
+            r"\b\d+\s*at\b|\bat\b", regex=True).to_numpy()
+        has_mt = _contains_any(name_lc, MT_MARKERS) | name_lc.str.contains(
+            r"\b\d+\s*mt\b|\bmt\b", regex=True).to_numpy()
+        # is_AT / is_MT = แถวที่ผ่านเงื่อนไขเมื่อผู้ใช้ต้องการเกียร์นั้น
+        self.is_AT = ~has_mt
+        self.is_MT = ~has_at
+
+        self.make = text("make")
+        self.car_name = (col("full_name").astype(str) + " " + self.make).str.lower()
+        self.series = text("series")
+        make_cat = pd.Categorical(self.make)
+        self.make_codes = make_cat.codes.astype(np.int32)
+        self.make_vocab = {m: i for i, m in enumerate(make_cat.categories)}
+
+        t = col("type_norm") if "type_norm" in df.columns else col("type")
+        t = t.fillna("").astype(str).str.strip().str.lower()
+        body_cat = pd.Categorical(t.map(lambda x: BODY_MAP.get(x, x)))
+        self.body_codes = body_cat.codes.astype(np.int32)
+        self.body_vocab = {b: i for i, b in enumerate(body_cat.categories)}
+
+        for arr in (self.price_ok, self.price_thb, self.is_AT, self.is_MT,
+                    self.make_codes, self.body_codes):
+            readonly(arr)
+
+        self._make_masks = {}
+        self._series_masks = {}
+        for m in self.make_vocab:
+            self._make_mask(m)
+
+    @staticmethod
+    def _cached(cache: dict, key: str, build) -> np.ndarray:
+        hit = cache.get(key)
+        if hit is None:
+            if len(cache) >= MASK_CACHE_SIZE:
+                cache.clear()
+            hit = cache[key] = readonly(build())
+        return hit
+
+    def _make_mask(self, m: str) -> np.ndarray:
+        return self._cached(self._make_masks, m,
+                            lambda: self.car_name.str.contains(m, regex=False).to_numpy())
+
+    def _series_mask(self, sr: str) -> np.ndarray:
+        return self._cached(self._series_masks, sr,
+                            lambda: self.series.str.contains(sr, regex=False).to_numpy())
+
+    def body_mask(self, want: str) -> np.ndarray:
+        code = self.body_vocab.get(want)
+        if code is None:
+            return np.zeros(self.n, dtype=bool)
+        return self.body_codes == code
+
+    def mask(self, price_min=None, price_max=None, target_make=None, target_series=None,
+             body=None, trans=None, exclude_body=None) -> np.ndarray:
+        m = self.price_ok.copy()
+        if price_min is not None:
+            m &= self.price_thb >= float(price_min)
+        if price_max is not None:
+            m &= self.price_thb <= float(price_max)
+        if body:
+            m &= self.body_mask(body)
+        if exclude_body:
+            m &= ~self.body_mask(exclude_body)
+        if trans == "AT":
+            m &= self.is_AT
+        elif trans == "MT":
+            m &= self.is_MT
+        if target_make:
+            mk = np.zeros(self.n, dtype=bool)
+            for name in split_makes(target_make):
+                mk |= self._make_mask(name)
+            m &= mk
+        if target_series:
+            m &= self._series_mask(str(target_series).strip().lower())
+        return m
+
+
+class RowIds:
+    """id ใน FAISS ของแต่ละแถว (index แบบ IndexIDMap2 จาก utils/indexer.py)
+
+    faiss_ids[pos] = id ของแถวตำแหน่ง pos; แปลง id กลับเป็นตำแหน่งด้วย searchsorted
+    """
+
+    def __init__(self, faiss_ids):
+        self.faiss_ids = readonly(np.ascontiguousarray(faiss_ids, dtype=np.int64))
+        order = np.argsort(self.faiss_ids, kind="stable")
+        self._sorted = readonly(self.faiss_ids[order])
+        self._pos = readonly(order)
+
+    def __len__(self):
+        return len(self.faiss_ids)
+
+    def positions(self, ids) -> np.ndarray:
+        """ตำแหน่งแถวของแต่ละ id (-1 ถ้าไม่มีใน catalogue)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self._sorted):
+            return np.full(ids.shape, -1, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self._sorted, ids), len(self._sorted) - 1)
+        return np.where(self._sorted[i] == ids, self._pos[i], -1)
+
+
+def inner_index(index):
+    """index ตัวในสุด (ข้าม IndexIDMap / IndexIDMap2 ที่ห่อไว้)"""
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+
+def configure_index(index, ef_search=None, nprobe=None):
+    """ตั้งค่าเวลา search: efSearch ของ HNSW, nprobe ของ IVF (index ชนิดอื่นไม่มีผล)"""
+    inner = inner_index(index)
+    if ef_search and hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = int(ef_search)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if nprobe and ivf is not None:
+        ivf.nprobe = min(int(nprobe), ivf.nlist)
+    return index
+
+
+def search_params(index, sel):
+    """SearchParameters ชนิดที่ index ตัวในสุดต้องการ (IVF ไม่รับชนิดทั่วไป) พร้อมค่าที่ตั้งไว้ใน index"""
+    inner = inner_index(index)
+    if hasattr(inner, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=inner.hnsw.efSearch)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=sel)
+
+
+def filtered_search(index, qemb, allowed: np.ndarray, k: int, row_ids: RowIds = None):
+    """ค้น FAISS เฉพาะแถวที่ allowed เป็น True (ผ่าน IDSelector) คืน (scores, ตำแหน่งแถว) ของ query แรก
+
+    index ที่ id == ตำแหน่งแถว: ชุดเล็กใช้ IDSelectorBatch ชุดใหญ่ใช้ IDSelectorBitmap (เช็ก O(1) ต่อ id)
+    index แบบ IndexIDMap2 (ระบุ row_ids): id เป็น hash จึงใช้ IDSelectorBatch เสมอ แล้วแปลงผลกลับเป็นตำแหน่ง
+    """
+    if row_ids is not None:
+        pos = np.flatnonzero(allowed[:len(row_ids)])
+        k = min(k, len(pos))
+        if k == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        sel = faiss.IDSelectorBatch(row_ids.faiss_ids[pos])
+        scores, found = index.search(qemb, k, params=search_params(index, sel))
+        found_pos = row_ids.positions(found[0])
+        keep = (found[0] >= 0) & (found_pos >= 0)
+        return scores[0][keep], found_pos[keep]
+
+    if len(allowed) < index.ntotal:
+        # id ที่ไม่มีแถวใน catalogue ห้ามผ่าน (และกัน bitmap อ่านเกินขอบ)
+        allowed = np.concatenate([allowed, np.zeros(index.ntotal - len(allowed), dtype=bool)])
+    ids = np.flatnonzero(allowed)
+    k = min(k, len(ids))
+    if k == 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    if len(ids) * 8 < len(allowed):
+        sel = faiss.IDSelectorBatch(ids.astype(np.int64))
+    else:
+        bitmap = np.packbits(allowed, bitorder="little")
+        sel = faiss.IDSelectorBitmap(bitmap)
+    scores, found = index.search(qemb, k, params=search_params(index, sel))
+    keep = found[0] >= 0
+    return scores[0][keep], found[0][keep]
+
+
+class EmbeddingStore:
+    """เมทริกซ์ embedding ของ catalogue (normalize แล้ว) แบบ float32 contiguous อ่านอย่างเดียว
+
+    โหลดครั้งเดียวตอนเริ่มระบบ ถ้ามีไฟล์ .npy จาก process_data จะ memory-map จากดิสก์
+    ไม่งั้น reconstruct จาก FAISS index ทั้งก้อน
+    """
+
+    def __init__(self, matrix: np.ndarray):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if matrix.flags.writeable:
+            matrix.flags.writeable = False
+        self.matrix = matrix
+        self.sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        self.sq_norms.flags.writeable = False
+
+    @classmethod
+    def load(cls, path: str, index=None, row_ids: RowIds = None):
+        if path and os.path.exists(path):
+            matrix = np.load(path, mmap_mode="r")
+            if index is None or matrix.shape == (index.ntotal, index.d):
+                return cls(matrix)
+            print(f"embeddings: {path} {matrix.shape} ไม่ตรงกับ index ({index.ntotal}, {index.d}) ใช้ reconstruct แทน")
+        if row_ids is not None:
+            return cls(index.reconstruct_batch(row_ids.faiss_ids))
+        return cls(index.reconstruct_n(0, index.ntotal))
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def score_rows(self, query_vec: np.ndarray, row_ids) -> np.ndarray:
+        """ระยะ L2 กำลังสองระหว่าง query กับทุกแถวใน row_ids ในครั้งเดียว (แบบเดียวกับ IndexFlatL2)
+        แถวที่ไม่มี embedding ได้ 1e9"""
+        ids = np.asarray(row_ids, dtype=np.int64).reshape(-1)
+        out = np.full(len(ids), 1e9, dtype=np.float32)
+        ok = (ids >= 0) & (ids < len(self.matrix))
+        q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+        out[ok] = self.sq_norms[ids[ok]] + float(q @ q) - 2.0 * (self.matrix[ids[ok]] @ q)
+        return out
+
+
+class StructuredRetriever:
+    """ดึงแถวตามเงื่อนไขโครงสร้าง (ราคา/ยี่ห้อ/ซีรีส์/ตัวถัง) โดยไม่แตะ DataFrame
+
+    ใช้ตอนที่ FAISS หาแถวที่ผ่านเงื่อนไขได้ไม่ครบ top_n:
+    - ราคาเก็บเป็นอาร์เรย์เรียงแล้ว หา range ด้วย bisect
+    - make / series / body เป็น inverted index (ค่า -> ตำแหน่งแถวเรียงจากน้อยไปมาก)
+    - ให้คะแนนผู้รอดด้วย EmbeddingStore.score_rows (matrix product ครั้งเดียว)
+    """
+
+    def __init__(self, filters: CatalogueFilters, embeddings: EmbeddingStore):
+        self.n = filters.n
+        price = np.where(filters.price_ok, filters.price_thb, np.iinfo(np.int64).max)
+        self.by_price = readonly(np.argsort(price, kind="stable"))
+        self.sorted_price = readonly(price[self.by_price])
+        self.n_priced = int(filters.price_ok.sum())
+        self.price_thb = filters.price_thb
+
+        self.make_postings = self._postings(filters.make)
+        self.series_postings = self._postings(filters.series)
+        # needle -> ตำแหน่งแถวที่ resolve แล้ว (ชุดคำค้นมีจำกัด: ชื่อยี่ห้อ / รากของชื่อรุ่น)
+        self._make_ids = {}
+        self._series_ids = {}
+        self.body_postings = {
+            b: readonly(np.flatnonzero(filters.body_codes == code))
+            for b, code in filters.body_vocab.items()
+        }
+
+        self.embeddings = embeddings
+
+    @staticmethod
+    def _postings(values: pd.Series) -> dict:
+        groups = pd.Series(np.arange(len(values))).groupby(values.to_numpy()).indices
+        return {k: readonly(np.asarray(v, dtype=np.int64)) for k, v in groups.items()}
+
+    @staticmethod
+    def _resolve(postings: dict, needle: str) -> np.ndarray:
+        """posting ของทุกคีย์ที่มี needle เป็น substring (ความหมายเดียวกับ CatalogueFilters.mask)
+        คีย์ที่ตรงตัวได้จาก dict; สแกนคีย์ทั้งหมดเพื่อหาคีย์ที่ยาวกว่าแล้วครอบ needle อยู่
+        ("cr-v e" อยู่ใน "cr-v el 4wd 7 seat") ครั้งเดียวต่อ needle แล้วแคชผลไว้"""
+        hits = [ids for key, ids in postings.items() if needle in key and key != needle]
+        exact = postings.get(needle)
+        if not hits:
+            return exact if exact is not None else np.empty(0, dtype=np.int64)
+        if exact is not None:
+            hits.append(exact)
+        return np.unique(np.concatenate(hits))
+
+    def _lookup(self, postings: dict, cache: dict, needles) -> np.ndarray:
+        """รวม posting ของทุกคีย์ที่มี needle ใดๆ เป็น substring"""
+        parts = [CatalogueFilters._cached(cache, nd, lambda nd=nd: self._resolve(postings, nd))
+                 for nd in dict.fromkeys(needles)]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+
+    def _constraint_sets(self, target_make, target_series, body):
+        sets = []
+        if target_make:
+            sets.append(self._lookup(self.make_postings, self._make_ids, split_makes(target_make)))
+        if target_series:
+            sets.append(self._lookup(self.series_postings, self._series_ids,
+                                     [str(target_series).strip().lower()]))
+        if body:
+            sets.append(self.body_postings.get(body, np.empty(0, dtype=np.int64)))
+        return sets
+
+    def price_range(self, price_min=None, price_max=None) -> np.ndarray:
+        """ตำแหน่งแถวที่ราคาอยู่ในช่วง เรียงตามราคาจากน้อยไปมาก"""
+        lo = 0 if price_min is None else int(np.searchsorted(self.sorted_price, float(price_min), "left"))
+        hi = self.n_priced if price_max is None else int(np.searchsorted(self.sorted_price, float(price_max), "right"))
+        return self.by_price[lo:min(hi, self.n_priced)]
+
+    def nearest_price(self, ids: np.ndarray, target: float, top_n: int) -> np.ndarray:
+        ids = ids[self.price_thb[ids] >= 0]
+        order = np.argsort(np.abs(self.price_thb[ids] - float(target)), kind="stable")
+        return ids[order[:top_n]]
+
+    def retrieve(self, price_min=None, price_max=None, target_make=None, target_series=None,
+                 body=None, top_n=5) -> np.ndarray:
+        """แถวราคาถูกสุด top_n คันที่ผ่านทุกเงื่อนไข
+        ถ้าไม่มีเลย (และระบุราคา) จะคลายเงื่อนไขราคา/ตัวถัง แล้วเลือกคันที่ราคาใกล้งบที่สุด"""
+        sets = self._constraint_sets(target_make, target_series, body)
+        cand = self.price_range(price_min, price_max)
+        for s in sets:
+            cand = cand[np.isin(cand, s, assume_unique=True)]
+        if len(cand) or (price_min is None and price_max is None):
+            return cand[:top_n]
+
+        relaxed = self._constraint_sets(target_make, target_series, None)
+        pool = np.arange(self.n, dtype=np.int64)
+        for s in relaxed:
+            pool = pool[np.isin(pool, s, assume_unique=True)]
+        target = price_max if price_max is not None else price_min
+        return self.nearest_price(pool, target, top_n)
@@ -0,0 +1,373 @@
+"""session ฝั่งเซิร์ฟเวอร์: cookie เก็บแค่ session id สถานะแชตอยู่ใน backend
+
+- backend เลือกได้: MemorySessionBackend (LRU ในโปรเซส ใช้ได้กับ worker เดียว), SQLiteSessionBackend
+  (ไฟล์เดียว หลาย worker บนเครื่องเดียวใช้ร่วมกันได้) หรือ RedisSessionBackend (Redis หรือตัวที่พูดโปรโตคอล
+  เดียวกัน เช่น Valkey / KeyDB ที่รันในเครื่อง)
+- prefs เป็น Prefs (dataclass แบบ slots) เข้ารหัสเป็น JSON list [เวอร์ชัน, ฟิลด์ตามลำดับ...] ไม่ต้องเก็บชื่อคีย์
+  record เวอร์ชันเก่าแปลงผ่าน PREFS_MIGRATIONS เวอร์ชันที่ไม่รู้จักถือว่าเป็น session ใหม่
+- session สร้างแบบ lazy: ไม่มี hook ต่อ request และอ่าน backend ครั้งแรกที่ view แตะ session จริง
+  request ที่ไม่ใช้ session (healthz, static, หน้าแรก) จึงไม่แตะ backend เลย
+- ตอนจบ request เข้ารหัส session แล้วเทียบกับ bytes ที่โหลดมา เขียนลง backend เฉพาะเมื่อต่างกัน
+  request ที่ไม่ได้แตะ session เลยข้ามการเข้ารหัสไปทั้งหมด
+- session ที่ถูกใช้แต่ไม่เปลี่ยนยังต่ออายุได้: touch เฉพาะเวลาหมดอายุ (ไม่เขียน blob) เมื่ออายุที่เหลือ
+  ลดลงเกิน TTL/10 นับจากการเขียน/ต่ออายุครั้งล่าสุด session จึงหมดอายุ TTL หลังใช้ครั้งสุดท้าย
+"""
+import functools
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+PREFS_KEY = "prefs"
+SID_RE = re.compile(r"[A-Za-z0-9_-]{32}")
+# เปลี่ยนฟิลด์ของ Prefs เมื่อไรให้เพิ่มเลขนี้ และเพิ่มฟังก์ชันแปลง record จากเวอร์ชันก่อนหน้าใน PREFS_MIGRATIONS
+PREFS_VERSION = 2
+
+
+@dataclass(slots=True)
+class Prefs:
+    """สถานะการถามตอบของผู้ใช้หนึ่งคน (เดิมเป็น dict ใน cookie)"""
+    answers: dict = field(default_factory=dict)
+    asked: list = field(default_factory=list)
+    pending_key: Optional[str] = None
+    last_question: Optional[str] = None
+    skip: list = field(default_factory=list)
+    extra_done: bool = False
+    stage: Optional[str] = None
+    ask_order: Optional[list] = None
+
+    def to_record(self) -> list:
+        return [PREFS_VERSION, *(getattr(self, name) for name in PREFS_FIELDS)]
+
+    @classmethod
+    def from_record(cls, record):
+        # v1 ไม่มีเลขเวอร์ชันนำหน้า (ตัวแรกเป็น answers)
+        if record and type(record[0]) is int:
+            version, values = record[0], list(record[1:])
+        else:
+            version, values = 1, list(record)
+        while version != PREFS_VERSION:
+            migrate = PREFS_MIGRATIONS.get(version)
+            if migrate is None:
+                raise ValueError(f"prefs schema v{version} แปลงเป็น v{PREFS_VERSION} ไม่ได้")
+            values = migrate(values)
+            version += 1
+        return cls(*values)
+
+
+PREFS_FIELDS = tuple(f.name for f in fields(Prefs))
+
+
+def _prefs_from_v1(values):
+    # v2 เพิ่มแค่เลขเวอร์ชันนำหน้า ฟิลด์ชุดเดิม
+    return values
+
+
+PREFS_MIGRATIONS = {1: _prefs_from_v1}
+
+
+def new_sid() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def encode_session(data, default=None) -> bytes:
+    doc = {k: (v.to_record() if k == PREFS_KEY else v) for k, v in data.items()}
+    return json.dumps(doc, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
+
+def decode_session(blob: bytes) -> dict:
+    doc = json.loads(blob)
+    if PREFS_KEY in doc:
+        doc[PREFS_KEY] = Prefs.from_record(doc[PREFS_KEY])
+    return doc
+
+
+def _loads_first(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.accessed = True
+        self._ensure_loaded()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """session หนึ่งตัว โหลดจาก backend ครั้งแรกที่ถูกอ่าน / เขียน (backend=None คือ session ใหม่)"""
+
+    def __init__(self, sid, backend=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(None, on_update)
+        self.sid = sid
+        self._backend = backend
+        # bytes ที่อยู่ใน backend ตอนโหลด (None = ยังไม่เคยเขียน) และเวลาหมดอายุของ record นั้น
+        self.saved = None
+        self.expires_at = None
+        self.new = backend is None
+        self.modified = False
+        self.accessed = False
+
+    def _ensure_loaded(self):
+        if self._backend is None:
+            return
+        backend, self._backend = self._backend, None
+        blob, expires_at = backend.get(self.sid) or (None, None)
+        data = None
+        if blob is not None:
+            try:
+                data = decode_session(blob)
+            except (ValueError, TypeError):
+                data = None
+        if data is None:
+            # หมดอายุ / อ่านไม่ได้: ออก id ใหม่เสมอ ไม่รับ id ที่ client ตั้งเอง
+            self.sid = new_sid()
+            self.new = True
+            return
+        dict.update(self, data)
+        self.saved = blob
+        self.expires_at = expires_at
+
+    __getitem__ = _loads_first(CallbackDict.__getitem__)
+    __setitem__ = _loads_first(CallbackDict.__setitem__)
+    __delitem__ = _loads_first(CallbackDict.__delitem__)
+    __contains__ = _loads_first(CallbackDict.__contains__)
+    __iter__ = _loads_first(CallbackDict.__iter__)
+    __len__ = _loads_first(CallbackDict.__len__)
+    __repr__ = _loads_first(CallbackDict.__repr__)
+    get = _loads_first(CallbackDict.get)
+    keys = _loads_first(CallbackDict.keys)
+    values = _loads_first(CallbackDict.values)
+    items = _loads_first(CallbackDict.items)
+    copy = _loads_first(CallbackDict.copy)
+    setdefault = _loads_first(CallbackDict.setdefault)
+    pop = _loads_first(CallbackDict.pop)
+    popitem = _loads_first(CallbackDict.popitem)
+    update = _loads_first(CallbackDict.update)
+    clear = _loads_first(CallbackDict.clear)
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, backend, ttl=7 * 24 * 3600, json_default=None):
+        self.backend = backend
+        self.ttl = ttl
+        # ต่ออายุ session ที่ไม่เปลี่ยนไม่เกินหนึ่งครั้งต่อช่วงนี้ (เทียบกับเวลาหมดอายุที่ backend เก็บ จึงใช้ร่วมทุก worker)
+        self.refresh_after = ttl / 10
+        self.json_default = json_default
+        self.writes = 0
+        self.unchanged = 0
+        self.touches = 0
+
+    def open_session(self, app, request):
+        # ยังไม่อ่าน backend ตรงนี้: ServerSession โหลดเองเมื่อ view ใช้ session ครั้งแรก
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SID_RE.fullmatch(sid):
+            return ServerSession(sid, self.backend)
+        return ServerSession(new_sid())
+
+    def save_session(self, app, session, response):
+        if not (session.accessed or session.modified):
+            return
+        response.vary.add("Cookie")
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.saved is not None:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        blob = encode_session(session, self.json_default)
+        if blob == session.saved:
+            self.unchanged += 1
+            expires_at = session.expires_at
+            if expires_at is not None and expires_at - time.time() < self.ttl - self.refresh_after:
+                self.backend.touch(session.sid, self.ttl)
+                self.touches += 1
+        else:
+            self.backend.set(session.sid, blob, self.ttl)
+            session.saved = blob
+            self.writes += 1
+
+        if session.new or (session.permanent and app.config["SESSION_REFRESH_EACH_REQUEST"]):
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+    def stats(self):
+        return {"writes": self.writes, "unchanged": self.unchanged, "touches": self.touches,
+                **self.backend.stats()}
+
+
+class MemorySessionBackend:
+    """LRU ในโปรเซส: เร็วสุดแต่ไม่แชร์ข้าม worker และหายเมื่อรีสตาร์ต"""
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, sid):
+        with self._lock:
+            item = self._data.get(sid)
+            if item is None:
+                return None
+            blob, expires_at = item
+            if expires_at < time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return item
+
+    def set(self, sid, blob, ttl):
+        with self._lock:
+            self._data[sid] = (blob, time.time() + ttl)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            item = self._data.get(sid)
+            if item is not None:
+                self._data[sid] = (item[0], time.time() + ttl)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._data), "evictions": self.evictions}
+
+
+class SQLiteSessionBackend:
+    # ล้าง session หมดอายุทุก ๆ PURGE_EVERY ครั้งที่เขียน
+    PURGE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._writes = 0
+        self._open_db(path)
+
+    def _open_db(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " sid TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS ix_expires ON sessions(expires_at)")
+        db.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+        db.commit()
+        self._db = db
+
+    def _ensure_db(self):
+        # เหมือน ExplanationCache: connection ใช้ข้าม fork ไม่ได้ worker ลูกเปิดใหม่เอง (เรียกขณะถือ _lock)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._open_db(self.path)
+
+    def get(self, sid):
+        with self._lock:
+            self._ensure_db()
+            row = self._db.execute(
+                "SELECT data, expires_at FROM sessions WHERE sid=? AND expires_at>=?", (sid, time.time())
+            ).fetchone()
+            return (bytes(row[0]), row[1]) if row is not None else None
+
+    def set(self, sid, blob, ttl):
+        now = time.time()
+        with self._lock:
+            self._ensure_db()
+            self._db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (sid, blob, now + ttl))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            self._db.commit()
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            self._ensure_db()
+            self._db.execute("UPDATE sessions SET expires_at=? WHERE sid=?", (time.time() + ttl, sid))
+            self._db.commit()
+
+    def delete(self, sid):
+        with self._lock:
+            self._ensure_db()
+            self._db.execute("DELETE FROM sessions WHERE sid=?", (sid,))
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            self._ensure_db()
+            entries = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return {"backend": "sqlite", "entries": entries}
+
+
+class RedisSessionBackend:
+    """Redis / ตัวที่เข้ากันได้ (Valkey, KeyDB) หมดอายุด้วย TTL ของ Redis เอง ต้องติดตั้งแพ็กเกจ redis"""
+
+    def __init__(self, url, prefix="car_session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_BACKEND=redis ต้องติดตั้งแพ็กเกจ redis ก่อน (pip install redis)") from e
+        self.prefix = prefix
+        # connection pool ของ redis-py ตรวจ pid เอง ใช้หลัง fork ได้
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, sid):
+        # GET + PTTL ใน round trip เดียว
+        pipe = self._client.pipeline(transaction=False)
+        pipe.get(self.prefix + sid)
+        pipe.pttl(self.prefix + sid)
+        blob, pttl = pipe.execute()
+        if blob is None:
+            return None
+        return blob, (time.time() + pttl / 1000 if pttl >= 0 else None)
+
+    def set(self, sid, blob, ttl):
+        self._client.set(self.prefix + sid, blob, ex=max(1, int(ttl)))
+
+    def touch(self, sid, ttl):
+        self._client.expire(self.prefix + sid, max(1, int(ttl)))
+
+    def delete(self, sid):
+        self._client.delete(self.prefix + sid)
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+def make_session_backend(kind, path="cache/sessions.sqlite", url="redis://localhost:6379/0",
+                         max_entries=10_000):
+    kind = (kind or "sqlite").lower()
+    if kind == "memory":
+        return MemorySessionBackend(max_entries)
+    if kind == "sqlite":
+        return SQLiteSessionBackend(path)
+    if kind == "redis":
+        return RedisSessionBackend(url)
+    raise ValueError(f"SESSION_BACKEND ไม่รู้จัก: {kind!r} (memory / sqlite / redis)")
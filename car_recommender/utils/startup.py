@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Startup:
+    """โหลดทรัพยากรหนักตอนบูตใน thread เบื้องหลัง พร้อมจับเวลาแต่ละขั้น
+
+    ขั้นที่เพิ่มด้วย add() ไม่ขึ้นต่อกันจึงรันขนานกัน ส่วนขั้นจาก then() รันตามลำดับหลังจากนั้น
+    ถ้าขั้นใดล้มเหลว ขั้นที่เหลือจะถูกข้ามและระบบจะไม่ ready
+    """
+
+    def __init__(self):
+        self._parallel = []
+        self._serial = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self.phases = {}
+        self.error = None
+        self.started_at = None
+        self.total_seconds = None
+
+    def add(self, name, fn):
+        self._parallel.append((name, fn))
+        self.phases[name] = {"status": "pending", "seconds": None}
+        return self
+
+    def then(self, name, fn):
+        self._serial.append((name, fn))
+        self.phases[name] = {"status": "pending", "seconds": None}
+        return self
+
+    def _run_phase(self, name, fn):
+        with self._lock:
+            self.phases[name]["status"] = "running"
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            took = time.perf_counter() - t0
+            with self._lock:
+                self.phases[name] = {"status": "failed", "seconds": round(took, 3), "error": repr(e)}
+            print(f"[startup] {name} ล้มเหลวหลัง {took:.2f}s: {e!r}")
+            raise
+        took = time.perf_counter() - t0
+        with self._lock:
+            self.phases[name] = {"status": "done", "seconds": round(took, 3)}
+        print(f"[startup] {name} เสร็จใน {took:.2f}s")
+
+    def run(self):
+        """รันทุกขั้นใน thread ปัจจุบัน (บล็อกจนเสร็จ); คืน True เมื่อพร้อมใช้งาน"""
+        self.started_at = time.time()
+        t0 = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=max(len(self._parallel), 1),
+                                    thread_name_prefix="startup") as pool:
+                futures = [pool.submit(self._run_phase, n, fn) for n, fn in self._parallel]
+                for f in futures:
+                    f.result()
+            for name, fn in self._serial:
+                self._run_phase(name, fn)
+        except Exception as e:
+            self.error = repr(e)
+            return False
+        finally:
+            self.total_seconds = round(time.perf_counter() - t0, 3)
+        self._ready.set()
+        print(f"[startup] พร้อมใช้งานใน {self.total_seconds:.2f}s")
+        return True
+
+    def start(self):
+        """เริ่ม run() ใน thread เบื้องหลังแล้วคืนทันที"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="startup", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "error": self.error,
+                "total_seconds": self.total_seconds,
+                "phases": {k: dict(v) for k, v in self.phases.items()},
+            }
@@ -0,0 +1,123 @@
+"""จับคำหลายชุดในข้อความด้วย Aho-Corasick รอบเดียว (ใช้กับข้อความแชตทุก turn)
+
+แต่ละ vocabulary คือ {key: [คำ, ...]} หรือ list ของคำ (key = ตัวคำเอง) คำทุกชุดอยู่ใน automaton เดียว
+scan(text) เดินข้อความครั้งเดียวได้ทุกคำที่พบ (รวมคำที่ซ้อนกัน) พร้อมตำแหน่ง เวลาต่อ turn จึงขึ้นกับความยาวข้อความ
+ไม่ขึ้นกับจำนวนคำใน vocabulary ผลของ scan แคชตามข้อความ helper หลายตัวที่ถามข้อความเดียวกันจึงสแกนครั้งเดียว
+
+ผลเท่ากับการเช็ก `word in text` ทีละคำ (substring ตรงตัว เคสตามที่ส่งเข้ามา)
+"""
+from collections import deque
+from functools import lru_cache
+from typing import NamedTuple
+
+
+class Match(NamedTuple):
+    start: int
+    end: int
+    vocab: str
+    key: str
+    word: str
+
+
+class Hits:
+    """คำที่พบในข้อความหนึ่ง จัดกลุ่มตาม vocabulary (อ่านอย่างเดียว แชร์ข้าม request ผ่านแคชได้)"""
+
+    __slots__ = ("matches", "_words", "_order")
+
+    def __init__(self, matches, order):
+        self.matches = tuple(sorted(matches))
+        self._order = order
+        words = {}
+        for m in self.matches:
+            words.setdefault(m.vocab, {}).setdefault(m.key, set()).add(m.word)
+        self._words = words
+
+    def has(self, vocab, key=None) -> bool:
+        found = self._words.get(vocab, {})
+        return bool(found) if key is None else key in found
+
+    def keys(self, vocab, order=None) -> list:
+        """key ที่พบ เรียงตามลำดับใน vocabulary (หรือตาม order ที่ส่งมา)"""
+        found = self._words.get(vocab, {})
+        if order is not None:
+            return [k for k in order if k in found]
+        # เรียงเฉพาะ key ที่พบ ไม่วนทั้ง vocabulary (vocabulary ใหญ่ได้โดยไม่ช้าลง)
+        rank = self._order[vocab]
+        return sorted(found, key=lambda k: rank[k][0])
+
+    def first(self, vocab, order=None):
+        """key แรกตามลำดับใน vocabulary ที่พบ (แบบลูป `for key, kws in HINTS.items(): if any(...)`)"""
+        keys = self.keys(vocab, order)
+        return keys[0] if keys else None
+
+    def words(self, vocab, key) -> list:
+        """คำของ key ที่พบ (ไม่ซ้ำ) เรียงตามลำดับที่ประกาศไว้ใน vocabulary"""
+        found = self._words.get(vocab, {}).get(key, ())
+        return sorted(found, key=self._order[vocab][key][1].__getitem__)
+
+    def __repr__(self):
+        return f"Hits({[(m.vocab, m.key, m.word, m.start) for m in self.matches]})"
+
+
+class KeywordMatcher:
+    def __init__(self, vocabularies: dict, cache_size: int = 4096):
+        # _goto[state] = {ตัวอักษร: state ถัดไป}, _out[state] = คำที่จบที่ state นี้ (รวมทาง fail)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._order = {}
+        for vocab, entries in vocabularies.items():
+            if not isinstance(entries, dict):
+                entries = {w: [w] for w in entries}
+            # {key: (ลำดับของ key, {คำ: ลำดับแรกที่ประกาศ})}
+            self._order[vocab] = {
+                key: (i, {w: j for j, w in reversed(list(enumerate(words)))})
+                for i, (key, words) in enumerate(entries.items())
+            }
+            for key, words in entries.items():
+                for w in words:
+                    if w:
+                        self._add(w, (vocab, key, w))
+        self._build()
+        self.scan = lru_cache(maxsize=cache_size)(self._scan)
+
+    def _add(self, word, label):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        if label not in self._out[state]:
+            self._out[state].append(label)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0) if self._goto[f].get(ch, 0) != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _scan(self, text: str) -> Hits:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        matches = []
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for vocab, key, word in out[state]:
+                matches.append(Match(i + 1 - len(word), i + 1, vocab, key, word))
+        return Hits(matches, self._order)
+
+    def cache_info(self):
+        return self.scan.cache_info()